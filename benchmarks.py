@@ -0,0 +1,749 @@
+"""
+Benchmarks for elogviewer on a synthetic elog corpus.
+
+Usage:
+    python benchmarks.py classify [--count N] [--jobs N [N ...]]
+    python benchmarks.py codecs [--count N] [--lines N]
+                                [--formats FORMAT [FORMAT ...]]
+    python benchmarks.py render [--count N] [--lines N]
+    python benchmarks.py model [--count N]
+    python benchmarks.py paint [--count N]
+    python benchmarks.py sort [--count N]
+    python benchmarks.py search [--count N] [--lines N]
+    python benchmarks.py query [--count N]
+    python benchmarks.py startup [--count N]
+    python benchmarks.py suite [--count N] [--lines N] [--max-lines N]
+                               [--formats FORMAT [FORMAT ...]]
+                               [--output FILE]
+
+The suite writes its results as JSON to FILE to compare releases.
+
+"""
+
+import os
+import sys
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import calendar
+import re
+import gzip
+import bz2
+import lzma
+import gc
+import multiprocessing
+import subprocess
+import json
+import platform
+from collections import OrderedDict
+from contextlib import closing
+
+import elogviewer
+elogviewer.logger.setLevel(100)  # silence logging
+
+
+CATEGORIES = """app-admin app-arch app-editors app-misc app-portage
+dev-lang dev-libs dev-python dev-util media-fonts media-libs net-misc
+sys-apps sys-devel sys-kernel sys-libs www-client x11-libs""".split()
+
+PACKAGES = """bash chromium curl firefox gcc glibc gentoo-sources libpng
+markupsafe openssl perl portage python speech-dispatcher systemd urw-fonts
+vim xz-utils zlib""".split()
+
+STAGES = "setup prepare configure compile install postinst".split()
+
+EClasses = ("INFO", "LOG", "WARN", "ERROR")
+
+TEXT = """\
+Please note that after changing the USE_PYTHON variable, you may need
+to run 'python-updater' to rebuild affected packages, see bug #187595.
+For more information, see https://wiki.gentoo.org/wiki/Project:Python
+Some web pages may require additional fonts such as media-fonts/droid.
+\x1b[32;01m*\x1b[0m Messages for package dev-python/markupsafe-0.23:
+Could not find a Makefile in the kernel source directory.
+Unable to calculate Linux Kernel version for build, attempting to use
+the running version.  Note: Above message is only printed the first time
+the package is installed.  Depending on your desktop environment, you
+may need to install additional packages to get icons on the Downloads
+""".splitlines()
+
+COMPRESSORS = {
+    "log": lambda data: data,
+    "gz": gzip.compress,
+    "bz2": bz2.compress,
+    "xz": lzma.compress,
+}
+if elogviewer.zstandard:
+    COMPRESSORS["zst"] = elogviewer.zstandard.compress
+
+
+def makeElog(rng, lines):
+    """Return the content of an elog of about `lines` lines."""
+    content = []
+    while len(content) < lines:
+        content.append("%s: %s" % (
+            rng.choice(EClasses[:-1] if rng.random() < 0.9 else EClasses),
+            rng.choice(STAGES)))
+        content.extend(rng.choice(TEXT)
+                       for __ in range(rng.randint(1, 2 * len(TEXT))))
+    content.append("")
+    return "\n".join(content).encode("ascii")
+
+
+def makeCorpus(path, count, formats=("log", "gz", "bz2"), lines=20, seed=0,
+               maxLines=None):
+    """Write `count` elogs to `path` and return their filenames.
+
+    One elog in ten uses the `category/package:date.log` naming scheme,
+    the others the `category:package:date.log` scheme.  The elogs have
+    about `lines` lines or, if `maxLines` is given, between `lines` and
+    `maxLines` lines.
+
+    """
+    rng = random.Random(seed)
+    filenames = []
+    for n in range(count):
+        category = rng.choice(CATEGORIES)
+        package = "%s-%i.%i" % (rng.choice(PACKAGES), n // 100, n % 100)
+        date = time.strftime("%Y%m%d-%H%M%S", time.gmtime(
+            1400000000 + 60 * n))
+        fmt = rng.choice(formats)
+        ext = ".log" if fmt == "log" else ".log.%s" % fmt
+        if n % 10:
+            filename = os.path.join(
+                path, "%s:%s:%s%s" % (category, package, date, ext))
+        else:
+            dirname = os.path.join(path, category)
+            if not os.path.isdir(dirname):
+                os.mkdir(dirname)
+            filename = os.path.join(
+                dirname, "%s:%s%s" % (package, date, ext))
+        with open(filename, "wb") as elogfile:
+            elogfile.write(COMPRESSORS[fmt](makeElog(
+                rng, lines if maxLines is None else
+                rng.randint(lines, maxLines))))
+        filenames.append(filename)
+    return filenames
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def benchClassify(config):
+    """Cold scan of the corpus for every number of worker processes.
+
+    The workers start as the command line does, without Qt, so that
+    their startup does not weigh on the small corpora.
+
+    """
+    filenames = makeCorpus(config.path, config.count,
+                           formats=("gz", "bz2"), lines=config.lines)
+    print("classify: %i compressed elogs" % len(filenames))
+    reference = None
+    for jobs in config.jobs:
+        index = elogviewer.ElogIndex(":memory:", jobs)
+        with closing(index):
+            seconds, elogs = timeit(lambda: list(index.elogs(filenames)))
+        reference = reference or seconds
+        print("jobs=%-3i %8.3f s %10.0f elogs/s  speedup %.2f" % (
+            jobs, seconds, len(elogs) / seconds, reference / seconds))
+
+
+def benchCodecs(config):
+    """Cold scan throughput of a corpus in every format."""
+    print("codecs: %i elogs of about %i lines" % (
+        config.count, config.lines))
+    for fmt in config.formats:
+        path = os.path.join(config.path, fmt)
+        os.mkdir(path)
+        filenames = makeCorpus(path, config.count, formats=(fmt,),
+                               lines=config.lines)
+        size = sum(os.path.getsize(filename) for filename in filenames)
+        index = elogviewer.ElogIndex(":memory:", jobs=1)
+        with closing(index):
+            scanSeconds, elogs = timeit(
+                lambda: list(index.elogs(filenames)))
+        assert len(elogs) == len(filenames)
+        readSeconds, length = timeit(lambda: sum(
+            len(_read(filename)) for filename in filenames))
+        print("%-4s %8.2f MB on disk %10.0f elogs/s scan %8.1f MB/s read" % (
+            fmt, size / 1e6, len(elogs) / scanSeconds,
+            length / 1e6 / readSeconds))
+
+
+def _read(filename):
+    with elogviewer._file(filename) as elogfile:
+        return elogfile.read()
+
+
+def _htmlReference(filename):
+    """The multi-pass `elogviewer._html` of elogviewer 2.6."""
+    EClass, _ = elogviewer.EClass, elogviewer._
+    lines = []
+    with elogviewer._file(filename) as elogfile:
+        for line in elogfile:
+            line = _(line.strip())
+            try:
+                eclass, stage = line.split(":")
+                eclass = EClass["e%s" % eclass.lower()]
+            except (ValueError, KeyError):
+                lines.append("{} <br />".format(line))
+            else:
+                sectionHeader = "".join((
+                    "<h2>{eclass}: {stage}</h2>".format(
+                        eclass=eclass.name[1:].capitalize(),
+                        stage=stage,
+                    ),
+                    '<p style="color: {}">'.format(eclass.htmlColor())))
+                if lines:
+                    lines.append("</p>")
+                lines.append(sectionHeader)
+    lines.append("</p>")
+    lines.append("")
+    text = os.linesep.join(lines)
+    text = re.sub("\x1b\\[[0-9;]+m", "", text)
+    text = re.sub(r"((https?|ftp)://\S+)", r'<a href="\1">\1</a>', text)
+    text = re.sub(
+        r"bug\s+#([0-9]+)",
+        r'<a href="https://bugs.gentoo.org/\1">bug #\1</a>',
+        text)
+    text = re.sub(
+        r"(\s)([a-z1]+[-][a-z0-9]+/[a-z0-9-]+)([\s,.:;!?])",
+        r'\1<a href="http://packages.gentoo.org/package/\2">\2</a>\3',
+        text)
+    return text
+
+
+def benchRender(config):
+    """Render large elogs with the current and the former renderer."""
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    filenames = makeCorpus(config.path, config.count, lines=config.lines)
+    print("render: %i elogs of about %i lines" % (
+        len(filenames), config.lines))
+    for filename in filenames:
+        if elogviewer._html(filename) != _htmlReference(filename):
+            sys.exit("%s: output differs" % filename)
+    results = {}
+    for name, render in (("multi-pass", _htmlReference),
+                         ("single-pass", elogviewer._html)):
+        results[name], __ = timeit(lambda: [render(filename)
+                                            for filename in filenames])
+        print("%-12s %8.3f s %8.2f ms/elog" % (
+            name, results[name], 1000 * results[name] / len(filenames)))
+    print("speedup %.2f" % (results["multi-pass"] / results["single-pass"]))
+    del app
+
+
+class _StandardRowItem(elogviewer.QtGui.QStandardItem):
+    """The `ElogRowItem` of elogviewer 2.6."""
+
+    def __init__(self, elog):
+        super(_StandardRowItem, self).__init__()
+        self._elog = elog
+        self._readState = elogviewer.Qt.Unchecked
+        self._importantState = elogviewer.Qt.Unchecked
+
+    def readState(self):
+        return self._readState
+
+    def importantState(self):
+        return self._importantState
+
+
+class _StandardItem(elogviewer.QtGui.QStandardItem):
+    """The `ElogItem` of elogviewer 2.6."""
+
+    def __getattr__(self, name):
+        return getattr(self.model().verticalHeaderItem(self.row()), name)
+
+    def data(self, role=elogviewer.Qt.UserRole + 1):
+        Qt, Column, elog = elogviewer.Qt, elogviewer.Column, self._elog
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return {
+                Column.Category: elog.category,
+                Column.Package: elog.package,
+                Column.Eclass: elog.eclass.name,
+                Column.Date: elog.localeTime,
+            }.get(self.column(), "")
+        elif role == Qt.CheckStateRole:
+            return {
+                Column.ImportantState: self.importantState,
+                Column.ReadState: self.readState,
+            }.get(self.column(), lambda: None)()
+        elif role == elogviewer.Role.SortRole:
+            if self.column() in (Column.ImportantState, Column.ReadState):
+                return self.data(Qt.CheckStateRole)
+            elif self.column() == Column.Date:
+                return elog.isoTime
+            elif self.column() == Column.Eclass:
+                return elog.eclass.value
+            else:
+                return self.data(Qt.DisplayRole)
+        return super(_StandardItem, self).data(role)
+
+
+def _standardModel(elogs):
+    """Fill the `QStandardItemModel` of elogviewer 2.6 with `elogs`."""
+    model = elogviewer.QtGui.QStandardItemModel()
+    for row, elog in enumerate(elogs):
+        model.setVerticalHeaderItem(row, _StandardRowItem(elog))
+        for column in range(len(elogviewer.Column)):
+            model.setItem(row, column, _StandardItem())
+    return model
+
+
+def _elogModel(elogs):
+    model = elogviewer.ElogModel()
+    model.appendElogs(elogs)
+    return model
+
+
+def _residentBytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _syntheticElogs(count, seed=0):
+    """Return `count` elogs, one a minute from May 2014, without files."""
+    rng = random.Random(seed)
+    EClass = elogviewer.EClass
+    return [elogviewer.Elog(
+        "/var/log/portage/elog/%i.log" % n, rng.choice(CATEGORIES),
+        "%s-%i.%i" % (rng.choice(PACKAGES), n // 100, n % 100),
+        1400000000 + 60 * n,
+        rng.choice(list(EClass))) for n in range(count)]
+
+
+def _measureModel(name, count, samples=60000, seed=0):
+    """Return the memory and the `data()` latency of a model of `count`
+    synthetic elogs.  Run in a fresh process to measure its memory alone.
+
+    """
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    rng = random.Random(seed)
+    elogs = _syntheticElogs(count, seed)
+    gc.collect()
+    before = _residentBytes()
+    seconds, model = timeit({"QStandardItemModel": _standardModel,
+                             "ElogModel": _elogModel}[name], elogs)
+    gc.collect()
+    memory = _residentBytes() - before
+    Qt = elogviewer.Qt
+    roles = (Qt.DisplayRole, Qt.CheckStateRole, elogviewer.Role.SortRole)
+    queries = [(model.index(rng.randrange(count),
+                            rng.randrange(len(elogviewer.Column))),
+                rng.choice(roles)) for __ in range(samples)]
+    data = model.data
+    latency, __ = timeit(lambda: [data(index, role)
+                                  for index, role in queries])
+    del app
+    return seconds, memory, latency / samples
+
+
+def benchModel(config):
+    """Memory and `data()` latency of the former and the current model."""
+    print("model: %i elogs" % config.count)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in ("QStandardItemModel", "ElogModel"):
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_measureModel, (name, config.count))
+        seconds, memory, latency = results[name]
+        print("%-18s fill %7.3f s %8.1f MB %8.2f us/data()" % (
+            name, seconds, memory / 1e6, 1e6 * latency))
+    standard, compact = results["QStandardItemModel"], results["ElogModel"]
+    print("memory %.1fx less, data() %.1fx faster" % (
+        standard[1] / max(compact[1], 1), standard[2] / compact[2]))
+
+
+def _scrollTime(view, steps):
+    """Scroll `view` from the top to the bottom in `steps` pages,
+    painting every page.
+
+    """
+    scrollBar = view.verticalScrollBar()
+    start = time.perf_counter()
+    for step in range(steps):
+        scrollBar.setValue(scrollBar.maximum() * step // max(steps - 1, 1))
+        view.viewport().grab()
+    return time.perf_counter() - start
+
+
+def _delegateTime(view, delegate, column):
+    """Paint the cells of `column` of every row with `delegate`."""
+    QtGui = elogviewer.QtGui
+    model = view.model()
+    option = elogviewer.QtWidgets.QStyleOptionViewItem()
+    option.initFrom(view)
+    option.rect = elogviewer.QtCore.QRect(
+        0, 0, view.columnWidth(column), view.rowHeight(0))
+    pixmap = QtGui.QPixmap(option.rect.size())
+    painter = QtGui.QPainter(pixmap)
+    try:
+        start = time.perf_counter()
+        for row in range(model.rowCount()):
+            delegate.paint(painter, option, model.index(row, column))
+        return time.perf_counter() - start
+    finally:
+        painter.end()
+
+
+def benchPaint(config):
+    """Paint throughput of the table scrolled page by page, with and
+    without the pixmaps of the buttons cached.
+
+    The scrolls alternate after a first scroll that warms the fonts and
+    the glyphs up, and the fastest of `rounds` is kept.  The button
+    cells are a small part of a page: the view paints the text of the
+    other cells and asks the model for seven roles of every cell.
+
+    """
+    rounds = 3
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    model = _elogModel(_syntheticElogs(config.count))
+    view = QtWidgets.QTableView()
+    view.setModel(model)
+    view.resize(800, 600)
+    delegates = []
+    for column, button in ((elogviewer.Column.ImportantState,
+                            elogviewer.Star()),
+                           (elogviewer.Column.ReadState,
+                            elogviewer.Bullet())):
+        delegate = elogviewer.ButtonDelegate(button, view)
+        view.setItemDelegateForColumn(column, delegate)
+        delegates.append((column, delegate))
+    view.show()
+    rows = view.viewport().height() // view.rowHeight(0)
+    steps = min(config.count // max(rows, 1), 1000)
+    print("paint: %i elogs, %i pages of %i rows" % (config.count, steps, rows))
+    settings = (("uncached", 0), ("cached", 64))
+    _scrollTime(view, steps)
+    results = {}
+    for __ in range(rounds):
+        for name, maxCachedPixmaps in settings:
+            for __, delegate in delegates:
+                delegate.maxCachedPixmaps = maxCachedPixmaps
+            seconds = _scrollTime(view, steps)
+            results[name] = min(results.get(name, seconds), seconds)
+    for name, maxCachedPixmaps in settings:
+        for __, delegate in delegates:
+            delegate.maxCachedPixmaps = maxCachedPixmaps
+        print("%-9s scroll %8.3f s %8.0f pages/s %10.0f rows/s" % (
+            name, results[name], steps / results[name],
+            steps * rows / results[name]))
+        cells = sum(_delegateTime(view, delegate, column)
+                    for column, delegate in delegates)
+        print("%-9s cells  %8.3f s %8.2f us/cell" % (
+            name, cells, 1e6 * cells / (len(delegates) * config.count)))
+    print("scroll speedup %.2f" % (results["uncached"] / results["cached"]))
+    view.close()
+    del app
+
+
+def benchSort(config):
+    """Sort by every column with the integer keys of the table and by
+    comparing the data of the rows as `QSortFilterProxyModel` does,
+    append batches of rows to the sorted rows, and parse the dates of
+    the filenames.
+
+    """
+    from PyQt5 import QtCore, QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    elogs = _syntheticElogs(config.count)
+    print("sort: %i elogs" % len(elogs))
+    names = ["%s:%s:%s.log" % (elog.category, elog.package, time.strftime(
+        "%Y%m%d-%H%M%S", time.gmtime(elog.date))) for elog in elogs]
+    for name, parse in (
+            ("strptime", lambda date: calendar.timegm(
+                time.strptime(date, "%Y%m%d-%H%M%S"))),
+            ("_parseDate", elogviewer._parseDate)):
+        seconds, __ = timeit(lambda: [parse(filename[-19:-4])
+                                      for filename in names])
+        print("%-14s %8.3f s %8.2f us/date" % (
+            name, seconds, 1e6 * seconds / len(names)))
+    for name in ("data", "keys"):
+        model = _elogModel(elogs)
+        if name == "data":
+            proxy = QtCore.QSortFilterProxyModel()
+            proxy.setSortRole(elogviewer.Role.SortRole)
+        else:
+            proxy = elogviewer.ElogFilterProxyModel()
+        proxy.setSourceModel(model)
+        for column in elogviewer.Column:
+            seconds, __ = timeit(proxy.sort, column,
+                                 elogviewer.Qt.DescendingOrder)
+            print("%-5s %-14s %8.3f s" % (name, column.name, seconds))
+    for column in elogviewer.Column:
+        # The batches of the scanner are merged into the sorted rows.
+        model = elogviewer.ElogModel()
+        model.sort(column, elogviewer.Qt.DescendingOrder)
+        seconds, __ = timeit(lambda: [
+            model.appendElogs(elogs[first:first + 1024])
+            for first in range(0, len(elogs), 1024)])
+        print("%-5s %-14s %8.3f s" % ("merge", column.name, seconds))
+    del app
+
+
+def benchSearch(config):
+    """Content search in the index of the corpus."""
+    filenames = makeCorpus(config.path, config.count, lines=config.lines)
+    print("search: %i elogs of about %i lines" % (
+        len(filenames), config.lines))
+    index = elogviewer.ElogIndex(os.path.join(config.path, "index.sqlite"),
+                                 max(config.jobs))
+    with closing(index):
+        seconds, __ = timeit(lambda: list(index.elogs(filenames)))
+        print("index %8.3f s %10.0f elogs/s" % (
+            seconds, len(filenames) / seconds))
+        for text in ("python_targets", "markupsafe", "kernel version",
+                     "droid", "no_such_word"):
+            seconds, paths = timeit(index.search, text)
+            print("%-16r %8.2f ms %8i elogs" % (
+                text, 1000 * seconds, len(paths)))
+
+
+def _dateRange(elogs):
+    """Return the `FROM..TO` days of the middle quartiles of the dates
+    of `elogs`, for the date queries to match about half of them.
+
+    """
+    dates = sorted(elog.date for elog in elogs)
+    return "%s..%s" % tuple(
+        time.strftime("%Y-%m-%d", time.gmtime(dates[len(dates) * quartile
+                                                    // 4]))
+        for quartile in (1, 3))
+
+
+def _scanQuery(elogs, readFlag, dateRange):
+    """The query of `benchQuery` as a scan of the elogs."""
+    first, last = dateRange.split("..")
+    start = elogviewer.ElogQuery._period(first)[0]
+    stop = elogviewer.ElogQuery._period(last)[1]
+    return set(
+        elog.filename for elog in elogs
+        if elog.eclass >= elogviewer.EClass.ewarn and
+        elog.category == "dev-python" and
+        start <= elog.date < stop and
+        elog.filename not in readFlag)
+
+
+def benchQuery(config):
+    """Structured queries on the columns of the elog table."""
+    elogs = _syntheticElogs(config.count)
+    readFlag = set(elog.filename for elog in elogs[::3])
+    importantFlag = set(elog.filename for elog in elogs[::7])
+    table = elogviewer.ElogTable(elogs, readFlag, importantFlag)
+    print("query: %i elogs" % len(table))
+    dateRange = _dateRange(elogs)
+    text = "eclass>=warn category:dev-python date:%s unread" % dateRange
+    seconds, expected = timeit(_scanQuery, elogs, readFlag, dateRange)
+    print("%-30s %8.2f ms %8i elogs" % ("scan", 1000 * seconds, len(expected)))
+    # The first query on every column builds the indexes.
+    seconds, __ = timeit(elogviewer.ElogQuery(
+        "category:x package:x date:2014 word").filenames, table)
+    print("%-30s %8.2f ms" % ("indexing", 1000 * seconds))
+    seconds, filenames = timeit(elogviewer.ElogQuery(text).filenames, table)
+    assert filenames == expected
+    for text in (text, "eclass:error", "category:dev-* -package:python",
+                 "date>=%s important" % dateRange.split("..")[1],
+                 "unread", "markupsafe"):
+        seconds, filenames = timeit(elogviewer.ElogQuery(text).filenames,
+                                    table)
+        print("%-30s %8.2f ms %8i elogs" % (
+            text[:30], 1000 * seconds, len(filenames)))
+
+
+_STARTUP = """
+import sys
+sys.argv[1:] = ["--startup-profile", "-p", %r]
+import elogviewer
+config = elogviewer._parseArguments()
+app = elogviewer.QtWidgets.QApplication(sys.argv)
+viewer = elogviewer.Elogviewer(config)
+viewer.show()
+profile = elogviewer.startupProfile
+while "first paint" not in profile or "scan" not in profile:
+    app.processEvents(elogviewer.QtCore.QEventLoop.WaitForMoreEvents, 50)
+viewer.close()
+print(elogviewer.json.dumps(profile.times()))
+"""
+
+
+def _startupTimes(elogpath, home):
+    """Return the `StartupProfile` times of the viewer started in a new
+    process on `elogpath`, with its settings and index in `home`.
+
+    """
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen",
+               XDG_CACHE_HOME=os.path.join(home, "cache"),
+               XDG_DATA_HOME=os.path.join(home, "data"),
+               XDG_CONFIG_HOME=os.path.join(home, "config"))
+    output = subprocess.check_output(
+        [sys.executable, "-c", _STARTUP % elogpath],
+        env=env, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(elogviewer.__file__)))
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def benchStartup(config):
+    """Time to the first visible row, with and without the index."""
+    filenames = makeCorpus(config.path, config.count, lines=config.lines)
+    print("startup: %i elogs" % len(filenames))
+    home = tempfile.mkdtemp(dir=config.path)
+    for run in ("cold", "warm"):
+        times = _startupTimes(config.path, home)
+        print("%s: %s" % (run, "  ".join(
+            "%s %.0f ms" % (name, 1000 * seconds)
+            for name, seconds in times.items())))
+
+
+def benchSuite(config):
+    """Time every step from the directory to the sorted and filtered
+    rows on one corpus, and return the results.
+
+    """
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    results = OrderedDict()
+
+    def record(name, value, unit, count=None):
+        """Record `value`, in seconds, in bytes, or in elogs, for
+        `count` elogs.
+
+        """
+        results[name] = value
+        line = ("%-32s %12.3f ms" % (name, 1000 * value) if unit == "s" else
+                "%-32s %12i elogs" % (name, value) if unit == "elogs" else
+                "%-32s %12.1f MB" % (name, value / 1e6))
+        if count:
+            line += " %12.0f elogs/s" % (count / value)
+        print(line)
+
+    elogpath = os.path.join(config.path, "elog")
+    os.mkdir(elogpath)
+    seconds, filenames = timeit(makeCorpus, elogpath, config.count,
+                                config.formats, config.lines, 0,
+                                config.max_lines)
+    size = sum(os.path.getsize(filename) for filename in filenames)
+    print("suite: %i elogs (%s), %.1f MB" % (
+        len(filenames), ", ".join(config.formats), size / 1e6))
+    record("corpus.seconds", seconds, "s", len(filenames))
+    record("corpus.bytes", size, "B")
+
+    seconds, elogs = timeit(lambda: [elogviewer.Elog.fromFilename(filename)
+                                     for filename in filenames])
+    record("fromFilename.seconds", seconds, "s", len(elogs))
+
+    home = tempfile.mkdtemp(dir=config.path)
+    for run in ("cold", "warm"):
+        times = _startupTimes(elogpath, home)
+        # From the start of the process.
+        record("populate.%s.firstPaint" % run, times["first paint"], "s")
+        record("populate.%s.seconds" % run, times["scan"], "s", len(elogs))
+
+    sample = filenames[:200]
+    seconds, __ = timeit(lambda: [elogviewer._html(filename)
+                                  for filename in sample])
+    record("html.seconds", seconds / len(sample), "s")
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        __, memory, latency = pool.apply(_measureModel,
+                                         ("ElogModel", len(elogs)))
+    record("model.bytes", memory, "B")
+    record("model.data.seconds", latency, "s")
+
+    model = elogviewer.ElogModel()
+    model.appendElogs(elogs)
+    proxy = elogviewer.ElogFilterProxyModel()
+    proxy.setSourceModel(model)
+    proxy.setSortRole(elogviewer.Role.SortRole)
+    for column in elogviewer.Column:
+        seconds, __ = timeit(proxy.sort, column,
+                             elogviewer.Qt.DescendingOrder)
+        record("sort.%s.seconds" % column.name, seconds, "s")
+
+    table = model.table
+    seconds, keys = timeit(table.searchKeys)
+    record("filter.keys.seconds", seconds, "s")
+    for name, text in (("text", "markupsafe"), ("regexp", "^dev-.*python")):
+        elogFilter = elogviewer.ElogFilter(table.filenames(), keys, text)
+        seconds, __ = timeit(elogFilter.run)
+        record("filter.%s.seconds" % name, seconds, "s")
+    for name, text in (("eclass", "eclass>=warn"),
+                       ("category.date",
+                        "category:dev-* date:%s" % _dateRange(elogs)),
+                       ("state.text", "unread markupsafe")):
+        query = elogviewer.ElogQuery(text)
+        query.filenames(table)  # Build the indexes.
+        seconds, matches = timeit(query.filenames, table)
+        record("query.%s.seconds" % name, seconds, "s")
+        record("query.%s.matches" % name, len(matches), "elogs")
+    seconds, __ = timeit(proxy.setFilenames, set(filenames[::2]))
+    record("proxy.filter.seconds", seconds, "s")
+    del app
+    return OrderedDict((
+        ("version", elogviewer.__version__),
+        ("python", platform.python_version()),
+        ("platform", platform.platform()),
+        ("date", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+        ("count", len(filenames)),
+        ("formats", config.formats),
+        ("lines", [config.lines, config.max_lines or config.lines]),
+        ("results", results)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark",
+                        choices=["classify", "codecs", "render", "model",
+                                 "paint", "sort", "search", "query",
+                                 "startup", "suite"])
+    parser.add_argument("--count", type=int, default=10000,
+                        help="number of elogs in the corpus (default: "
+                        "%(default)s; `make bench` sets it per benchmark, "
+                        "for example 100000 for classify)")
+    parser.add_argument("--lines", type=int, default=20,
+                        help="approximate number of lines per elog")
+    parser.add_argument("--max-lines", type=int,
+                        help="vary the number of lines per elog up to N")
+    parser.add_argument("--formats", nargs="+", choices=sorted(COMPRESSORS),
+                        help="formats of the elogs, in equal parts "
+                        "(default: log gz bz2, every format for codecs)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--jobs", type=int, nargs="+",
+                        default=sorted(set((1, 2, 4, os.cpu_count() or 1))),
+                        help="numbers of worker processes to compare")
+    config = parser.parse_args()
+    if config.formats is None:
+        config.formats = (sorted(COMPRESSORS) if config.benchmark == "codecs"
+                          else ["log", "gz", "bz2"])
+    config.path = tempfile.mkdtemp(prefix="elogviewer-bench-")
+    try:
+        results = {"classify": benchClassify,
+                   "codecs": benchCodecs,
+                   "render": benchRender,
+                   "model": benchModel,
+                   "paint": benchPaint,
+                   "sort": benchSort,
+                   "search": benchSearch,
+                   "query": benchQuery,
+                   "startup": benchStartup,
+                   "suite": benchSuite}[config.benchmark](config)
+        if config.output and results:
+            with open(config.output, "w") as output:
+                json.dump(results, output, indent=2)
+    finally:
+        shutil.rmtree(config.path)
+
+
+if __name__ == "__main__":
+    main()
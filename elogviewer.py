@@ -29,60 +29,82 @@ without privileges.
 Read /etc/make.conf.example for more information.
 """
 
+import time
+_startTime = time.perf_counter()
 import sys
 import os
 import logging
 logger = logging.getLogger(__name__)
 import argparse
+import atexit
+import json
 import locale
-import time
+import calendar
+import datetime
+import operator
 import re
+import sqlite3
+import threading
+import queue
+import subprocess
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from math import cos, sin
-from glob import glob
-from functools import partial
-from collections import namedtuple
-from contextlib import closing
+from array import array
+from glob import glob, iglob
+from functools import partial, lru_cache, wraps
+from bisect import bisect_left, bisect_right
+from fnmatch import fnmatchcase
+from itertools import chain, compress, islice
+from collections import deque, namedtuple, OrderedDict
+from contextlib import closing, nullcontext
 
 from enum import IntEnum
-from io import BytesIO
+from io import BufferedReader, BytesIO
 
 import gzip
 import bz2
 try:
-    import liblzma as lzma
+    import lzma
 except ImportError:
     lzma = None
 
 try:
-    import sip
+    # Reads the elogs compressed with PORTAGE_COMPRESS=zstd.
+    import zstandard
 except ImportError:
-    from PySide import QtGui, QtCore
-    QtCore.QSortFilterProxyModel = QtGui.QSortFilterProxyModel
-    QtWidgets = QtGui
-else:
-    try:
-        from PyQt5 import QtGui, QtWidgets, QtCore
-    except ImportError:
-        for type in "QDate QDateTime QString QVariant".split():
-            sip.setapi(type, 2)
-        from PyQt4 import QtGui, QtCore
-        QtCore.QSortFilterProxyModel = QtGui.QSortFilterProxyModel
-        QtWidgets = QtGui
-        del type
-    finally:
-        del sip
+    zstandard = None
 
-Qt = QtCore.Qt
+try:
+    # Matches with a timeout and releases the GIL.
+    import regex
+except ImportError:
+    regex = None
 
 try:
-    import portage
+    # Python >= 3.11
+    from re import _parser as sre_parse
 except ImportError:
-    portage = None
+    import sre_parse
 
 
 __version__ = "2.6"
 
 
+def _cachePath(*names):
+    """Return the path to `names` in the cache directory of elogviewer."""
+    cacheHome = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(cacheHome, "elogviewer", *names)
+
+
+def _dataPath(*names):
+    """Return the path to `names` in the data directory of elogviewer."""
+    dataHome = os.environ.get("XDG_DATA_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "share")
+    return os.path.join(dataHome, "elogviewer", *names)
+
+
 def _(bytes):
     """This helper changes `bytes` to `str` on python3 and does nothing
     under python2.
@@ -91,9 +113,145 @@ def _(bytes):
     return bytes.decode(locale.getpreferredencoding(), "replace")
 
 
-class Role(IntEnum):
+class _Span(object):
+
+    __slots__ = ("_profiler", "_name", "_start")
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler.record(self._name, time.perf_counter() - self._start)
 
-    SortRole = Qt.UserRole + 1
+
+class Profiler(object):
+
+    """Count the calls to the hot paths and histogram their latencies.
+
+    The latencies fall in buckets of powers of two microseconds.  While
+    the profiler is disabled, a span only costs the test of `enabled`.
+
+    """
+
+    buckets = 32
+    _noSpan = nullcontext()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self.enabled)
+
+    def record(self, name, seconds):
+        bucket = min(int(1e6 * seconds).bit_length(), self.buckets - 1)
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0.0, 0.0, [0] * self.buckets]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3][bucket] += 1
+
+    def span(self, name):
+        """Return a context recording the time spent in it."""
+        return _Span(self, name) if self.enabled else self._noSpan
+
+    def profiled(self, name):
+        """Decorate a function to record the time spent in it."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def timed(self, name, iterable):
+        """Return `iterable`, recording the time to get every item."""
+        return self._timed(name, iterable) if self.enabled else iterable
+
+    def _timed(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def stats(self):
+        """Return the count, the total and the maximum seconds, and the
+        histogram of every span, by name.
+
+        """
+        with self._lock:
+            return OrderedDict(
+                (name, OrderedDict((
+                    ("count", count), ("seconds", total), ("max", longest),
+                    ("histogram", OrderedDict(
+                        ("<%ius" % (1 << bucket), n)
+                        for bucket, n in enumerate(histogram) if n)))))
+                for name, (count, total, longest, histogram)
+                in sorted(self._stats.items()))
+
+    def _percentile(self, histogram, fraction):
+        """Return the upper bound of the bucket of the `fraction`
+        percentile.
+
+        """
+        target = fraction * sum(histogram)
+        for bucket, n in enumerate(histogram):
+            target -= n
+            if target <= 0:
+                return (1 << bucket) / 1e6
+        return float("inf")
+
+    def report(self):
+        lines = ["%-16s %8s %10s %10s %10s %10s" % (
+            "span", "count", "mean ms", "p50 <ms", "p99 <ms", "max ms")]
+        with self._lock:
+            for name, (count, total, longest, histogram) in sorted(
+                    self._stats.items()):
+                lines.append("%-16s %8i %10.3f %10.3f %10.3f %10.3f" % (
+                    name, count, 1000 * total / count,
+                    1000 * self._percentile(histogram, 0.5),
+                    1000 * self._percentile(histogram, 0.99),
+                    1000 * longest))
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        """Write the `stats` to `filename` as JSON."""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(filename)),
+                        exist_ok=True)
+            with open(filename, "w") as dumpFile:
+                json.dump(self.stats(), dumpFile, indent=2)
+        except OSError as exc:
+            logger.error("%s: %s" % (filename, exc))
+        else:
+            logger.warning("profile written to %s" % filename)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+profiler = Profiler()
 
 
 class Column(IntEnum):
@@ -140,15 +298,66 @@ def _itemFromIndex(index):
         index = _sourceIndex(index)
         return index.model().itemFromIndex(index)
     else:
-        return ElogItem()
+        return ElogRow()
+
+
+def _zstdFile(filename, mode="rb"):
+    return BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+        open(filename, mode), closefd=True))
+
+
+# The magic bytes starting the compressed elogs and how to open them,
+# None if the module is missing.
+_decompressors = (
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.BZ2File),
+    (b"\xfd7zXZ\x00", lzma.LZMAFile if lzma else None),
+    (b"\x28\xb5\x2f\xfd", _zstdFile if zstandard else None),
+)
+
+
+# The errors raised reading a corrupt compressed elog.
+_decompressErrors = ((OSError, EOFError) +
+                     ((lzma.LZMAError,) if lzma else ()) +
+                     ((zstandard.ZstdError,) if zstandard else ()))
+
+
+def _openElog(filename):
+    """Open the elog in `filename` for reading, decompressing it as its
+    first bytes tell.  Raise KeyError if its format is unsupported and
+    IOError if it does not open.
+
+    """
+    root, ext = os.path.splitext(filename)
+    archived = _archiveMember(filename)
+    if archived is not None:
+        archive, member = archived
+        try:
+            return _zipFile(archive).open(member)
+        except (KeyError, zipfile.BadZipFile) as exc:
+            raise IOError(exc)
+    if ext != ".log" and not root.endswith(".log"):
+        raise KeyError(ext)
+    elogfile = open(filename, "rb")
+    magic = elogfile.read(6)
+    for prefix, decompressor in _decompressors:
+        if magic.startswith(prefix):
+            elogfile.close()
+            if decompressor is None:
+                raise KeyError(prefix)
+            return decompressor(filename, "rb")
+    elogfile.seek(0)
+    return elogfile
 
 
 def _file(filename):
-        root, ext = os.path.splitext(filename)
+        """Open the elog in `filename` for reading, decompressing it
+        as its first bytes tell, or a placeholder elog if it cannot be
+        opened.
+
+        """
         try:
-            return {".gz": gzip.open,
-                    ".bz2": bz2.BZ2File,
-                    ".log": open}[ext](filename, "rb")
+            return _openElog(filename)
         except KeyError:
             logger.error("%s: unsupported format" % filename)
             return closing(BytesIO(
@@ -169,83 +378,2188 @@ def _file(filename):
             ))
 
 
-def _html(filename):
+def _archiveMember(filename):
+    """Return the `(archive, member)` of an archived elog, None for the
+    other elogs.
+
+    """
+    archive, member = os.path.split(filename)
+    return (archive, member) if archive.endswith(".zip") else None
+
+
+@lru_cache(maxsize=8)
+def _openZipFile(filename, mtime, size):
+    return zipfile.ZipFile(filename)
+
+
+def _zipFile(filename):
+    """Return the open archive `filename`, reading its index once for
+    every version of the file.
+
+    """
+    stat = os.stat(filename)
+    return _openZipFile(filename, stat.st_mtime_ns, stat.st_size)
+
+
+def _iterElogFilenames(elogpath):
+    """Generate the filenames of the elogs in `elogpath`."""
+    return chain(iglob(os.path.join(elogpath, "*:*:*.log*")),
+                 iglob(os.path.join(elogpath, "*", "*:*.log*")))
+
+
+def _elogFilenames(elogpath):
+    """Return the filenames of the elogs in `elogpath`."""
+    return list(_iterElogFilenames(elogpath))
+
+
+def _archivedElogs(elogpath):
+    """Generate the `Elog` of the elogs in the archives in `elogpath`."""
+    for filename in sorted(glob(os.path.join(elogpath, "*.zip"))):
+        for elog in ElogArchive(filename).elogs():
+            yield elog
+
+
+_eclassNames = {eclass.name[1:]: eclass for eclass in EClass}
+_ansiPattern = re.compile("\x1b\\[[0-9;]+m")
+# The URLs, the bugs, and the package names, in the order in which they
+# were formerly hyperlinked, one after the other.  The lookahead speeds
+# up the scan.
+_hyperlinkPattern = re.compile(r"""
+    (?=[hfb\s])
+    (?:
+        (?P<url>(?:https?|ftp)://\S+)
+        |
+        bug\s+\#(?P<bug>[0-9]+)
+        |
+        (?P<space>\s)(?P<package>[a-z1]+-[a-z0-9]+/[a-z0-9-]+)
+        (?P<end>[\s,.:;!?])
+        # A package name ending with the start of a bug or of a URL is
+        # not a package name.
+        (?!(?<=bug\s)\s*\#[0-9])
+        (?!(?:(?<=http:)|(?<=https:)|(?<=ftp:))//\S)
+    )
+    """, re.VERBOSE)
+
+
+def _hyperlink(match):
+    url, bug, package = match.group("url", "bug", "package")
+    if url:
+        return '<a href="{0}">{0}</a>'.format(url)
+    elif bug:
+        return '<a href="https://bugs.gentoo.org/{0}">bug #{0}</a>'.format(bug)
+    else:
+        return "".join((
+            match.group("space"),
+            '<a href="http://packages.gentoo.org/package/{0}">{0}</a>'.format(
+                package),
+            match.group("end")))
+
+
+@profiler.profiled("render")
+def _html(filename, colors=None):
+    """Return the elog in `filename` rendered to HTML.
+
+    `colors` maps the eclasses to their HTML colors.  The colors missing
+    are looked up with `EClass.htmlColor`, which must be called from
+    the GUI thread.
+
+    """
     lines = []
+    colors = {} if colors is None else dict(colors)
+    encoding = locale.getpreferredencoding()
     with _file(filename) as elogfile:
         for line in elogfile:
-            line = _(line.strip())
-            try:
-                eclass, stage = line.split(":")
-                eclass = EClass["e%s" % eclass.lower()]
-            except (ValueError, KeyError):
+            line = line.strip().decode(encoding, "replace")
+            eclass, colon, stage = line.partition(":")
+            eclass = _eclassNames.get(eclass.lower()) \
+                if colon and ":" not in stage else None
+            if eclass is None:
                 # Not a section header: write line
-                lines.append("{} <br />".format(line))
+                hyperlink = "/" in line or "bug" in line
+                line += " <br />"
             else:
                 # Format section header
+                hyperlink = True
+                if eclass not in colors:
+                    colors[eclass] = eclass.htmlColor()
                 sectionHeader = "".join((
                     "<h2>{eclass}: {stage}</h2>".format(
                         eclass=eclass.name[1:].capitalize(),
                         stage=stage,
                     ),
-                    '<p style="color: {}">'.format(eclass.htmlColor())))
+                    '<p style="color: {}">'.format(colors[eclass])))
                 # Close previous section if exists and open new section
                 if lines:
                     lines.append("</p>")
-                lines.append(sectionHeader)
+                line = sectionHeader
+            # Strip ANSI colors
+            if "\x1b" in line:
+                line = _ansiPattern.sub("", line)
+                hyperlink = True
+            # Hyperlink URLs, bugs, and packages.  Only the lines with a
+            # "/" or a "bug" may contain any of them.  Prepend the line
+            # separator that may precede a package name.
+            if hyperlink and lines:
+                line = _hyperlinkPattern.sub(
+                    _hyperlink, os.linesep + line)[len(os.linesep):]
+            elif hyperlink:
+                line = _hyperlinkPattern.sub(_hyperlink, line)
+            lines.append(line)
     lines.append("</p>")
     lines.append("")
-    text = os.linesep.join(lines)
-    # Strip ANSI colors
-    text = re.sub("\x1b\[[0-9;]+m", "", text)
-    # Hyperlink
-    text = re.sub("((https?|ftp)://\S+)", r'<a href="\1">\1</a>', text)
-    # Hyperlink bugs
-    text = re.sub(
-        "bug\s+#([0-9]+)",
-        r'<a href="https://bugs.gentoo.org/\1">bug #\1</a>',
-        text)
-    # Hyperlink packages
-    text = re.sub(
-        "(\s)([a-z1]+[-][a-z0-9]+/[a-z0-9-]+)([\s,.:;!?])",
-        r'\1<a href="http://packages.gentoo.org/package/\2">\2</a>\3',
-        text)
-    return text
+    return os.linesep.join(lines)
+
+
+_eclassPattern = re.compile(b"LOG:|INFO:|WARN:|ERROR:")
+
+
+def _highestEClass(elogfile, chunkSize=1 << 16):
+    """Return the highest eclass in `elogfile`.
+
+    The file is read in chunks of `chunkSize` bytes and reading stops at
+    the first error, so that memory use does not depend on the size of
+    the file.  Adapted from Luca Marturana's elogv.
+
+    """
+    return _scanElog(elogfile, chunkSize, tokenize=False)[0]
+
+
+def _highestHeader(eClasses):
+    if b"ERROR:" in eClasses:
+        return EClass.eerror
+    elif b"WARN:" in eClasses:
+        return EClass.ewarn
+    elif b"LOG:" in eClasses:
+        return EClass.elog
+    else:
+        return EClass.einfo
+
+
+_tokenPattern = re.compile(rb"\w{2,}")
+_ansiBytesPattern = re.compile(rb"\x1b\[[0-9;]*m")
+
+
+def _tokens(text):
+    """Return the search tokens in `text`: the lowercase words."""
+    return _tokenPattern.findall(_ansiBytesPattern.sub(b" ", text.lower()))
+
+
+def _scanElog(elogfile, chunkSize=1 << 16, tokenize=True,
+              maxTokenLength=256):
+    """Return the highest eclass and the set of search tokens in
+    `elogfile`.
+
+    The file is read in chunks; the chunks are cut after their last
+    space or newline so that no word straddles them, but words longer
+    than `maxTokenLength` bytes are split, so that memory use does not
+    depend on the length of the lines.  Without `tokenize`, no token is
+    collected and reading stops at the first error.
+
+    """
+    eClasses, tokens = set(), set()
+    overlap = tail = b""
+    while True:
+        chunk = elogfile.read(chunkSize)
+        if not chunk:
+            break
+        # Prepend the end of the previous chunk to find the headers
+        # that straddle the chunks.
+        text = overlap + chunk
+        eClasses.update(_eclassPattern.findall(text))
+        overlap = text[1 - len(b"ERROR:"):]
+        if not tokenize:
+            if b"ERROR:" in eClasses:
+                break
+            continue
+        chunk = tail + chunk
+        start = max(0, len(chunk) - maxTokenLength)
+        end = max(chunk.rfind(b"\n", start), chunk.rfind(b" ", start)) + 1
+        end = end or start
+        tokens.update(_tokens(chunk[:end]))
+        tail = chunk[end:]
+    tokens.update(_tokens(tail))
+    return _highestHeader(eClasses), set(
+        token.decode("ascii") for token in tokens)
+
+
+def _readElog(filename):
+    """Return the `Elog` and the search tokens of `filename`."""
+    with _file(filename) as elogfile:
+        eclass, tokens = _scanElog(elogfile)
+    return Elog.fromFilename(filename, eclass), tokens
+
+
+def _readElogWorker(infile, outfile):
+    """Serve a worker process of `ElogIndex`: read the elogs of the JSON
+    list of filenames on every line of `infile` and write their
+    `_readElog` as a line of JSON to `outfile`.
+
+    """
+    for line in infile:
+        try:
+            rows = []
+            for filename in json.loads(line):
+                elog, tokens = _readElog(filename)
+                rows.append((elog.category, elog.package, elog.date,
+                             elog.eclass.value, sorted(tokens)))
+            reply = {"elogs": rows}
+        except Exception as exc:
+            reply = {"error": str(exc)}
+        outfile.write(json.dumps(reply) + "\n")
+        outfile.flush()
+    return 0
+
+
+class HtmlCache(object):
+
+    """LRU cache of the elogs rendered to HTML.
+
+    The entries are keyed by filename, mtime, and size so that a
+    modified elog is rendered again.  The least recently used entries
+    are evicted when the cache holds more than `maxBytes`.
+
+    """
+
+    def __init__(self, maxBytes=32 << 20):
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "elogviewer.%s(maxBytes=%r)" % (
+            self.__class__.__name__, self.maxBytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename):
+        return self._key(filename) in self._entries
+
+    @staticmethod
+    def _key(filename):
+        archived = _archiveMember(filename)
+        try:
+            # The archived elogs change with their archive.
+            stat = os.stat(filename if archived is None else archived[0])
+        except OSError:
+            return None
+        return filename, stat.st_mtime_ns, stat.st_size
+
+    def html(self, filename):
+        """Return `_html(filename)`, from the cache if possible."""
+        key = self._key(filename)
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+        text = _html(filename)
+        if key is not None:
+            self._insert(key, text)
+        return text
+
+    def prefetch(self, filename, colors=None):
+        """Render `filename` into the cache unless it is there already.
+
+        Prefetching does not count as a hit or as a miss.
+
+        """
+        key = self._key(filename)
+        if key is None:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+        self._insert(key, _html(filename, colors))
+
+    def _insert(self, key, text):
+        size = sys.getsizeof(text)
+        with self._lock:
+            if size > self.maxBytes or key in self._entries:
+                return
+            self._entries[key] = text
+            self._bytes += size
+            while self._bytes > self.maxBytes:
+                __, evicted = self._entries.popitem(last=False)
+                self._bytes -= sys.getsizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the counters of the cache in a dict."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        entries=len(self._entries), bytes=self._bytes,
+                        maxBytes=self.maxBytes)
+
+
+htmlCache = HtmlCache()
+
+
+_epochOrdinal = datetime.date(1970, 1, 1).toordinal()
+
+
+def _parseDate(text):
+    """Return the seconds since the epoch of the `YYYYmmdd-HHMMSS` UTC
+    date in `text`, as `time.strptime` and `calendar.timegm` would but
+    by position.
+
+    """
+    if (len(text) != 15 or text[8] != "-" or
+            not (text[:8] + text[9:]).isdigit() or not text.isascii()):
+        raise ValueError("%r is not a date" % text)
+    hour, minute, second = int(text[9:11]), int(text[11:13]), int(text[13:])
+    if hour > 23 or minute > 59 or second > 61:
+        raise ValueError("%r is not a date" % text)
+    days = datetime.date(int(text[:4]), int(text[4:6]),
+                         int(text[6:8])).toordinal() - _epochOrdinal
+    return ((days * 24 + hour) * 60 + minute) * 60 + second
 
 
 class Elog(namedtuple("Elog", ["filename", "category", "package",
                                "date", "eclass"])):
 
+    """An elog; its date is in seconds since the epoch."""
+
     @classmethod
-    def fromFilename(cls, filename):
+    def fromName(cls, filename):
+        """Return the elog in `filename` from its name alone, without
+        opening the file: the eclass is None.
+
+        """
         basename = os.path.basename(filename)
         try:
             category, package, rest = basename.split(":")
         except ValueError:
             category = os.path.dirname(filename).split(os.sep)[-1]
             package, rest = basename.split(":")
-        date = rest.split(".")[0]
-        date = time.strptime(date, "%Y%m%d-%H%M%S")
-        # Get the highest elog class. Adapted from Luca Marturana's elogv.
-        with _file(filename) as elogfile:
-            eClasses = re.findall("LOG:|INFO:|WARN:|ERROR:",
-                                  _(elogfile.read()))
-            if "ERROR:" in eClasses:
-                eclass = EClass.eerror
-            elif "WARN:" in eClasses:
-                eclass = EClass.ewarn
-            elif "LOG:" in eClasses:
-                eclass = EClass.elog
-            else:
-                eclass = EClass.einfo
-        return cls(filename, category, package, date, eclass)
+        date = _parseDate(rest.split(".")[0])
+        return cls(filename, category, package, date, None)
+
+    @classmethod
+    def fromFilename(cls, filename, eclass=None):
+        """Return the elog in `filename`, reading its highest eclass
+        unless it is given.
+
+        """
+        elog = cls.fromName(filename)
+        if eclass is None:
+            with _file(filename) as elogfile:
+                eclass = _highestEClass(elogfile)
+        return elog._replace(eclass=eclass)
+
+    @classmethod
+    def parseAll(cls, parse, filenames):
+        """Generate `parse(filename)` for the files in `filenames`,
+        skipping those whose name is not that of an elog.
+
+        """
+        for filename in filenames:
+            try:
+                yield parse(filename)
+            except ValueError:
+                logger.warning("%s: not an elog" % filename)
 
     @property
     def isoTime(self):
-        return time.strftime("%Y-%m-%d %H:%M:%S", self.date)
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.date))
 
     @property
     def localeTime(self):
-        return time.strftime("%x %X", self.date)
+        return time.strftime("%x %X", time.gmtime(self.date))
+
+
+class _Database(object):
+
+    """Base of the sqlite databases of elogviewer.
+
+    The `schema` is created when the `version` of the database differs.
+    A database that cannot be written is kept in memory and a database
+    that cannot be read is deleted and created again.
+
+    """
+
+    version = 0
+    schema = ""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = None
+        self._open()
+
+    def _connect(self):
+        db = sqlite3.connect(self.filename, check_same_thread=False)
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.version:
+                db.executescript("%s; PRAGMA user_version = %i;" % (
+                    self.schema, self.version))
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.DatabaseError:
+            db.close()
+            raise
+        return db
+
+    def _open(self):
+        try:
+            if self.filename != ":memory:":
+                dirname = os.path.dirname(os.path.abspath(self.filename))
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+            self._db = self._connect()
+        except (OSError, sqlite3.OperationalError) as exc:
+            # Unwritable file: keep the database in memory.
+            logger.warning("%s: %s" % (self.filename, exc))
+            self.filename = ":memory:"
+            self._db = self._connect()
+        except sqlite3.DatabaseError as exc:
+            self._rebuild(exc)
+
+    def _rebuild(self, exc):
+        logger.warning("%s: rebuilding database (%s)" % (self.filename, exc))
+        if self._db is not None:
+            self._db.close()
+        if self.filename != ":memory:":
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                try:
+                    os.remove(self.filename + suffix)
+                except OSError:
+                    pass
+        self._db = self._connect()
+
+    def _transaction(self, func):
+        """Call `func` with the connection in a single transaction."""
+        if self._db is None:
+            return  # Closed: the changes are lost.
+        try:
+            with self._db:
+                func(self._db)
+        except sqlite3.OperationalError as exc:
+            # Locked or read-only database: the changes are lost.
+            logger.warning("%s: %s" % (self.filename, exc))
+        except sqlite3.DatabaseError as exc:
+            self._rebuild(exc)
+            self._transaction(func)
+
+    def _execute(self, sql, rows):
+        self._transaction(lambda db: db.executemany(sql, rows))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class ElogIndex(_Database):
+
+    """Persistent cache of the metadata and of the words of the elogs.
+
+    The category, package, date, and highest eclass of every elog are
+    stored in an sqlite database keyed by path, mtime, and size so that
+    only new or modified elogs have to be read again.  sqlite commits
+    are atomic so that the index survives crashes; an index that cannot
+    be read is deleted and rebuilt from scratch.
+
+    The words of the elogs are stored in an inverted index, the `token`
+    table, for `search`.
+
+    """
+
+    version = 2
+    schema = """
+        DROP TABLE IF EXISTS token;
+        DROP TABLE IF EXISTS elog;
+        CREATE TABLE elog (
+            path TEXT PRIMARY KEY,
+            mtime INTEGER, size INTEGER,
+            category TEXT, package TEXT,
+            date INTEGER, eclass INTEGER);
+        CREATE TABLE token (
+            token TEXT NOT NULL, elog INTEGER NOT NULL,
+            PRIMARY KEY (token, elog)) WITHOUT ROWID;
+        CREATE INDEX token_elog ON token (elog)"""
+    # Minimal number of elogs to read for starting worker processes.
+    parallelThreshold = 64
+    # Number of elogs read between two writes to the index.
+    writeBatchSize = 256
+    # Maximal number of elogs looked up without loading the whole index.
+    lookupThreshold = 512
+
+    def __init__(self, filename=None, jobs=None):
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
+        self._lock = threading.RLock()
+        self._entries = None
+        super(ElogIndex, self).__init__(
+            _cachePath("index.sqlite") if filename is None else filename)
+
+    def __repr__(self):
+        return "elogviewer.%s(%r, jobs=%r)" % (
+            self.__class__.__name__, self.filename, self.jobs)
+
+    def _rebuild(self, exc):
+        self._entries = None
+        super(ElogIndex, self)._rebuild(exc)
+
+    def close(self):
+        with self._lock:
+            super(ElogIndex, self).close()
+
+    def _load(self):
+        if self._db is None:
+            return {}  # Closed.
+        if self._entries is None:
+            try:
+                entries = {row[0]: row[1:] for row in self._db.execute(
+                    "SELECT * FROM elog")}
+            except sqlite3.OperationalError as exc:
+                logger.warning("%s: %s" % (self.filename, exc))
+                entries = {}
+            except sqlite3.DatabaseError as exc:
+                self._rebuild(exc)
+                entries = {}
+            self._entries = entries
+        return self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def _lookup(self, keys):
+        """Return the entries of `keys`, querying only these unless the
+        index is loaded already or there are many of them.
+
+        """
+        with self._lock:
+            if (self._db is None or self._entries is not None or
+                    len(keys) > self.lookupThreshold):
+                return self._load()
+            try:
+                return {row[0]: row[1:] for row in self._db.execute(
+                    "SELECT * FROM elog WHERE path IN (%s)" %
+                    ", ".join("?" * len(keys)), keys)}
+            except sqlite3.DatabaseError as exc:
+                logger.warning("%s: %s" % (self.filename, exc))
+                return {}
+
+    def elogs(self, filenames):
+        """Generate the `Elog` of every file in `filenames`.
+
+        The elogs found in the index are generated first.  The files
+        missing from the index or modified since they have been indexed
+        are read afterwards, on `jobs` worker processes if there are
+        many of them.  The index is updated every `writeBatchSize` elogs
+        read and when the generator is exhausted or closed.
+
+        """
+        misses, entries, elogs = [], [], None
+        filenames = list(filenames)
+        keys = [os.path.abspath(filename) for filename in filenames]
+        indexed = self._lookup(keys)
+        try:
+            for filename, key in zip(filenames, keys):
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    stat = None
+                with self._lock:
+                    entry = indexed.get(key)
+                if (stat is not None and entry and
+                        entry[:2] == (stat.st_mtime_ns, stat.st_size)):
+                    category, package, date, eclass = entry[2:]
+                    yield Elog(filename, category, package,
+                               date, EClass(eclass))
+                    continue
+                try:
+                    Elog.fromName(filename)
+                except ValueError:
+                    logger.warning("%s: not an elog" % filename)
+                    continue
+                misses.append((filename, key, stat))
+            missFilenames = [miss[0] for miss in misses]
+            if self.jobs > 1 and len(misses) >= self.parallelThreshold:
+                elogs = self._readElogs(missFilenames)
+            else:
+                elogs = map(_readElog, missFilenames)
+            for (filename, key, stat), (elog, tokens) in zip(
+                    misses, profiler.timed("classify", elogs)):
+                if stat is not None:
+                    entries.append(((key, stat.st_mtime_ns, stat.st_size,
+                                     elog.category, elog.package,
+                                     elog.date,
+                                     elog.eclass.value), tokens))
+                    if len(entries) >= self.writeBatchSize:
+                        self._store(entries)
+                        entries = []
+                yield elog
+        finally:
+            if hasattr(elogs, "close"):
+                elogs.close()  # Stop the worker processes.
+            if entries:
+                self._store(entries)
+
+    def _readElogs(self, filenames):
+        """Generate the `_readElog` of `filenames`, read in chunks on
+        `jobs` worker processes.
+
+        The workers run elogviewer.py as a script, which imports neither
+        Qt nor the GUI, and get the chunks over pipes.  Forking the
+        threads of the GUI is unsafe, and spawned `multiprocessing`
+        workers import the main module again, Qt included.
+
+        """
+        size = max(1, min(256, len(filenames) // (4 * self.jobs)))
+        chunks = [filenames[start:start + size]
+                  for start in range(0, len(filenames), size)]
+        workers = [subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--read-elogs"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True)
+            for __ in range(min(self.jobs, len(chunks)))]
+        idle = queue.Queue()
+        for worker in workers:
+            idle.put(worker)
+
+        def read(chunk):
+            worker = idle.get()
+            try:
+                worker.stdin.write(json.dumps(chunk) + "\n")
+                worker.stdin.flush()
+                reply = json.loads(worker.stdout.readline() or "{}")
+            finally:
+                idle.put(worker)
+            if "elogs" not in reply:
+                raise OSError(reply.get("error", "worker process exited"))
+            return reply["elogs"]
+
+        pool = ThreadPoolExecutor(len(workers))
+        try:
+            for chunk, rows in zip(chunks, pool.map(read, chunks)):
+                for filename, (category, package, date,
+                               eclass, tokens) in zip(chunk, rows):
+                    yield (Elog(filename, category, package,
+                                date, EClass(eclass)), set(tokens))
+        finally:
+            # The reads in progress fail once their worker is killed.
+            for worker in workers:
+                worker.kill()
+            pool.shutdown(cancel_futures=True)
+            for worker in workers:
+                with worker:
+                    pass
+
+    def _store(self, entries):
+        """Write the `(row, tokens)` entries read by `elogs`."""
+
+        def store(db):
+            for row, tokens in entries:
+                db.execute("DELETE FROM token WHERE elog IN "
+                           "(SELECT rowid FROM elog WHERE path = ?)",
+                           (row[0],))
+                rowid = db.execute("INSERT OR REPLACE INTO elog "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   row).lastrowid
+                db.executemany("INSERT INTO token VALUES (?, ?)",
+                               ((token, rowid) for token in tokens))
+
+        with self._lock:
+            self._transaction(store)
+            if self._entries is not None:
+                self._entries.update(
+                    (row[0], row[1:]) for row, __ in entries)
+
+    def prune(self, elogpath, filenames):
+        """Remove the entries for the files in `elogpath` not in
+        `filenames`.
+
+        """
+        directory = os.path.join(os.path.abspath(elogpath), "")
+        keep = set(os.path.abspath(filename) for filename in filenames)
+        with self._lock:
+            entries = self._load()
+            stale = [(key,) for key in entries
+                     if key not in keep and key.startswith(directory)]
+            for key, in stale:
+                del entries[key]
+            if stale:
+                self._transaction(lambda db: (
+                    db.executemany("DELETE FROM token WHERE elog IN "
+                                   "(SELECT rowid FROM elog WHERE path = ?)",
+                                   stale),
+                    db.executemany("DELETE FROM elog WHERE path = ?", stale)))
+
+    @profiler.profiled("search")
+    def search(self, text):
+        """Return the paths of the elogs containing every word of `text`.
+
+        The words are matched case-insensitively against the beginning
+        of the words of the elogs so that "python_targets" finds
+        "python_targets_python3_4".
+
+        """
+        words = set(re.findall(r"\w+", text.lower(), re.ASCII))
+        rowids = None
+        with self._lock:
+            if self._db is None:
+                return set()  # Closed.
+            try:
+                # Look the longest, most selective, words up first.
+                for word in sorted(words, key=len, reverse=True):
+                    # The words starting with `word` sort between these.
+                    upper = word[:-1] + chr(ord(word[-1]) + 1)
+                    matches = set(rowid for rowid, in self._db.execute(
+                        "SELECT elog FROM token WHERE token >= ? AND token < ?",
+                        (word, upper)))
+                    rowids = matches if rowids is None else rowids & matches
+                    if not rowids:
+                        return set()
+                if rowids is None:
+                    return set()
+                return set(path for rowid, path in self._db.execute(
+                    "SELECT rowid, path FROM elog") if rowid in rowids)
+            except sqlite3.DatabaseError as exc:
+                logger.warning("%s: %s" % (self.filename, exc))
+                return set()
+
+
+class ElogStateStore(_Database):
+
+    """Persistent read and important states of the elogs.
+
+    The states are loaded once into the `readFlag` and `importantFlag`
+    sets.  The changes are kept pending until `flush` writes them in a
+    single transaction, and `compact` drops the states of the elogs
+    that have been deleted.
+
+    """
+
+    version = 1
+    schema = """
+        CREATE TABLE IF NOT EXISTS state (
+            path TEXT PRIMARY KEY,
+            read INTEGER NOT NULL, important INTEGER NOT NULL)"""
+
+    def __init__(self, filename=None):
+        self.readFlag = set()
+        self.importantFlag = set()
+        self._pending = {}
+        super(ElogStateStore, self).__init__(
+            _dataPath("state.sqlite") if filename is None else filename)
+        self._load()
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self.filename)
+
+    def __len__(self):
+        return len(self.readFlag | self.importantFlag)
+
+    def _load(self):
+        try:
+            rows = self._db.execute("SELECT * FROM state").fetchall()
+        except sqlite3.OperationalError as exc:
+            logger.warning("%s: %s" % (self.filename, exc))
+            rows = []
+        except sqlite3.DatabaseError as exc:
+            self._rebuild(exc)
+            rows = []
+        self.readFlag = set(path for path, read, __ in rows if read)
+        self.importantFlag = set(path for path, __, important in rows
+                                 if important)
+
+    def setFlags(self, filename, read, important):
+        """Set whether `filename` is read and whether it is important."""
+        for flag, value in ((self.readFlag, read),
+                            (self.importantFlag, important)):
+            if value:
+                flag.add(filename)
+            else:
+                flag.discard(filename)
+        self._pending[filename] = (bool(read), bool(important))
+
+    def isDirty(self):
+        return bool(self._pending)
+
+    def flush(self):
+        """Write the pending changes, unless the store is closed."""
+        if not self._pending or self._db is None:
+            return
+        pending, self._pending = self._pending, {}
+        self._execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                      [(path, read, important) for path, (read, important)
+                       in pending.items() if read or important])
+        self._execute("DELETE FROM state WHERE path = ?",
+                      [(path,) for path, (read, important)
+                       in pending.items() if not (read or important)])
+
+    def migrate(self, readFlag, importantFlag):
+        """Import the sets of filenames formerly stored in QSettings."""
+        for filename in set(readFlag) | set(importantFlag):
+            self.setFlags(filename,
+                          filename in readFlag or filename in self.readFlag,
+                          filename in importantFlag or
+                          filename in self.importantFlag)
+        self.flush()
+
+    def compact(self, elogpath, filenames):
+        """Drop the states of the elogs in `elogpath` not in `filenames`."""
+        directory = os.path.join(os.path.abspath(elogpath), "")
+        keep = set(filenames)
+        for filename in self.readFlag | self.importantFlag:
+            if (filename not in keep and
+                    os.path.abspath(filename).startswith(directory)):
+                self.setFlags(filename, False, False)
+        self.flush()
+
+    def close(self):
+        self.flush()
+        super(ElogStateStore, self).close()
+
+
+class ElogArchive(object):
+
+    """Zip archive of old elogs.
+
+    Every elog is deflated on its own, as a `category:package:date.log`
+    member, so that it is decompressed only when it is read.  The
+    central directory of the zip file is the index of the archive: the
+    names of the members give the category, the package, and the date
+    of the elogs, and their comments the eclass.  The elogs archived
+    are named `path/to/archive.zip/member` and read by `_file`.
+
+    """
+
+    defaultName = "archive.zip"
+    # Range of the dates of the zip format, the names keep the others.
+    _zipDates = (1980, 1, 1, 0, 0, 0), (2107, 12, 31, 23, 59, 58)
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self.filename)
+
+    def elogs(self):
+        """Return the `Elog` of every member, from the index alone."""
+        try:
+            infos = _zipFile(self.filename).infolist()
+        except (OSError, zipfile.BadZipFile) as exc:
+            logger.warning("%s: %s" % (self.filename, exc))
+            return []
+        elogs = []
+        for info in infos:
+            try:
+                eclass = EClass[info.comment.decode("ascii")]
+                elog = Elog.fromName(os.path.join(self.filename,
+                                                  info.filename))
+            except (KeyError, ValueError):
+                logger.warning("%s: not an elog: %s" % (
+                    self.filename, info.filename))
+                continue
+            elogs.append(elog._replace(eclass=eclass))
+        return elogs
+
+    def add(self, filenames):
+        """Move the elogs in `filenames` to the archive and return the
+        `(filename, archived filename)` of those moved.
+
+        """
+        moved = []
+        with zipfile.ZipFile(self.filename, "a") as archive:
+            members = set(archive.namelist())
+            for filename in filenames:
+                # Only the elogs read in full are archived and removed.
+                try:
+                    elog = Elog.fromName(filename)
+                    with _openElog(filename) as elogfile:
+                        text = elogfile.read()
+                except KeyError:
+                    logger.warning("%s: unsupported format" % filename)
+                    continue
+                except (ValueError,) + _decompressErrors as exc:
+                    logger.warning("%s: %s" % (filename, exc))
+                    continue
+                date = time.gmtime(elog.date)
+                member = "%s:%s:%s.log" % (
+                    elog.category, elog.package,
+                    time.strftime("%Y%m%d-%H%M%S", date))
+                if member in members:
+                    logger.warning("%s: archived already" % filename)
+                    continue
+                members.add(member)
+                info = zipfile.ZipInfo(member, max(self._zipDates[0], min(
+                    tuple(date[:6]), self._zipDates[1])))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.comment = _highestEClass(BytesIO(text)).name.encode()
+                archive.writestr(info, text)
+                moved.append((filename, os.path.join(self.filename, member)))
+        # Remove the elogs once the archive is written.
+        for filename, __ in moved:
+            try:
+                os.remove(filename)
+            except OSError as exc:
+                logger.warning("%s: %s" % (filename, exc))
+        return moved
+
+    def remove(self, filenames):
+        """Remove the archived elogs in `filenames`, rewriting the
+        archive.
+
+        """
+        members = set(os.path.basename(filename) for filename in filenames)
+        temporary = self.filename + ".tmp"
+        with zipfile.ZipFile(self.filename) as archive, \
+                zipfile.ZipFile(temporary, "w") as rewritten:
+            for info in archive.infolist():
+                if info.filename not in members:
+                    rewritten.writestr(info, archive.read(info))
+        os.replace(temporary, self.filename)
+
+
+class ElogTable(object):
+
+    """Columnar storage of the rows of the elog list.
+
+    Every column is a compact array: the categories and the packages are
+    interned strings, the dates are seconds since the epoch, the eclasses
+    are bytes, and the read and important states are packed into a byte
+    of flags per row.  The states use the values of `Qt.CheckState`.
+
+    The numbers of read and important rows are kept up to date as the
+    rows and the states change.
+
+    The eclass of the rows listed by `Elog.fromName` is unknown until
+    it is set with `setEClass`.
+
+    The rows are sorted by integer keys: the dates, the bytes of the
+    eclasses and of the states, and the ranks of the categories and of
+    the packages in alphabetical order.
+
+    The rows selected by an `ElogQuery` are masks holding one byte, 0 or
+    1, per row.  They are computed with `bytes.translate` on the byte
+    columns, and from indexes of the rows by category, by package, and
+    by date for the other columns.  The indexes are built on the first
+    query after the rows change.
+
+    """
+
+    Unchecked, PartiallyChecked, Checked = range(3)
+    _readMask = 0x03
+    _importantShift = 2
+    # Translation tables to count the flags with `bytes.count`.
+    _isRead = bytes(1 if flags & 0x03 else 0 for flags in range(256))
+    _isImportant = bytes(1 if flags >> 2 == 2 else 0 for flags in range(256))
+    _unknownEClass = 0xFF
+    # Translation tables to the sort keys of the byte columns.
+    _eclassKeys = bytes((value + 1) & 0xFF for value in range(256))
+    _readKeys = bytes(flags & 0x03 for flags in range(256))
+    _importantKeys = bytes(flags >> 2 for flags in range(256))
+
+    def __init__(self, elogs=(), readFlag=(), importantFlag=()):
+        self._filenames = []
+        self._categories = []
+        self._packages = []
+        self._dates = array("q")
+        self._eclasses = bytearray()
+        self._flags = bytearray()
+        # Computed on the first search.
+        self._searchKeys = []
+        self._indexes = {}
+        self._readCount = 0
+        self._importantCount = 0
+        self.extend(elogs, readFlag, importantFlag)
+
+    def __repr__(self):
+        return "<elogviewer.%s with %i elogs>" % (
+            self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self._filenames)
+
+    def extend(self, elogs, readFlag=(), importantFlag=()):
+        """Append `elogs`, checking those whose filename is in the flags."""
+        intern = sys.intern
+        first = len(self._flags)
+        for elog in elogs:
+            self._filenames.append(elog.filename)
+            self._categories.append(intern(elog.category))
+            self._packages.append(intern(elog.package))
+            self._dates.append(elog.date)
+            self._eclasses.append(self._unknownEClass if elog.eclass is None
+                                  else elog.eclass.value)
+            self._flags.append(
+                (self.Checked if elog.filename in readFlag else
+                 self.Unchecked) |
+                (self.Checked if elog.filename in importantFlag else
+                 self.Unchecked) << self._importantShift)
+        self._count(self._flags[first:], 1)
+        self._indexes.clear()
+
+    def remove(self, first, count):
+        """Remove `count` rows starting with `first`."""
+        last = first + count
+        self._count(self._flags[first:last], -1)
+        for column in (self._filenames, self._categories, self._packages,
+                       self._dates, self._eclasses, self._flags,
+                       self._searchKeys):
+            # The search keys are computed for the first rows only and
+            # remain so.
+            del column[first:last]
+        self._indexes.clear()
+
+    def clear(self):
+        self.remove(0, len(self))
+
+    def sortKeys(self, column):
+        """Return the integer sort key of every row for `column`."""
+        if column == Column.Date:
+            return self._dates
+        elif column == Column.Eclass:
+            # The unknown eclasses first.
+            return self._eclasses.translate(self._eclassKeys)
+        elif column == Column.ReadState:
+            return self._flags.translate(self._readKeys)
+        elif column == Column.ImportantState:
+            return self._flags.translate(self._importantKeys)
+        key = ("rank", column)
+        if key not in self._indexes:
+            names = {Column.Category: self._categories,
+                     Column.Package: self._packages}[column]
+            ranks = {value: rank for rank, value in
+                     enumerate(sorted(set(names)))}
+            self._indexes[key] = array("l", map(ranks.__getitem__, names))
+        return self._indexes[key]
+
+    def sortedRows(self, column, reverse=False):
+        """Return the rows sorted by `column`, in a stable order."""
+        return sorted(range(len(self)), key=self.sortKeys(column).__getitem__,
+                      reverse=reverse)
+
+    def mergeOrder(self, column, first, reverse=False):
+        """Return the rows from `first` on sorted by `column` and the
+        positions before which they go among the rows before them,
+        sorted by `column` already, in a stable order.
+
+        """
+        # The names compare as their ranks.
+        keys = {Column.Category: self._categories,
+                Column.Package: self._packages}.get(column)
+        if keys is None:
+            keys = self.sortKeys(column)
+        rows = sorted(range(first, len(self)), key=keys.__getitem__,
+                      reverse=reverse)
+        return rows, [self._bisect(keys, keys[row], first, reverse)
+                      for row in rows]
+
+    def merge(self, rows, positions):
+        """Move the `rows` of the `mergeOrder` before their `positions`
+        and return the new rows of the rows moved, in their old order.
+        The rows are copied by slices so that a batch merges in linear
+        time.
+
+        """
+        first = len(self) - len(rows)
+
+        def merged(values):
+            result, start = values[:0], 0
+            for position, row in zip(positions, rows):
+                result += values[start:position]
+                result += values[row:row + 1]
+                start = position
+            result += values[start:first]
+            return result
+
+        self._filenames = merged(self._filenames)
+        self._categories = merged(self._categories)
+        self._packages = merged(self._packages)
+        self._dates = merged(self._dates)
+        self._eclasses = merged(self._eclasses)
+        self._flags = merged(self._flags)
+        # The rows before the first position do not move.
+        del self._searchKeys[positions[0] if positions else first:]
+        self._indexes.clear()
+        newRows = {row: position + n
+                   for n, (position, row) in enumerate(zip(positions, rows))}
+        return [newRows[row] for row in range(first, len(self))]
+
+    @staticmethod
+    def _bisect(keys, key, hi, reverse):
+        """Return the position after the keys sorting before or as `key`
+        in `keys[:hi]`.
+
+        """
+        if not reverse:
+            return bisect_right(keys, key, 0, hi)
+        lo = 0
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if key > keys[middle]:
+                hi = middle
+            else:
+                lo = middle + 1
+        return lo
+
+    def reorder(self, rows):
+        """Move the rows in the order of `rows`, a permutation."""
+        self._filenames = [self._filenames[row] for row in rows]
+        self._categories = [self._categories[row] for row in rows]
+        self._packages = [self._packages[row] for row in rows]
+        self._dates = array("q", map(self._dates.__getitem__, rows))
+        self._eclasses = bytearray(map(self._eclasses.__getitem__, rows))
+        self._flags = bytearray(map(self._flags.__getitem__, rows))
+        self._searchKeys = ([self._searchKeys[row] for row in rows]
+                            if len(self._searchKeys) == len(rows) else [])
+        self._indexes.clear()
+
+    def _count(self, flags, sign):
+        self._readCount += sign * flags.translate(self._isRead).count(1)
+        self._importantCount += sign * flags.translate(
+            self._isImportant).count(1)
+
+    def filename(self, row):
+        return self._filenames[row]
+
+    def filenames(self):
+        return list(self._filenames)
+
+    def category(self, row):
+        return self._categories[row]
+
+    def package(self, row):
+        return self._packages[row]
+
+    def date(self, row):
+        return self._dates[row]
+
+    def eclass(self, row):
+        """Return the eclass of `row`, None if it is unknown."""
+        value = self._eclasses[row]
+        return None if value == self._unknownEClass else EClass(value)
+
+    def setEClass(self, row, eclass):
+        self._eclasses[row] = eclass.value
+        if row < len(self._searchKeys):
+            self._searchKeys[row] = self._searchKey(row)
+
+    def localeTime(self, row):
+        return time.strftime("%x %X", time.gmtime(self._dates[row]))
+
+    def searchKeys(self):
+        """Return the lowercase category, package, eclass, and date of
+        every row, one per line.
+
+        """
+        for row in range(len(self._searchKeys), len(self)):
+            self._searchKeys.append(self._searchKey(row))
+        return list(self._searchKeys)
+
+    def _searchKey(self, row):
+        eclass = self.eclass(row)
+        return "\n".join((
+            self._categories[row], self._packages[row],
+            eclass.name if eclass is not None else "",
+            self.localeTime(row))).lower()
+
+    def _index(self, name):
+        try:
+            return self._indexes[name]
+        except KeyError:
+            pass
+        if name == "date":
+            rows = array("l", sorted(range(len(self)),
+                                     key=self._dates.__getitem__))
+            index = array("q", (self._dates[row] for row in rows)), rows
+        else:
+            index = {}
+            column = getattr(self, "_%s" % name)
+            for row, value in enumerate(column):
+                index.setdefault(value, array("l")).append(row)
+        self._indexes[name] = index
+        return index
+
+    def _names(self, name, prefix):
+        try:
+            lowered, names = self._indexes[name, "sorted"]
+        except KeyError:
+            names = sorted(self._index(name), key=str.lower)
+            lowered = [value.lower() for value in names]
+            self._indexes[name, "sorted"] = lowered, names
+        prefix = prefix.lower()
+        return names[bisect_left(lowered, prefix):
+                     bisect_left(lowered, prefix + "\U0010ffff")]
+
+    def categories(self, prefix=""):
+        """Return the distinct categories starting with `prefix`,
+        ignoring case.
+
+        """
+        return self._names("categories", prefix)
+
+    def packages(self, prefix=""):
+        """Return the distinct packages starting with `prefix`, ignoring
+        case.
+
+        """
+        return self._names("packages", prefix)
+
+    def mask(self, rows):
+        """Return the mask of `rows`."""
+        mask = bytearray(len(self))
+        for row in rows:
+            mask[row] = 1
+        return bytes(mask)
+
+    def categoryMask(self, categories):
+        index = self._index("categories")
+        return self.mask(row for category in categories
+                         for row in index.get(category, ()))
+
+    def packageMask(self, packages):
+        index = self._index("packages")
+        return self.mask(row for package in packages
+                         for row in index.get(package, ()))
+
+    def dateMask(self, start=None, stop=None):
+        """Return the mask of the rows dated from `start` included to
+        `stop` excluded, in seconds since the epoch.
+
+        """
+        dates, rows = self._index("date")
+        first = 0 if start is None else bisect_left(dates, start)
+        last = len(dates) if stop is None else bisect_left(dates, stop)
+        return self.mask(rows[first:last])
+
+    def eclassMask(self, eclasses):
+        table = bytearray(256)
+        for eclass in eclasses:
+            table[eclass.value] = 1
+        return self._eclasses.translate(table)
+
+    def readMask(self):
+        """Return the mask of the rows that are read or partially read."""
+        return self._flags.translate(self._isRead)
+
+    def importantMask(self):
+        return self._flags.translate(self._isImportant)
+
+    def elog(self, row):
+        return Elog(self._filenames[row], self._categories[row],
+                    self._packages[row], self._dates[row], self.eclass(row))
+
+    def readState(self, row):
+        return self._flags[row] & self._readMask
+
+    def setReadState(self, row, state):
+        state = int(state)
+        self._readCount += bool(state) - bool(self.readState(row))
+        self._flags[row] = self._flags[row] & ~self._readMask | state
+
+    def importantState(self, row):
+        return self._flags[row] >> self._importantShift
+
+    def setImportantState(self, row, state):
+        state = int(state)
+        self._importantCount += ((state == self.Checked) -
+                                 (self.importantState(row) == self.Checked))
+        self._flags[row] = (self._flags[row] & self._readMask |
+                            state << self._importantShift)
+
+    def readCount(self):
+        """Return the number of rows that are read or partially read."""
+        return self._readCount
+
+    def unreadCount(self):
+        return len(self) - self._readCount
+
+    def importantCount(self):
+        return self._importantCount
+
+
+class ElogQuery(object):
+
+    """Select the rows of an `ElogTable` matching every term of a query
+    such as ``eclass>=warn category:dev-python date:2015-01..2015-02``.
+
+    The fields are compared with ``:``, ``=``, ``<``, ``<=``, ``>``, or
+    ``>=``:
+
+    - eclass: error, warn, info, log, or qa, ordered by severity;
+    - category and package: shell patterns, where a package without a
+      version matches every version;
+    - date: YYYY, YYYY-MM, or YYYY-MM-DD for the whole year, month, or
+      day, or a range FROM..TO where either end may be left out.
+
+    The words read, unread, and important select the rows by state, and
+    the other words are searched in the columns.  A term starting with
+    ``-`` is negated.
+
+    """
+
+    fields = ("eclass", "category", "package", "date")
+    flags = ("read", "unread", "important")
+    _fieldPattern = re.compile(r"(\w+)(:|=|<=|>=|<|>)(.*)$")
+    _datePattern = re.compile(r"(\d{4})(?:-(\d\d?)(?:-(\d\d?))?)?$")
+    _operators = {":": operator.eq, "=": operator.eq,
+                  "<": operator.lt, "<=": operator.le,
+                  ">": operator.gt, ">=": operator.ge}
+    _negation = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+    def __init__(self, text):
+        self._text = text
+        self._terms = [self._parse(word) for word in text.split()]
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self._text)
+
+    @classmethod
+    def isQuery(cls, text):
+        """Return whether `text` has a field or a state term."""
+        for word in text.lower().split():
+            word = word[1:] if word.startswith("-") else word
+            match = cls._fieldPattern.match(word)
+            if word in cls.flags or match and match.group(1) in cls.fields:
+                return True
+        return False
+
+    def _parse(self, word):
+        negated = word.startswith("-") and len(word) > 1
+        word = word[1:] if negated else word
+        match = self._fieldPattern.match(word)
+        if match and match.group(1).lower() in self.fields:
+            field, op, value = match.groups()
+            field = field.lower()
+            if not value:
+                raise ValueError("%s has no value" % field)
+            term = getattr(self, "_%sTerm" % field)(op, value)
+        elif word.lower() == "read":
+            term = ElogTable.readMask
+        elif word.lower() == "unread":
+            negated = not negated
+            term = ElogTable.readMask
+        elif word.lower() == "important":
+            term = ElogTable.importantMask
+        else:
+            term = partial(self._wordMask, word.lower())
+        return negated, term
+
+    def _eclassTerm(self, op, value):
+        value = value.lower()
+        eclass = _eclassNames.get(value)
+        if eclass is None:
+            eclass = EClass.__members__.get(value)
+        if eclass is None:
+            raise ValueError("unknown eclass %r" % value)
+        compare = self._operators[op]
+        return partial(ElogTable.eclassMask, eclasses=[
+            other for other in EClass if compare(other, eclass)])
+
+    def _patternTerm(self, op, patterns, values, mask):
+        if self._operators[op] is not operator.eq:
+            raise ValueError("cannot compare names with %r" % op)
+        patterns = [pattern.lower() for pattern in patterns]
+        # Only match the names starting with the literal prefix.
+        prefix = re.split(r"[*?[]", patterns[0])[0]
+        return lambda table: mask(table, [
+            value for value in values(table, prefix)
+            if any(fnmatchcase(value.lower(), pattern)
+                   for pattern in patterns)])
+
+    def _categoryTerm(self, op, value):
+        return self._patternTerm(op, [value], ElogTable.categories,
+                                 ElogTable.categoryMask)
+
+    def _packageTerm(self, op, value):
+        # Any version of the package.
+        return self._patternTerm(op, [value, value + "-[0-9]*"],
+                                 ElogTable.packages, ElogTable.packageMask)
+
+    def _dateTerm(self, op, value):
+        compare = self._operators[op]
+        if ".." in value:
+            if compare is not operator.eq:
+                raise ValueError("cannot compare a date range with %r" % op)
+            start, stop = value.split("..", 1)
+            start = self._period(start)[0] if start else None
+            stop = self._period(stop)[1] if stop else None
+        else:
+            period = self._period(value)
+            start, stop = dict([
+                (operator.eq, period), (operator.lt, (None, period[0])),
+                (operator.le, (None, period[1])),
+                (operator.gt, (period[1], None)),
+                (operator.ge, (period[0], None))])[compare]
+        return partial(ElogTable.dateMask, start=start, stop=stop)
+
+    @classmethod
+    def _period(cls, text):
+        """Return the first and the last seconds, excluded, of the
+        year, month, or day in `text`.
+
+        """
+        match = cls._datePattern.match(text)
+        if not match:
+            raise ValueError("invalid date %r" % text)
+        year, month, day = (int(group) if group else None
+                            for group in match.groups())
+        start = datetime.datetime(year, month or 1, day or 1)
+        if day:
+            stop = start + datetime.timedelta(days=1)
+        elif month:
+            stop = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+        else:
+            stop = datetime.datetime(year + 1, 1, 1)
+        return (calendar.timegm(start.timetuple()),
+                calendar.timegm(stop.timetuple()))
+
+    @staticmethod
+    def _wordMask(word, table):
+        return bytes(word in key for key in table.searchKeys())
+
+    @profiler.profiled("query")
+    def mask(self, table):
+        """Return the mask of the rows of `table` matching the query."""
+        result = int.from_bytes(b"\x01" * len(table), "little")
+        for negated, term in self._terms:
+            mask = term(table)
+            if negated:
+                mask = mask.translate(self._negation)
+            result &= int.from_bytes(mask, "little")
+        return result.to_bytes(len(table), "little")
+
+    def filenames(self, table):
+        """Return the filenames of the rows of `table` matching the
+        query.
+
+        """
+        return set(compress(table.filenames(), self.mask(table)))
+
+
+# The colors of `EClass.htmlColor` with the default palette.
+_htmlColors = {EClass.eerror: "#FF0000", EClass.ewarn: "#E56717",
+               EClass.einfo: "#008000", EClass.elog: "#000000",
+               EClass.eqa: "#000000"}
+
+
+def _text(filename):
+    """Generate the lines of the elog in `filename` without the ANSI
+    colors.
+
+    """
+    encoding = locale.getpreferredencoding()
+    with _file(filename) as elogfile:
+        for line in elogfile:
+            yield _ansiPattern.sub("", line.rstrip(b"\r\n").decode(
+                encoding, "replace"))
+
+
+def _profileFiles(profile, seen=None):
+    """Return the parent and the make.defaults files of the portage
+    profile in `profile` and of its parents, the parents first.
+
+    The parents named as `repository:path` are left out: finding the
+    repository needs portage.
+
+    """
+    seen = set() if seen is None else seen
+    profile = os.path.realpath(profile)
+    if profile in seen:
+        return []
+    seen.add(profile)
+    files = []
+    parent = os.path.join(profile, "parent")
+    try:
+        with open(parent) as parentFile:
+            lines = parentFile.read().splitlines()
+    except OSError:
+        lines = []
+    for line in lines:
+        line = line.split("#")[0].strip()
+        if line and ":" not in line:
+            files.extend(_profileFiles(os.path.join(profile, line), seen))
+    return files + [parent, os.path.join(profile, "make.defaults")]
+
+
+def _portageStamp(root=os.sep):
+    """Return what the elog directory of portage depends on: the
+    environment and the configuration files in `root`, the `EROOT` of
+    portage.
+
+    The files are make.conf, or the files in it if it is a directory,
+    make.globals, and the make.defaults of the profile and its parents.
+
+    """
+    root = os.environ.get("PORTAGE_CONFIGROOT") or root
+    stamp = [os.environ.get(name) for name in
+             ("PORT_LOGDIR", "EPREFIX", "PORTAGE_CONFIGROOT")]
+    paths = []
+    for name in ("etc/portage/make.conf", "etc/make.conf",
+                 "usr/share/portage/config/make.globals"):
+        path = os.path.join(root, *name.split("/"))
+        if os.path.isdir(path):
+            paths.extend(sorted(
+                filename for filename in iglob(
+                    os.path.join(path, "**"), recursive=True)
+                if os.path.isfile(filename)))
+        else:
+            paths.append(path)
+    for name in ("etc/portage/make.profile", "etc/make.profile"):
+        path = os.path.join(root, *name.split("/"))
+        if os.path.isdir(path):
+            paths.extend(_profileFiles(path))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append([os.path.relpath(path, root).replace(os.sep, "/"),
+                          stat.st_mtime_ns, stat.st_size])
+    return stamp
+
+
+@lru_cache(maxsize=None)
+def _portageElogpath(cacheFilename=None):
+    """Return the elog directory of portage, or "" without portage.
+
+    Importing portage takes a while, so the directory is cached in
+    `cacheFilename`, with the root of portage, until the `_portageStamp`
+    changes.
+
+    """
+    cacheFilename = (_cachePath("elogpath.json") if cacheFilename is None
+                     else cacheFilename)
+    try:
+        with open(cacheFilename) as cacheFile:
+            cache = json.load(cacheFile)
+        if cache["stamp"] == _portageStamp(cache["root"]):
+            return cache["elogpath"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    try:
+        import portage
+    except ImportError:
+        return ""
+    root = portage.settings.get("EROOT") or os.sep
+    stamp = _portageStamp(root)
+    logdir = portage.settings.get(
+        "PORT_LOGDIR",
+        os.path.join(os.sep, portage.settings["EPREFIX"],
+                     *"var/log/portage".split("/")))
+    elogpath = os.path.join(logdir, "elog")
+    try:
+        os.makedirs(os.path.dirname(cacheFilename), exist_ok=True)
+        with open(cacheFilename, "w") as cacheFile:
+            json.dump({"root": root, "stamp": stamp, "elogpath": elogpath},
+                      cacheFile)
+    except OSError as exc:
+        logger.info("%s: %s" % (cacheFilename, exc))
+    return elogpath
+
+
+def _elogpath(elogpath=None):
+    """Return `elogpath` or, if it is not given, the elog directory of
+    portage.
+
+    """
+    return elogpath or _portageElogpath()
+
+
+class StartupProfile(object):
+
+    """Record the time at each step of the startup, from the time the
+    module started to load.
+
+    """
+
+    def __init__(self, start=None):
+        self._start = time.perf_counter() if start is None else start
+        self._marks = OrderedDict()
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self._start)
+
+    def __contains__(self, name):
+        return name in self._marks
+
+    def mark(self, name):
+        """Record the time of the step `name` the first time only."""
+        self._marks.setdefault(name, time.perf_counter() - self._start)
+
+    def times(self):
+        """Return the seconds from the start to every step."""
+        return OrderedDict(self._marks)
+
+    def report(self, out=None):
+        out = sys.stderr if out is None else out
+        last = 0.0
+        for name, seconds in self._marks.items():
+            out.write("%-12s %8.1f ms %+8.1f ms\n" % (
+                name, 1000 * seconds, 1000 * (seconds - last)))
+            last = seconds
+
+
+startupProfile = StartupProfile(_startTime)
+
+
+def _argumentParser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-p", "--elogpath", help="path to the elog directory")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of processes reading new elogs "
+                        "(default: number of CPUs)")
+    parser.add_argument("--html-cache", type=int, metavar="MB",
+                        help="memory for the rendered elogs (default: %i)"
+                        % (htmlCache.maxBytes >> 20))
+    parser.add_argument("--prefetch", type=int, metavar="N",
+                        help="number of elogs rendered ahead around the "
+                        "current one (default: 2)")
+    parser.add_argument("-q", "--query",
+                        help="show the elogs matching QUERY, for example "
+                        "'eclass>=warn category:dev-python date:2015-01.. "
+                        "unread'")
+    parser.add_argument("--unread", action="store_true",
+                        help="show the unread elogs only")
+    parser.add_argument("--lazy", action="store_true",
+                        help="list the elogs in pages as the list scrolls "
+                        "and read the eclass of the visible ones only")
+    parser.add_argument("-w", "--watch", action="store_true",
+                        help="refresh when elogs are written")
+    parser.add_argument("--log", choices="DEBUG INFO WARNING ERROR".split(),
+                        default="WARNING", help="set logging level")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="report the time to the first visible row "
+                        "and the steps before")
+    parser.add_argument("--profile", nargs="?", metavar="FILE",
+                        const=_cachePath("profile.json"),
+                        default=os.environ.get("ELOGVIEWER_PROFILE"),
+                        help="time the hot paths and write the latencies "
+                        "to FILE on exit (default: %(const)s; also enabled "
+                        "by setting ELOGVIEWER_PROFILE to FILE)")
+    group = parser.add_argument_group(
+        "command line", "Print the elogs instead of opening the window.  "
+        "Qt is not needed when elogviewer.py runs as a script.")
+    group.add_argument("-l", "--list", action="store_true",
+                       help="list the date, eclass, category, package, and "
+                       "filename of the elogs, in directory order")
+    group.add_argument("--json", action="store_true",
+                       help="list the elogs as JSON objects, one per line")
+    group.add_argument("--show", action="append", metavar="ELOG",
+                       help="print the text of ELOG, may be repeated")
+    group.add_argument("--html", action="store_true",
+                       help="print the elogs shown as HTML")
+    group.add_argument("--archive", type=float, metavar="DAYS",
+                       help="move the elogs older than DAYS days to %s in "
+                       "the elog directory, where they are still listed"
+                       % ElogArchive.defaultName)
+    return parser
+
+
+def _parseArguments(argv=None):
+    parser = _argumentParser()
+    config = parser.parse_args(argv)
+    if config.unread:
+        config.query = " ".join(filter(None, (config.query, "unread")))
+    if config.query:
+        try:
+            ElogQuery(config.query)
+        except ValueError as exc:
+            parser.error("invalid query: %s" % exc)
+    config.elogpath = _elogpath(config.elogpath)
+    logger.setLevel(getattr(logging, config.log))
+    if config.profile and not profiler.enabled:
+        profiler.enabled = True
+        atexit.register(profiler.dump, config.profile)
+    startupProfile.mark("arguments")
+    return config
+
+
+def _isCommandLine(config):
+    return bool(config.list or config.json or config.show or
+                config.archive is not None)
+
+
+def _listElogs(config, out, batchSize=1024):
+    """Write the elogs matching `config.query` to `out`, reading
+    `batchSize` of them at a time.
+
+    """
+    query = ElogQuery(config.query or "")
+    elogs = chain(Elog.parseAll(Elog.fromFilename,
+                                _iterElogFilenames(config.elogpath)),
+                  _archivedElogs(config.elogpath))
+    with closing(ElogStateStore()) as stateStore:
+        while True:
+            table = ElogTable(islice(elogs, batchSize),
+                              stateStore.readFlag, stateStore.importantFlag)
+            if not len(table):
+                break
+            for row in compress(range(len(table)), query.mask(table)):
+                elog = table.elog(row)
+                if config.json:
+                    line = json.dumps(OrderedDict((
+                        ("filename", elog.filename),
+                        ("category", elog.category),
+                        ("package", elog.package),
+                        ("date", elog.isoTime),
+                        ("eclass", elog.eclass.name[1:]),
+                        ("read", table.readState(row) != table.Unchecked),
+                        ("important",
+                         table.importantState(row) == table.Checked))))
+                else:
+                    line = "\t".join((elog.isoTime, elog.eclass.name[1:],
+                                      elog.category, elog.package,
+                                      elog.filename))
+                out.write(line + "\n")
+
+
+def _archiveElogs(config, out):
+    """Move the elogs older than `config.archive` days to the archive
+    in `config.elogpath`, with their states.
+
+    """
+    cutoff = time.time() - 24 * 60 * 60 * config.archive
+    filenames = []
+    for filename in _elogFilenames(config.elogpath):
+        try:
+            if Elog.fromName(filename).date < cutoff:
+                filenames.append(filename)
+        except ValueError:
+            logger.warning("%s: not an elog" % filename)
+    archive = ElogArchive(os.path.join(config.elogpath,
+                                       ElogArchive.defaultName))
+    with closing(ElogStateStore()) as stateStore:
+        moved = archive.add(filenames)
+        for filename, archived in moved:
+            read = filename in stateStore.readFlag
+            important = filename in stateStore.importantFlag
+            if read or important:
+                stateStore.setFlags(filename, False, False)
+                stateStore.setFlags(archived, read, important)
+    out.write("%i elogs archived to %s\n" % (len(moved), archive.filename))
+
+
+def cli(argv=None, out=None, config=None):
+    """Print the elogs requested on the command line `argv`, or in the
+    `config` parsed from it already, to `out` and return the exit
+    status.
+
+    Run as a script, elogviewer.py calls it before importing Qt;
+    `import elogviewer` imports Qt all the same.
+
+    """
+    config = _parseArguments(argv) if config is None else config
+    out = sys.stdout if out is None else out
+    status = 0
+    try:
+        if config.archive is not None:
+            _archiveElogs(config, out)
+        for filename in config.show or ():
+            if not (os.path.isfile(filename) or _archiveMember(filename)):
+                logger.error("%s: no such elog" % filename)
+                status = 1
+            elif config.html:
+                out.write(_html(filename, _htmlColors))
+            else:
+                out.writelines(line + "\n" for line in _text(filename))
+        if config.list or config.json:
+            _listElogs(config, out)
+        out.flush()
+    except BrokenPipeError:
+        # The output is piped to a command that has exited, as `head`.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    return status
+
+
+startupProfile.mark("imports")
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--read-elogs"]:
+        # A worker process of `ElogIndex`.
+        sys.exit(_readElogWorker(sys.stdin, sys.stdout))
+    _config = _parseArguments()
+    if _isCommandLine(_config):
+        # Neither import Qt nor define the GUI.
+        sys.exit(cli(config=_config))
+
+
+try:
+    # PyQt5 >= 5.11 does not provide a top-level sip module.
+    from PyQt5 import QtGui, QtWidgets, QtCore
+except ImportError:
+    try:
+        import sip
+    except ImportError:
+        from PySide import QtGui, QtCore
+        QtCore.QSortFilterProxyModel = QtGui.QSortFilterProxyModel
+        QtWidgets = QtGui
+    else:
+        for type in "QDate QDateTime QString QVariant".split():
+            sip.setapi(type, 2)
+        from PyQt4 import QtGui, QtCore
+        QtCore.QSortFilterProxyModel = QtGui.QSortFilterProxyModel
+        QtWidgets = QtGui
+        del type
+        del sip
+
+Qt = QtCore.Qt
+if not hasattr(QtCore, "Signal"):
+    # PyQt
+    QtCore.Signal = QtCore.pyqtSignal
+
+startupProfile.mark("Qt")
+
+
+class Role(IntEnum):
+
+    SortRole = Qt.UserRole + 1
+
+
+class ElogScanner(QtCore.QRunnable):
+
+    """Read the elogs in a directory on a thread of a `QThreadPool`.
+
+    The elogs are reported in batches of increasing size so that the
+    first rows show up immediately, even for a large directory.  If the
+    filenames already `known` are given, only the new elogs are read and
+    the known files that are gone are reported.
+
+    If `lazy`, the new filenames are reported with `filenamesListed`
+    instead of being read.  The elogs in the archives of the directory
+    are listed from the index of the archives in either case.
+
+    """
+
+    class Signals(QtCore.QObject):
+
+        listed = QtCore.Signal(int)
+        filenamesListed = QtCore.Signal(list)
+        elogsRemoved = QtCore.Signal(list)
+        elogsRead = QtCore.Signal(list)
+        done = QtCore.Signal(bool)
+
+    minBatchSize = 16
+    maxBatchSize = 1024
+    batchInterval = 0.05  # seconds
+
+    def __init__(self, index, elogpath, known=None, lazy=False):
+        super(ElogScanner, self).__init__()
+        self.setAutoDelete(False)
+        self.signals = self.Signals()
+        self._index = index
+        self._elogpath = elogpath
+        self._known = known
+        self._lazy = lazy
+        self._cancelled = threading.Event()
+
+    def __repr__(self):
+        return "elogviewer.%s(%r, %r)" % (
+            self.__class__.__name__, self._index, self._elogpath)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    @profiler.profiled("scan")
+    def run(self):
+        try:
+            self._scan()
+        finally:
+            self.signals.done.emit(self.isCancelled())
+
+    def _scan(self):
+        filenames = _elogFilenames(self._elogpath)
+        archived = {elog.filename: elog
+                    for elog in _archivedElogs(self._elogpath)}
+        newFilenames = filenames + list(archived)
+        if self._known is not None:
+            listed = set(newFilenames)
+            removed = [filename for filename in self._known
+                       if filename not in listed]
+            if removed:
+                self.signals.elogsRemoved.emit(removed)
+            newFilenames = [filename for filename in newFilenames
+                            if filename not in self._known]
+        self.signals.listed.emit(len(newFilenames))
+        archivedElogs = [archived[filename] for filename in newFilenames
+                         if filename in archived]
+        if archivedElogs:
+            self.signals.elogsRead.emit(archivedElogs)
+            newFilenames = [filename for filename in newFilenames
+                            if filename not in archived]
+        if self._lazy:
+            self.signals.filenamesListed.emit(newFilenames)
+            return
+        batch, batchSize, lastBatch = [], self.minBatchSize, time.time()
+        elogs = self._index.elogs(newFilenames)
+        try:
+            for elog in elogs:
+                if self.isCancelled():
+                    break
+                batch.append(elog)
+                if (len(batch) >= batchSize or
+                        time.time() - lastBatch >= self.batchInterval):
+                    self.signals.elogsRead.emit(batch)
+                    batch, lastBatch = [], time.time()
+                    batchSize = min(2 * batchSize, self.maxBatchSize)
+        finally:
+            elogs.close()
+        if batch and not self.isCancelled():
+            self.signals.elogsRead.emit(batch)
+        if not self.isCancelled():
+            self._index.prune(self._elogpath, filenames)
+
+
+class EClassLoader(QtCore.QRunnable):
+
+    """Read the eclass of the `(row, filename)` in `requests` with an
+    `ElogIndex` on a thread of a `QThreadPool`.
+
+    """
+
+    class Signals(QtCore.QObject):
+
+        done = QtCore.Signal(list)
+
+    def __init__(self, index, requests):
+        super(EClassLoader, self).__init__()
+        self.setAutoDelete(False)
+        self.signals = self.Signals()
+        self._index = index
+        self._requests = requests
+
+    def __repr__(self):
+        return "elogviewer.%s(%r, <%i requests>)" % (
+            self.__class__.__name__, self._index, len(self._requests))
+
+    def run(self):
+        # An exception escaping a runnable aborts PyQt.
+        try:
+            eclasses = {elog.filename: elog.eclass
+                        for elog in self._index.elogs(
+                            filename for row, filename in self._requests)}
+        except Exception as exc:
+            logger.error("%s: %s" % (self._index.filename, exc))
+            eclasses = {}
+        self.signals.done.emit([(row, filename, eclasses[filename])
+                                for row, filename in self._requests
+                                if filename in eclasses])
+
+
+class ElogDeleter(QtCore.QRunnable):
+
+    """Delete the elogs in `filenames` on a thread of a `QThreadPool`.
+
+    The filenames deleted are reported in batches, every `batchInterval`,
+    and the `(filename, error)` of the elogs that could not be deleted
+    once done.  The files already gone count as deleted.  The archived
+    elogs are removed last, rewriting every archive once.
+
+    """
+
+    class Signals(QtCore.QObject):
+
+        deleted = QtCore.Signal(list)
+        done = QtCore.Signal(list)
+
+    batchInterval = 0.1  # seconds
+
+    def __init__(self, filenames):
+        super(ElogDeleter, self).__init__()
+        self.setAutoDelete(False)
+        self.signals = self.Signals()
+        self._filenames = filenames
+        self._cancelled = threading.Event()
+
+    def __repr__(self):
+        return "elogviewer.%s(<%i filenames>)" % (
+            self.__class__.__name__, len(self._filenames))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    @profiler.profiled("delete")
+    def run(self):
+        batch, errors, lastBatch = [], [], time.time()
+        archives = {}
+        for filename in self._filenames:
+            if self.isCancelled():
+                break
+            archived = _archiveMember(filename)
+            if archived is not None:
+                archives.setdefault(archived[0], []).append(filename)
+                continue
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                errors.append((filename, exc.strerror))
+                continue
+            batch.append(filename)
+            if time.time() - lastBatch >= self.batchInterval:
+                self.signals.deleted.emit(batch)
+                batch, lastBatch = [], time.time()
+        for archive, filenames in archives.items():
+            if self.isCancelled():
+                break
+            try:
+                ElogArchive(archive).remove(filenames)
+            except (OSError, zipfile.BadZipFile) as exc:
+                errors.extend((filename, str(exc)) for filename in filenames)
+            else:
+                batch.extend(filenames)
+        if batch:
+            self.signals.deleted.emit(batch)
+        self.signals.done.emit(errors)
+
+
+class HtmlPrefetcher(QtCore.QRunnable):
+
+    """Render elogs into `htmlCache` on a thread of a `QThreadPool`."""
+
+    def __init__(self, filenames):
+        super(HtmlPrefetcher, self).__init__()
+        self.setAutoDelete(False)
+        self._filenames = filenames
+        # Look the colors up in the GUI thread.
+        self._colors = dict((eclass, eclass.htmlColor()) for eclass in EClass)
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self._filenames)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isDone(self):
+        return self._done.is_set()
+
+    def run(self):
+        for filename in self._filenames:
+            if self._cancelled.is_set():
+                break
+            htmlCache.prefetch(filename, self._colors)
+        self._done.set()
+
+
+def _hasNestedRepeat(text):
+    """Return whether the regexp `text` repeats a repetition, as
+    `(a+)+` does, on which `re` may backtrack for ever.
+
+    """
+    def subpatterns(value):
+        if isinstance(value, sre_parse.SubPattern):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                for subpattern in subpatterns(item):
+                    yield subpattern
+
+    def nested(items, repeated):
+        for op, value in items:
+            if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                __, high, items = value
+                if high > 1 and repeated:
+                    return True
+                if nested(items, repeated or high > 1):
+                    return True
+            elif any(nested(subpattern, repeated)
+                     for subpattern in subpatterns(value)):
+                return True
+        return False
+
+    return nested(sre_parse.parse(text), False)
+
+
+class ElogFilter(QtCore.QRunnable):
+
+    """Match a search against the search keys of the elogs on a thread
+    of a `QThreadPool`.
+
+    The search is a case-insensitive regexp, or a plain substring if it
+    has no special character.  The fields of the search keys are on
+    lines of their own, which `^` and `$` anchor.  The matching stops
+    when it is cancelled or when it takes more than `timeLimit`; the
+    `regex` module, if it is installed, also interrupts a single match
+    that takes too long.  Without it, the time is checked between the
+    rows only, so the patterns with nested repetitions, which a single
+    match of `re` could never finish, are refused.
+
+    """
+
+    class Signals(QtCore.QObject):
+
+        failed = QtCore.Signal(str)
+        done = QtCore.Signal(object)
+
+    timeLimit = 2.0  # seconds
+    errors = (re.error,) if regex is None else (re.error, regex.error)
+
+    def __init__(self, filenames, keys, text):
+        super(ElogFilter, self).__init__()
+        self.setAutoDelete(False)
+        self.signals = self.Signals()
+        self._filenames = filenames
+        self._keys = keys
+        self._text = text
+        if re.search(r"[.^$*+?{}\[\]\\|()]", text):
+            # Raise the syntax errors in the calling thread.
+            self._pattern = (re if regex is None else regex).compile(
+                text, re.IGNORECASE | re.MULTILINE)
+            if regex is None and _hasNestedRepeat(text):
+                raise re.error("nested repetitions need the regex module")
+        else:
+            self._pattern = None
+        self._cancelled = threading.Event()
+
+    def __repr__(self):
+        return "elogviewer.%s(%r, %r, %r)" % (
+            self.__class__.__name__, self._filenames, self._keys, self._text)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    @profiler.profiled("filter")
+    def run(self):
+        deadline = time.time() + self.timeLimit
+        if self._pattern is None:
+            text = self._text.lower()
+            match = lambda key: text in key
+        elif regex is None:
+            match = self._pattern.search
+        else:
+            match = lambda key: self._pattern.search(
+                key, concurrent=True, timeout=max(0, deadline - time.time()))
+        filenames = set()
+        try:
+            for n, (filename, key) in enumerate(zip(self._filenames,
+                                                    self._keys)):
+                if not n % 1024:
+                    if self.isCancelled():
+                        break
+                    if time.time() > deadline:
+                        raise TimeoutError
+                if match(key):
+                    filenames.add(filename)
+        except TimeoutError:
+            self.signals.failed.emit(
+                "The search took more than %g seconds" % self.timeLimit)
+            filenames = None
+        self.signals.done.emit(None if self.isCancelled() else filenames)
 
 
 class TextToHtmlDelegate(QtWidgets.QItemDelegate):
@@ -352,12 +2666,24 @@ class Star(QtWidgets.QAbstractButton):
 
 class ButtonDelegate(QtWidgets.QStyledItemDelegate):
 
+    """Paint the check state of the cells with a hidden button.
+
+    The button is rendered once for every checked state, size, palette,
+    and device pixel ratio, and the pixmaps are reused until the style
+    or the palette of the button changes.
+
+    """
+
+    maxCachedPixmaps = 64
+
     def __init__(self, button=None, parent=None):
         super(ButtonDelegate, self).__init__(parent)
         self._btn = QtWidgets.QPushButton() if button is None else button
         self._btn.setCheckable(True)
         self._btn.setParent(parent)
         self._btn.hide()
+        self._btn.installEventFilter(self)
+        self._pixmaps = {}
 
     def __repr__(self):
         return "elogviewer.%s(button=%r, parent=%r)" % (
@@ -373,18 +2699,42 @@ class ButtonDelegate(QtWidgets.QStyledItemDelegate):
         data = Qt.Checked if editor.isChecked() else Qt.Unchecked
         model.setData(index, data, role=Qt.CheckStateRole)
 
+    def eventFilter(self, obj, event):
+        if event.type() in (QtCore.QEvent.PaletteChange,
+                            QtCore.QEvent.StyleChange):
+            self._pixmaps.clear()
+        return super(ButtonDelegate, self).eventFilter(obj, event)
+
+    def pixmap(self, checked, size):
+        """Return the button rendered with `size`, from the cache if
+        possible.
+
+        """
+        key = (type(self._btn), bool(checked), size.width(), size.height(),
+               self._btn.palette().cacheKey(),
+               # PyQt4 has no devicePixelRatioF().
+               getattr(self._btn, "devicePixelRatioF", lambda: 1.0)())
+        pixmap = self._pixmaps.get(key)
+        if pixmap is None:
+            self._btn.setChecked(bool(checked))
+            self._btn.resize(size)
+            try:
+                # PyQt5
+                pixmap = self._btn.grab()
+            except AttributeError:
+                # PyQt4
+                pixmap = QtGui.QPixmap.grabWidget(self._btn)
+            if len(self._pixmaps) >= self.maxCachedPixmaps:
+                self._pixmaps.clear()
+            if self.maxCachedPixmaps:
+                self._pixmaps[key] = pixmap
+        return pixmap
+
     def paint(self, painter, option, index):
-        self._btn.setChecked(index.data(role=Qt.CheckStateRole))
-        self._btn.setGeometry(option.rect)
         if option.state & QtWidgets.QStyle.State_Selected:
             painter.fillRect(option.rect, option.palette.highlight())
-        try:
-            # PyQt5
-            pixmap = self._btn.grab()
-        except AttributeError:
-            # PyQt4
-            pixmap = QtGui.QPixmap.grabWidget(self._btn)
-        painter.drawPixmap(option.rect.x(), option.rect.y(), pixmap)
+        painter.drawPixmap(option.rect.x(), option.rect.y(), self.pixmap(
+            index.data(role=Qt.CheckStateRole), option.rect.size()))
 
     def editorEvent(self, event, model, option, index):
         if (int(index.flags()) & Qt.ItemIsEditable and
@@ -393,6 +2743,8 @@ class ButtonDelegate(QtWidgets.QStyledItemDelegate):
              event.button() == Qt.LeftButton) or
             (event.type() == QtCore.QEvent.KeyPress and
              event.key() in (Qt.Key_Space, Qt.Key_Select))):
+                # The button is painted for the cells seldom.
+                self._btn.setChecked(bool(index.data(Qt.CheckStateRole)))
                 self._btn.toggle()
                 self.setModelData(self._btn, model, index)
                 self.commitData.emit(self._btn)
@@ -400,45 +2752,66 @@ class ButtonDelegate(QtWidgets.QStyledItemDelegate):
         return False
 
 
-class ElogRowItem(QtGui.QStandardItem):
+class ElogRow(object):
+
+    """Handle on a row of an `ElogModel`.
+
+    The handle is only valid until rows are inserted or removed.
+
+    """
+
+    def __init__(self, model=None, row=-1):
+        self._model = model
+        self._row = row
+
+    def __repr__(self):
+        return "elogviewer.%s(row=%r)" % (self.__class__.__name__, self._row)
 
-    def __init__(self, filename="", parent=None):
-        super(ElogRowItem, self).__init__(parent)
-        self._elog = Elog.fromFilename(filename) if filename else Elog(
-            "", None, None, time.localtime(), EClass.einfo)
-        self._readState = Qt.Unchecked
-        self._importantState = Qt.Unchecked
+    def isValid(self):
+        return (self._model is not None and
+                0 <= self._row < len(self._model.table))
 
-    def type(self):
-        return self.UserType + 1
+    def row(self):
+        return self._row
 
-    def clone(self):
-        return self.__class__()
+    def elog(self):
+        return self._model.table.elog(self._row) if self.isValid() else None
 
     def filename(self):
-        return self._elog.filename
+        return self._model.table.filename(self._row) if self.isValid() else ""
 
     def html(self):
+        if not self.isValid():
+            return ""
+        table = self._model.table
         header = "<h1>{category}/{package}</h1>".format(
-            category=self._elog.category,
-            package=self._elog.package,
+            category=table.category(self._row),
+            package=table.package(self._row),
         )
-        text = _html(self._elog.filename)
+        text = htmlCache.html(table.filename(self._row))
         return header + text
 
+    def _setState(self, column, state):
+        if self.isValid():
+            self._model.setData(self._model.index(self._row, column),
+                                state, Qt.CheckStateRole)
+
     def setReadState(self, state):
-        self._readState = state
-        self.emitDataChanged()
+        self._setState(Column.ReadState, state)
 
     def readState(self):
-        return self._readState
+        if not self.isValid():
+            return Qt.Unchecked
+        return self._model.checkStates[self._model.table.readState(self._row)]
 
     def setImportantState(self, state):
-        self._importantState = state
-        self.emitDataChanged()
+        self._setState(Column.ImportantState, state)
 
     def importantState(self):
-        return self._importantState
+        if not self.isValid():
+            return Qt.Unchecked
+        return self._model.checkStates[
+            self._model.table.importantState(self._row)]
 
     def isImportantState(self):
         return self.importantState() is Qt.Checked
@@ -448,64 +2821,313 @@ class ElogRowItem(QtGui.QStandardItem):
                                Qt.Checked)
 
 
-class ElogItem(QtGui.QStandardItem):
+class ElogModel(QtCore.QAbstractTableModel):
+
+    """Table model of the elogs in an `ElogTable`.
+
+    `countsChanged` is emitted when the number of elogs, of read elogs,
+    or of important elogs may have changed.
+
+    The filenames given to `appendFilenames` are exposed `pageSize` rows
+    at a time by `fetchMore`, from their names alone, newest first or
+    oldest first.  `eclassesRequested` is emitted with the `(row,
+    filename)` of the rows shown whose eclass is unknown, to be read
+    off the GUI thread and set with `setEClasses`.
+
+    `sort` reorders the table by the integer keys of a column, and the
+    rows appended are sorted with the others.  The rows are not moved
+    when their states change.
+
+    """
+
+    countsChanged = QtCore.Signal()
+    eclassesRequested = QtCore.Signal(list)
+
+    headerLabels = ("!!", "Category", "Package", "Read", "Highest\neclass",
+                    "Date")
+    checkStates = (Qt.Unchecked, Qt.PartiallyChecked, Qt.Checked)
+    # The view asks for seven roles per cell; the others return None.
+    roles = frozenset((Qt.DisplayRole, Qt.EditRole, Qt.CheckStateRole,
+                       Role.SortRole))
+    pageSize = 256
 
     def __init__(self, parent=None):
-        super(ElogItem, self).__init__(parent)
+        super(ElogModel, self).__init__(parent)
+        self.table = ElogTable()
+        # Sorted by date, oldest first.
+        self._pending = deque()
+        self._pendingFlags = ((), ())
+        self._newestFirst = True
+        self._sortOrder = None
+        # Whether the rows are still in the `_sortOrder`.
+        self._sorted = False
+        self._requested = set()
+        self._requests = []
+        self._requestTimer = QtCore.QTimer(self)
+        self._requestTimer.setSingleShot(True)
+        self._requestTimer.setInterval(0)
+        self._requestTimer.timeout.connect(self._requestEClasses)
 
-    def type(self):
-        return self.UserType + 2
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self.parent())
 
-    def clone(self):
-        return self.__class__()
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.table)
 
-    def __getattr__(self, name):
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(Column)
 
-        def verticalHeaderItem():
-            try:
-                item = self.model().verticalHeaderItem(self.row())
-            except AttributeError:
-                assert(self.model() is None)
-                item = None
-            return item if item else ElogRowItem()
-
-        return getattr(verticalHeaderItem(), name)
-
-    def setData(self, value, role=Qt.UserRole + 1):
-        if role == Qt.CheckStateRole:
-            return {
-                Column.ImportantState: self.setImportantState,
-                Column.ReadState: self.setReadState,
-            }.get(self.column(), lambda: None)(value)
-        super(ElogItem, self).setData(value, role)
-
-    def data(self, role=Qt.UserRole + 1):
-        elog = self._elog
-        if not elog:
-            return super(ElogItem, self).data(role)
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headerLabels[section]
+        return super(ElogModel, self).headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super(ElogModel, self).flags(index)
+        if index.column() == Column.ImportantState:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role not in self.roles or not index.isValid():
+            return None
+        row, column, table = index.row(), index.column(), self.table
         if role in (Qt.DisplayRole, Qt.EditRole):
-            return {
-                Column.Category: elog.category,
-                Column.Package: elog.package,
-                Column.Eclass: elog.eclass.name,
-                Column.Date: elog.localeTime,
-            }.get(self.column(), "")
+            if column == Column.Category:
+                return table.category(row)
+            elif column == Column.Package:
+                return table.package(row)
+            elif column == Column.Eclass:
+                eclass = table.eclass(row)
+                if eclass is None:
+                    self._requestEClass(row)
+                    return ""
+                return eclass.name
+            elif column == Column.Date:
+                return table.localeTime(row)
+            return ""
         elif role == Qt.CheckStateRole:
-            return {
-                Column.ImportantState: self.importantState,
-                Column.ReadState: self.readState,
-            }.get(self.column(), lambda: None)()
+            if column == Column.ReadState:
+                return self.checkStates[table.readState(row)]
+            elif column == Column.ImportantState:
+                return self.checkStates[table.importantState(row)]
         elif role == Role.SortRole:
-            if self.column() in (Column.ImportantState, Column.ReadState):
-                return self.data(Qt.CheckStateRole)
-            elif self.column() == Column.Date:
-                return elog.isoTime
-            elif self.column() == Column.Eclass:
-                return elog.eclass.value
-            else:
-                return self.data(Qt.DisplayRole)
+            if column == Column.ReadState:
+                return table.readState(row)
+            elif column == Column.ImportantState:
+                return table.importantState(row)
+            elif column == Column.Date:
+                return table.date(row)
+            elif column == Column.Eclass:
+                eclass = table.eclass(row)
+                return -1 if eclass is None else eclass.value
+            return self.data(index, Qt.DisplayRole)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        row, column = index.row(), index.column()
+        if column == Column.ReadState:
+            self.table.setReadState(row, value)
+        elif column == Column.ImportantState:
+            self.table.setImportantState(row, value)
         else:
-            return super(ElogItem, self).data(role)
+            return False
+        if self._sortOrder is not None and column == self._sortOrder[0]:
+            self._sorted = False
+        # The read state sets the font of the whole row.
+        self.dataChanged.emit(self.index(row, 0),
+                              self.index(row, self.columnCount() - 1))
+        self.countsChanged.emit()
+        return True
+
+    def readCount(self):
+        return self.table.readCount()
+
+    def unreadCount(self):
+        return self.table.unreadCount()
+
+    def importantCount(self):
+        return self.table.importantCount()
+
+    def itemFromIndex(self, index):
+        return ElogRow(self, index.row()) if index.isValid() else ElogRow()
+
+    def appendElogs(self, elogs, readFlag=(), importantFlag=()):
+        """Append `elogs` in one batch, see `ElogTable.extend`."""
+        elogs = list(elogs)
+        if not elogs:
+            return
+        row = len(self.table)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(elogs) - 1)
+        self.table.extend(elogs, readFlag, importantFlag)
+        self.endInsertRows()
+        if self._sortOrder is not None and self._sorted:
+            self._merge(row)
+        elif self._sortOrder is not None:
+            # Some rows changed in the sort column since they were sorted.
+            self.sort(*self._sortOrder)
+        self.countsChanged.emit()
+
+    def _merge(self, first):
+        """Merge the rows from `first` on into the sorted rows before
+        them, see `ElogTable.merge`.
+
+        """
+        column, order = self._sortOrder
+        rows, positions = self.table.mergeOrder(
+            column, first, order == Qt.DescendingOrder)
+        if positions[0] == first and all(
+                map(operator.eq, rows, range(first, len(self.table)))):
+            return  # Sorted already.
+        self.layoutAboutToBeChanged.emit([], self.VerticalSortHint)
+        newRows = self.table.merge(rows, positions)
+        indexes = self.persistentIndexList()
+        self.changePersistentIndexList(indexes, [self.index(
+            newRows[index.row() - first] if index.row() >= first else
+            index.row() + bisect_right(positions, index.row()),
+            index.column()) for index in indexes])
+        self.layoutChanged.emit([], self.VerticalSortHint)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort the rows by `column`, see `ElogTable.sortKeys`."""
+        if column < 0:
+            self._sortOrder = None
+            return
+        self._sortOrder = (column, order)
+        self._sorted = True
+        rows = self.table.sortedRows(column, order == Qt.DescendingOrder)
+        if all(map(operator.eq, rows, range(len(rows)))):
+            return  # Sorted already.
+        self.layoutAboutToBeChanged.emit([], self.VerticalSortHint)
+        self.table.reorder(rows)
+        newRows = array("l", bytes(8 * len(rows)))
+        for newRow, row in enumerate(rows):
+            newRows[row] = newRow
+        indexes = self.persistentIndexList()
+        self.changePersistentIndexList(indexes, [
+            self.index(newRows[index.row()], index.column())
+            for index in indexes])
+        self.layoutChanged.emit([], self.VerticalSortHint)
+
+    def appendFilenames(self, filenames, readFlag=(), importantFlag=()):
+        """Add `filenames` to the elogs exposed by `fetchMore`."""
+        if not filenames:
+            return
+        pending = list(self._pending)
+        pending.extend(filenames)
+        # The date ends the name and sorts as text.
+        pending.sort(key=lambda filename:
+                     os.path.basename(filename).rsplit(":", 1)[-1])
+        self._pending = deque(pending)
+        self._pendingFlags = (readFlag, importantFlag)
+
+    def pendingFilenames(self):
+        return list(self._pending)
+
+    def removePending(self, filenames):
+        """Drop `filenames` from the elogs not fetched yet."""
+        self._pending = deque(filename for filename in self._pending
+                              if filename not in filenames)
+
+    def setFetchOrder(self, newestFirst):
+        self._newestFirst = newestFirst
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and bool(self._pending)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        pop = self._pending.pop if self._newestFirst else self._pending.popleft
+        page = [pop() for __ in range(min(self.pageSize, len(self._pending)))]
+        self.appendElogs(Elog.parseAll(Elog.fromName, page),
+                         *self._pendingFlags)
+
+    def _requestEClass(self, row):
+        filename = self.table.filename(row)
+        if filename not in self._requested:
+            self._requested.add(filename)
+            self._requests.append((row, filename))
+            self._requestTimer.start()
+
+    def cancelEClassRequests(self):
+        """Drop the eclass requests not emitted yet."""
+        self._requestTimer.stop()
+        self._requests = []
+
+    def _requestEClasses(self):
+        requests, self._requests = self._requests, []
+        if requests:
+            self.eclassesRequested.emit(requests)
+
+    def setEClasses(self, eclasses):
+        """Set the eclass of the `(row, filename, eclass)` in `eclasses`
+        if the row still shows the file.
+
+        """
+        for row, filename, eclass in eclasses:
+            self._requested.discard(filename)
+            if (row >= len(self.table) or
+                    self.table.filename(row) != filename):
+                continue  # Removed or moved.
+            self.table.setEClass(row, eclass)
+            if (self._sortOrder is not None and
+                    self._sortOrder[0] == Column.Eclass):
+                self._sorted = False
+            index = self.index(row, Column.Eclass)
+            self.dataChanged.emit(index, index)
+
+    def removeRows(self, row, count, parent=QtCore.QModelIndex()):
+        if (parent.isValid() or count <= 0 or row < 0 or
+                row + count > len(self.table)):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        self.table.remove(row, count)
+        self.endRemoveRows()
+        self.countsChanged.emit()
+        return True
+
+    def clear(self):
+        self.beginResetModel()
+        self.table.clear()
+        self._pending.clear()
+        self._requested.clear()
+        self._requests = []
+        self.endResetModel()
+        self.countsChanged.emit()
+
+
+class ElogFilterProxyModel(QtCore.QSortFilterProxyModel):
+
+    """Filter the elogs with a set of filenames."""
+
+    def __init__(self, parent=None):
+        super(ElogFilterProxyModel, self).__init__(parent)
+        self._filenames = None
+
+    def __repr__(self):
+        return "elogviewer.%s(%r)" % (self.__class__.__name__, self.parent())
+
+    def filenames(self):
+        return self._filenames
+
+    def setFilenames(self, filenames):
+        """Only accept the elogs in `filenames`, or all if it is None."""
+        self._filenames = filenames
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        return (self._filenames is None or
+                self.sourceModel().table.filename(sourceRow) in
+                self._filenames)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # The source model sorts by integer keys, much faster than the
+        # proxy comparing the data of the rows.
+        with profiler.span("sort"):
+            self.sourceModel().sort(column, order)
 
 
 class ElogviewerUi(QtWidgets.QMainWindow):
@@ -547,39 +3169,100 @@ class ElogviewerUi(QtWidgets.QMainWindow):
         self.statusBar().addWidget(self.statusLabel)
         self.unreadLabel = QtWidgets.QLabel(self.statusBar())
         self.statusBar().addWidget(self.unreadLabel)
+        self.scanProgressBar = QtWidgets.QProgressBar(self.statusBar())
+        self.scanProgressBar.setFormat("Reading elogs: %v of %m")
+        self.scanProgressBar.hide()
+        self.statusBar().addPermanentWidget(self.scanProgressBar)
+        self.cancelScanButton = QtWidgets.QToolButton(self.statusBar())
+        self.cancelScanButton.setText("Cancel")
+        self.cancelScanButton.setIcon(
+            QtGui.QIcon.fromTheme("process-stop"))
+        self.cancelScanButton.hide()
+        self.statusBar().addPermanentWidget(self.cancelScanButton)
 
 
 class Elogviewer(ElogviewerUi):
 
+    watchDelay = 0.5  # seconds
+    watchMaxDelay = 2.0  # seconds
+    stateFlushDelay = 1.0  # seconds
+    searchDelay = 0.2  # seconds
+    # Minimal number of elogs deleted on a thread of the pool.
+    deleteThreshold = 64
+
     def __init__(self, config):
         super(Elogviewer, self).__init__()
         self.config = config
+        self.index = ElogIndex(jobs=getattr(config, "jobs", None))
+        if getattr(config, "html_cache", None) is not None:
+            htmlCache.maxBytes = config.html_cache << 20
+        self._scanner = None
+        self._runningScanners = set()
+        self._eclassLoaders = set()
+        self._closed = False
+        # The running deleters and their progress dialogs.
+        self._deleters = {}
+        self._scanRow = 0
+        self._scanCount = 0
+        self.prefetchDepth = getattr(config, "prefetch", None)
+        if self.prefetchDepth is None:
+            self.prefetchDepth = 2
+        self.prefetchPool = QtCore.QThreadPool(self)
+        self.prefetchPool.setMaxThreadCount(1)
+        self._prefetchers = []
+        self._filter = None
+        self._runningFilters = set()
         self.settings = QtCore.QSettings("elogviewer", "elogviewer")
-        if not self.settings.contains("readFlag"):
-            self.settings.setValue("readFlag", set())
-        if not self.settings.contains("importantFlag"):
-            self.settings.setValue("importantFlag", set())
+        self.stateStore = ElogStateStore()
+        if (self.settings.contains("readFlag") or
+                self.settings.contains("importantFlag")):
+            # Move the states stored by elogviewer 2.6.
+            self.stateStore.migrate(self.settings.value("readFlag") or set(),
+                                    self.settings.value("importantFlag") or
+                                    set())
+            self.settings.remove("readFlag")
+            self.settings.remove("importantFlag")
+        self._stateTimer = QtCore.QTimer(self)
+        self._stateTimer.setSingleShot(True)
+        self._stateTimer.setInterval(int(1000 * self.stateFlushDelay))
+        self._stateTimer.timeout.connect(self.stateStore.flush)
         if self.settings.contains("windowWidth") and self.settings.contains("windowHeight"):
             self.resize(int(self.settings.value("windowWidth")), int(self.settings.value("windowHeight")))
         else:
             screenSize = QtWidgets.QApplication.desktop().screenGeometry()
-            self.resize(screenSize.width() / 2, screenSize.height() / 2)
+            self.resize(screenSize.width() // 2, screenSize.height() // 2)
+        startupProfile.mark("settings")
 
-        self.model = QtGui.QStandardItemModel(self.tableView)
-        # Use QStandardItem for horizontal headers
-        self.model.setHorizontalHeaderLabels(
-            ["!!", "Category", "Package", "Read", "Highest\neclass", "Date"])
-        # Then default to ElogItem -- else, the labels are not displayed
-        self.model.setItemPrototype(ElogItem())
+        self.model = ElogModel(self.tableView)
+        self.model.countsChanged.connect(self.updateStatus)
+        self.model.countsChanged.connect(self.updateUnreadCount)
+        self.model.dataChanged.connect(self._onDataChanged)
+        self.model.eclassesRequested.connect(self._loadEClasses)
+        self.model.rowsInserted.connect(self._onRowsInserted)
 
-        self.proxyModel = QtCore.QSortFilterProxyModel(self.tableView)
-        self.proxyModel.setFilterKeyColumn(-1)
+        self.proxyModel = ElogFilterProxyModel(self.tableView)
         self.proxyModel.setSourceModel(self.model)
+        # Connect before the selection model of the view does: it moves
+        # the current row away from the rows being removed.
+        self._removingRows = False
+        self._rowChanges = []
+        self._rowChangeTimer = QtCore.QTimer(self)
+        self._rowChangeTimer.setSingleShot(True)
+        self._rowChangeTimer.setInterval(0)
+        self._rowChangeTimer.timeout.connect(self._updateReadStates)
+        self.proxyModel.rowsAboutToBeRemoved.connect(
+            partial(setattr, self, "_removingRows", True))
+        self.proxyModel.rowsRemoved.connect(
+            partial(setattr, self, "_removingRows", False))
         self.tableView.setModel(self.proxyModel)
 
         self.proxyModel.setSortRole(Role.SortRole)
         horizontalHeader = self.tableView.horizontalHeader()
         horizontalHeader.sortIndicatorChanged.connect(self.proxyModel.sort)
+        # Fetch the elogs that sort first by date.
+        horizontalHeader.sortIndicatorChanged.connect(
+            lambda column, order: self.model.setFetchOrder(
+                column != Column.Date or order == Qt.DescendingOrder))
 
         self.__setupTableColumnDelegates()
         self.tableView.setItemDelegate(ReadFontStyleDelegate(self.tableView))
@@ -601,10 +3284,54 @@ class Elogviewer(ElogviewerUi):
 
         self.searchLineEdit = QtWidgets.QLineEdit(self.toolBar)
         self.searchLineEdit.setPlaceholderText("search")
+        self.searchLineEdit.setToolTip(
+            "Search the columns, or query them with terms such as "
+            "eclass>=warn, category:dev-*, date:2015-01..2015-02, unread, "
+            "or important")
+        self._searchTimer = QtCore.QTimer(self)
+        self._searchTimer.setSingleShot(True)
+        self._searchTimer.setInterval(int(1000 * self.searchDelay))
+        self._searchTimer.timeout.connect(
+            lambda: self.search(self.searchLineEdit.text()))
+        # Search when the typing pauses or on return.
         self.searchLineEdit.textEdited.connect(
-            self.proxyModel.setFilterRegExp)
+            lambda text: self._searchTimer.start())
+        self.searchLineEdit.returnPressed.connect(self._searchTimer.timeout)
         self.toolBar.addWidget(self.searchLineEdit)
 
+        self.contentSearchAction = QtWidgets.QAction("Content", self.toolBar)
+        self.contentSearchAction.setIcon(QtGui.QIcon.fromTheme("edit-find"))
+        self.contentSearchAction.setCheckable(True)
+        self.contentSearchAction.setToolTip("Search the text of the elogs")
+        self.contentSearchAction.toggled.connect(
+            lambda checked: self.search(self.searchLineEdit.text()))
+        self.toolBar.addAction(self.contentSearchAction)
+
+        self.cancelScanButton.clicked.connect(self.cancelScan)
+
+        self._profileTimer = QtCore.QTimer(self)
+        self._profileTimer.setInterval(1000)
+        if profiler.enabled:
+            self._addProfilePanel()
+
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._onDirectoryChanged)
+        self._watchTimer = QtCore.QTimer(self)
+        self._watchTimer.setSingleShot(True)
+        self._watchTimer.timeout.connect(self._onWatchTimeout)
+        self._watchDeadline = 0.0
+        self.watchAction.toggled.connect(self._onWatchToggled)
+        self.setWatching(getattr(config, "watch", False) or
+                         self.settings.value("watch") in (True, "true"))
+
+        if getattr(config, "query", None):
+            # Filter the elogs as they are read.
+            self.searchLineEdit.setText(config.query)
+            self.search(config.query)
+        self._profilingStartup = getattr(config, "startup_profile", False)
+        if self._profilingStartup:
+            # Wait for the first visible row.
+            self.tableView.viewport().installEventFilter(self)
         self.populate()
         if self.settings.contains("sortColumn") and self.settings.contains("sortOrder"):
             self.tableView.sortByColumn(int(self.settings.value("sortColumn")), int(self.settings.value("sortOrder")))
@@ -636,6 +3363,12 @@ class Elogviewer(ElogviewerUi):
         self.refreshAction.triggered.connect(self.refresh)
         self.toolBar.addAction(self.refreshAction)
 
+        self.watchAction = QtWidgets.QAction("Watch", self.toolBar)
+        self.watchAction.setIcon(Icon("view-refresh"))
+        self.watchAction.setCheckable(True)
+        self.watchAction.setToolTip("Refresh when elogs are written")
+        self.toolBar.addAction(self.watchAction)
+
         self.markReadAction = QtWidgets.QAction("Mark read", self.toolBar)
         self.markReadAction.setIcon(Icon("mail-mark-read"))
         self.markReadAction.triggered.connect(partial(
@@ -661,7 +3394,8 @@ class Elogviewer(ElogviewerUi):
         self.deleteAction.setIcon(Icon("edit-delete"))
         self.deleteAction.setShortcut(QtGui.QKeySequence.Delete)
         setToolTip(self.deleteAction)
-        self.deleteAction.triggered.connect(self.deleteSelected)
+        # The profiled slot must not be passed `checked`.
+        self.deleteAction.triggered.connect(lambda: self.deleteSelected())
         self.toolBar.addAction(self.deleteAction)
 
         self.aboutAction = QtWidgets.QAction("About", self.toolBar)
@@ -705,35 +3439,171 @@ class Elogviewer(ElogviewerUi):
         self.quitAction.triggered.connect(self.close)
         self.toolBar.addAction(self.quitAction)
 
+    @profiler.profiled("saveSettings")
     def saveSettings(self):
-        readFlag = set()
-        importantFlag = set()
-        for row in range(self.model.rowCount()):
-            item = self.model.item(row, Column.ReadState)
-            if item.readState() is Qt.Checked:
-                readFlag.add(item.filename())
-            if item.importantState() is Qt.Checked:
-                importantFlag.add(item.filename())
-        self.settings.setValue("readFlag", readFlag)
-        self.settings.setValue("importantFlag", importantFlag)
+        self._stateTimer.stop()
+        self.stateStore.flush()
         self.settings.setValue("sortColumn", self.tableView.horizontalHeader().sortIndicatorSection())
         self.settings.setValue("sortOrder", self.tableView.horizontalHeader().sortIndicatorOrder())
         self.settings.setValue("windowWidth", self.width())
         self.settings.setValue("windowHeight", self.height())
+        self.settings.setValue("watch", self.isWatching())
+
+    def _addProfilePanel(self):
+        """Show the `profiler.report` in a dock, updated every second."""
+        self.profileText = QtWidgets.QPlainTextEdit(self)
+        self.profileText.setReadOnly(True)
+        font = QtGui.QFont("monospace")
+        font.setStyleHint(QtGui.QFont.TypeWriter)
+        self.profileText.setFont(font)
+        dock = QtWidgets.QDockWidget("Profile", self)
+        dock.setObjectName("profileDock")
+        dock.setWidget(self.profileText)
+        self.addDockWidget(Qt.BottomDockWidgetArea, dock)
+        self._profileTimer.timeout.connect(
+            lambda: self.profileText.setPlainText(profiler.report()))
+        self._profileTimer.start()
 
     def closeEvent(self, closeEvent):
+        self._rowChangeTimer.stop()
+        self._profileTimer.stop()
+        self._searchTimer.stop()
+        if self._filter is not None:
+            self._filter.cancel()
+        for deleter in self._deleters:
+            deleter.cancel()
         self.saveSettings()
+        self.cancelScan()
+        for prefetcher in self._prefetchers:
+            prefetcher.cancel()
+        # No eclass is loaded from the index once it is closed.
+        self._closed = True
+        self.model.cancelEClassRequests()
+        self.prefetchPool.waitForDone()
+        QtCore.QThreadPool.globalInstance().waitForDone()
+        self.index.close()
+        self.stateStore.close()
         super(Elogviewer, self).closeEvent(closeEvent)
 
+    def _onDataChanged(self, topLeft, bottomRight, roles=()):
+        if topLeft.column() == bottomRight.column() == Column.Eclass:
+            return  # Read by `_loadEClasses`.
+        # Otherwise, only the read and important states are changed.
+        table = self.model.table
+        for row in range(topLeft.row(), bottomRight.row() + 1):
+            self.stateStore.setFlags(
+                table.filename(row),
+                table.readState(row) == table.Checked,
+                table.importantState(row) == table.Checked)
+        self._stateTimer.start()
+
     def onCurrentRowChanged(self, current, previous):
-        if (previous.row() != -1):
-            currentItem, previousItem = map(_itemFromIndex, (current, previous))
+        current, previous = (QtCore.QPersistentModelIndex(_sourceIndex(index))
+                             for index in (current, previous))
+        self._rowChanges.append((current, previous))
+        if self._removingRows:
+            # The proxy model must not see changes while it removes rows.
+            self._rowChangeTimer.start()
+        else:
+            self._updateReadStates()
+        self.updateStatus()
+
+    def _updateReadStates(self):
+        rowChanges, self._rowChanges = self._rowChanges, []
+        for current, previous in rowChanges:
+            currentItem, previousItem = (
+                _itemFromIndex(QtCore.QModelIndex(index))
+                for index in (current, previous))
             if currentItem.readState() is Qt.Unchecked:
                 currentItem.setReadState(Qt.PartiallyChecked)
             if previousItem.readState() is Qt.PartiallyChecked:
                 previousItem.setReadState(Qt.Checked)
-        self.updateStatus()
-        self.updateUnreadCount()
+        self.prefetch(self.currentRow())
+
+    def prefetch(self, row):
+        """Render the elogs around `row` of the view in the background.
+
+        The `prefetchDepth` next and previous rows are rendered, nearest
+        first, and the rendering stops when the current row changes.
+
+        """
+        for prefetcher in self._prefetchers:
+            prefetcher.cancel()
+        # Keep the prefetchers alive until they are done.
+        self._prefetchers = [prefetcher for prefetcher in self._prefetchers
+                             if not prefetcher.isDone()]
+        if row < 0 or self.prefetchDepth <= 0:
+            return
+        filenames = []
+        for offset in range(1, self.prefetchDepth + 1):
+            for neighbour in (row + offset, row - offset):
+                if 0 <= neighbour < self.rowCount():
+                    filenames.append(_itemFromIndex(
+                        self.proxyModel.index(neighbour, 0)).filename())
+        prefetcher = HtmlPrefetcher(filenames)
+        self._prefetchers.append(prefetcher)
+        self.prefetchPool.start(prefetcher)
+
+    def search(self, text):
+        """Filter the elogs with `text`.
+
+        `text` is an `ElogQuery` if it has query terms, otherwise it is
+        matched against the columns by an `ElogFilter`.  In content
+        search mode, its words are looked up in the text of the elogs.
+        The rows are filtered at once when the search is done.
+
+        """
+        self._searchTimer.stop()
+        if self._filter is not None:
+            self._filter.cancel()
+            self._filter = None
+        if not text.strip():
+            self.proxyModel.setFilenames(None)
+        elif self.contentSearchAction.isChecked():
+            # The index is keyed by absolute path.
+            elogpath = self.config.elogpath
+            absElogpath = os.path.abspath(elogpath)
+            self.proxyModel.setFilenames(set(
+                os.path.join(elogpath, os.path.relpath(path, absElogpath))
+                for path in self.index.search(text)))
+        elif ElogQuery.isQuery(text):
+            try:
+                query = ElogQuery(text)
+            except ValueError as exc:
+                self.statusBar().showMessage("Invalid query: %s" % exc, 5000)
+                return
+            self.proxyModel.setFilenames(query.filenames(self.model.table))
+        else:
+            table = self.model.table
+            try:
+                elogFilter = ElogFilter(table.filenames(), table.searchKeys(),
+                                        text)
+            except ElogFilter.errors as exc:
+                self.statusBar().showMessage("Invalid search: %s" % exc, 5000)
+                return
+            elogFilter.signals.failed.connect(
+                partial(self._onFilterFailed, elogFilter))
+            elogFilter.signals.done.connect(
+                partial(self._onFilterDone, elogFilter))
+            self._filter = elogFilter
+            # Keep the cancelled filters alive until they are done.
+            self._runningFilters.add(elogFilter)
+            QtCore.QThreadPool.globalInstance().start(elogFilter)
+
+    def isSearching(self):
+        return self._searchTimer.isActive() or self._filter is not None
+
+    def _onFilterFailed(self, elogFilter, message):
+        if elogFilter is self._filter:
+            self.statusBar().showMessage(message, 5000)
+
+    def _onFilterDone(self, elogFilter, filenames):
+        self._runningFilters.discard(elogFilter)
+        if elogFilter is not self._filter:
+            return
+        self._filter = None
+        if filenames is not None:
+            self.proxyModel.setFilenames(filenames)
 
     def updateStatus(self):
         text = "%i of %i elogs" % (self.currentRow() + 1, self.elogCount())
@@ -754,103 +3624,286 @@ class Elogviewer(ElogviewerUi):
         return self.model.rowCount()
 
     def readCount(self):
-        count = 0
-        for row in range(self.model.rowCount()):
-            if self.model.item(row, 0).readState() is not Qt.Unchecked:
-                count += 1
-        return count
+        return self.model.readCount()
 
     def unreadCount(self):
-        return self.elogCount() - self.readCount()
+        return self.model.unreadCount()
 
     def setSelectedReadState(self, state):
         for index in self.tableView.selectionModel().selectedIndexes():
             _itemFromIndex(index).setReadState(state)
-        self.updateUnreadCount()
 
     def importantCount(self):
-        count = 0
-        for row in range(self.model.rowCount()):
-            if self.model.item(row, 0).importantState() is Qt.Checked:
-                count += 1
-        return count
+        return self.model.importantCount()
 
     def toggleSelectedImportantState(self):
         for index in self.tableView.selectionModel().selectedRows(
                 Column.ImportantState):
             _itemFromIndex(index).toggleImportantState()
 
+    @profiler.profiled("deleteSelected")
     def deleteSelected(self):
-        selection = [self.proxyModel.mapToSource(idx) for idx in
+        """Delete the selected elogs, on a thread of the pool if there
+        are `deleteThreshold` or more.
+
+        """
+        filenames = [self.model.table.filename(_sourceIndex(index).row())
+                     for index in
                      self.tableView.selectionModel().selectedRows()]
-        selection.sort(key=lambda idx: idx.row())
+        if not filenames:
+            return
         # Avoid call to onCurrentRowChanged() by clearing
         # selection with reset().
         currentRow = self.currentRow()
         self.tableView.selectionModel().reset()
 
-        for index in reversed(selection):
-            # [Fonic] Check for errors when removing logfile. This is
-            #         important if elogviewer is run by an unprivileged
-            #         user who lacks proper permissions. Also, don't care
-            #         if logfile already got deleted
-            try:
-                if os.path.exists(filename):
-                    os.remove(self.model.itemFromIndex(index).filename())
-                self.model.removeRow(index.row())
-            except IOError as ioerr:
-                QtWidgets.QMessageBox.critical(self, "Error", "Error while trying to delete '%s':<br><b>%s</b>" % (self.model.itemFromIndex(index).filename(), ioerr.strerror))
-
-        self.tableView.selectRow(min(currentRow, self.rowCount() - 1))
+        deleter = ElogDeleter(filenames)
+        deleter.signals.deleted.connect(self._removeFilenames)
+        deleter.signals.done.connect(
+            partial(self._onDeleteDone, deleter, currentRow))
+        if len(filenames) < self.deleteThreshold:
+            self._deleters[deleter] = None
+            deleter.run()
+            return
+        progress = QtWidgets.QProgressDialog(
+            "Deleting %i elogs..." % len(filenames), "Cancel",
+            0, len(filenames), self)
+        progress.setMinimumDuration(500)
+        progress.setValue(0)
+        progress.canceled.connect(deleter.cancel)
+        deleter.signals.deleted.connect(
+            lambda batch: progress.setValue(progress.value() + len(batch)))
+        self._deleters[deleter] = progress
+        QtCore.QThreadPool.globalInstance().start(deleter)
+
+    def isDeleting(self):
+        return any(progress is not None
+                   for progress in self._deleters.values())
+
+    def _onDeleteDone(self, deleter, currentRow, errors):
+        progress = self._deleters.pop(deleter)
+        if progress is not None:
+            progress.close()
+            progress.deleteLater()
+        if self.currentRow() == -1:
+            self.tableView.selectRow(min(currentRow, self.rowCount() - 1))
         self.updateStatus()
+        if not errors:
+            return
+        # [Fonic] Check for errors when removing logfile. This is
+        #         important if elogviewer is run by an unprivileged
+        #         user who lacks proper permissions.
+        if len(errors) == 1:
+            text = ("Error while trying to delete '%s':<br><b>%s</b>" %
+                    errors[0])
+        else:
+            text = "Error while trying to delete %i elogs." % len(errors)
+        messageBox = QtWidgets.QMessageBox(
+            QtWidgets.QMessageBox.Critical, "Error", text,
+            QtWidgets.QMessageBox.Ok, self)
+        messageBox.setDetailedText("\n".join(
+            "%s: %s" % error for error in errors))
+        messageBox.setAttribute(Qt.WA_DeleteOnClose)
+        messageBox.open()
 
     def refresh(self):
+        """Add the new elogs and remove the deleted ones."""
         self.saveSettings()
-        self.populate()
+        if self.isScanning():
+            self.populate()
+            return
+        self._startScan(set(self.model.table.filenames()) |
+                        set(self.model.pendingFilenames()))
+
+    def isScanning(self):
+        return self._scanner is not None
+
+    def cancelScan(self):
+        if self._scanner is not None:
+            self._scanner.cancel()
 
     def populate(self):
-        currentRow = self.currentRow()
+        self.cancelScan()
         self.tableView.selectionModel().reset()
-        self.model.beginResetModel()
-        # Clear
-        self.model.removeRows(0, self.model.rowCount())
-        # Populate
-        for row, filename in enumerate(
-                glob(os.path.join(self.config.elogpath, "*:*:*.log*")) +
-                glob(os.path.join(self.config.elogpath, "*", "*:*.log*"))):
-            elogRowItem = ElogRowItem(filename)
-            elogRowItem.setReadState(
-                Qt.Checked
-                if filename in self.settings.value("readFlag")
-                else Qt.Unchecked)
-            elogRowItem.setImportantState(
-                Qt.Checked
-                if filename in self.settings.value("importantFlag")
-                else Qt.Unchecked)
-            self.model.setVerticalHeaderItem(row, elogRowItem)
-            for column in range(self.model.columnCount()):
-                item = ElogItem()
-                item.setEditable(column == Column.ImportantState)
-                self.model.setItem(row, column, item)
-        self.model.endResetModel()
-        self.tableView.selectRow(min(currentRow, self.rowCount() - 1))
-
-
-def main():
-    parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("-p", "--elogpath", help="path to the elog directory")
-    parser.add_argument("--log", choices="DEBUG INFO WARNING ERROR".split(),
-                        default="WARNING", help="set logging level")
-    config = parser.parse_args()
-    if portage and not config.elogpath:
-        logdir = portage.settings.get(
-            "PORT_LOGDIR",
-            os.path.join(os.sep, portage.settings["EPREFIX"],
-                         *"var/log/portage".split("/")))
-        config.elogpath = os.path.join(logdir, "elog")
-    else:
-        config.elogpath = ""
-    logger.setLevel(getattr(logging, config.log))
+        self.model.clear()
+        self._startScan()
+
+    def _startScan(self, known=None):
+        self._scanRow = max(0, self.currentRow())
+        self._scanCount = 0
+        # The few new elogs of a refresh are read at once.
+        scanner = ElogScanner(self.index, self.config.elogpath, known,
+                              getattr(self.config, "lazy", False) and
+                              known is None)
+        scanner.signals.listed.connect(self.scanProgressBar.setMaximum)
+        scanner.signals.filenamesListed.connect(
+            partial(self._onFilenamesListed, scanner))
+        scanner.signals.elogsRemoved.connect(
+            partial(self._onElogsRemoved, scanner))
+        scanner.signals.elogsRead.connect(
+            partial(self._onElogsRead, scanner))
+        scanner.signals.done.connect(partial(self._onScanDone, scanner))
+        self._scanner = scanner
+        # Keep the cancelled scanners alive until they are done.
+        self._runningScanners.add(scanner)
+        self.scanProgressBar.setRange(0, 0)
+        self.scanProgressBar.setValue(0)
+        self.scanProgressBar.show()
+        self.cancelScanButton.show()
+        QtCore.QThreadPool.globalInstance().start(scanner)
+
+    def _topIndex(self):
+        return _sourceIndex(self.tableView.indexAt(QtCore.QPoint(0, 0)))
+
+    def _scrollToTop(self, index):
+        if index.isValid():
+            self.tableView.scrollTo(self.proxyModel.mapFromSource(index),
+                                    self.tableView.PositionAtTop)
+
+    def _onElogsRemoved(self, scanner, filenames):
+        if scanner is not self._scanner:
+            return  # Stale scan.
+        self._removeFilenames(filenames)
+
+    def _removeFilenames(self, filenames):
+        """Remove the rows of `filenames`, by contiguous ranges."""
+        filenames = set(filenames)
+        self.model.removePending(filenames)
+        rows = [row for row, filename in
+                enumerate(self.model.table.filenames())
+                if filename in filenames]
+        topIndex = QtCore.QPersistentModelIndex(self._topIndex())
+        # Remove contiguous ranges from the last one to keep the rows valid.
+        while rows:
+            last = first = rows.pop()
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+            self.model.removeRows(first, last - first + 1)
+        self._scrollToTop(QtCore.QModelIndex(topIndex))
+
+    def _onElogsRead(self, scanner, elogs):
+        if scanner is not self._scanner:
+            return  # Stale scan.
+        topIndex = QtCore.QPersistentModelIndex(self._topIndex())
+        self.model.appendElogs(elogs, self.stateStore.readFlag,
+                               self.stateStore.importantFlag)
+        self._scrollToTop(QtCore.QModelIndex(topIndex))
+        self._scanCount += len(elogs)
+        self.scanProgressBar.setValue(self._scanCount)
+        startupProfile.mark("first rows")
+        if self.currentRow() == -1 and self.model.rowCount() > self._scanRow:
+            self.tableView.selectRow(self._scanRow)
+
+    def _onFilenamesListed(self, scanner, filenames):
+        if scanner is not self._scanner:
+            return  # Stale scan.
+        self.model.appendFilenames(filenames, self.stateStore.readFlag,
+                                   self.stateStore.importantFlag)
+        self.model.fetchMore()
+        self.scanProgressBar.setValue(len(filenames))
+        startupProfile.mark("first rows")
+
+    def _onRowsInserted(self, parent, first, last):
+        if self.proxyModel.filenames() is not None:
+            # Search the new elogs as well.
+            self._searchTimer.start()
+
+    def _loadEClasses(self, requests):
+        if self._closed:
+            return
+        loader = EClassLoader(self.index, requests)
+        loader.signals.done.connect(partial(self._onEClassesLoaded, loader))
+        # Keep the loaders alive until they are done.
+        self._eclassLoaders.add(loader)
+        QtCore.QThreadPool.globalInstance().start(loader)
+
+    def _onEClassesLoaded(self, loader, eclasses):
+        self._eclassLoaders.discard(loader)
+        self.model.setEClasses(eclasses)
+
+    def _onScanDone(self, scanner, cancelled):
+        self._runningScanners.discard(scanner)
+        if scanner is not self._scanner:
+            return
+        self._scanner = None
+        self.scanProgressBar.hide()
+        self.cancelScanButton.hide()
+        if not cancelled and self.model.rowCount():
+            # An unreadable directory must not drop every state.
+            self.stateStore.compact(self.config.elogpath,
+                                    self.model.table.filenames() +
+                                    self.model.pendingFilenames())
+        if self.currentRow() == -1:
+            self.tableView.selectRow(min(self._scanRow, self.rowCount() - 1))
+        if self.isWatching():
+            self._watchDirectories()
+        startupProfile.mark("scan")
+        self._reportStartup()
+
+    def eventFilter(self, obj, event):
+        if (event.type() == QtCore.QEvent.Paint and
+                obj is self.tableView.viewport() and self.rowCount()):
+            # Painted when the event is done.
+            QtCore.QTimer.singleShot(0, self._onFirstPaint)
+            obj.removeEventFilter(self)
+        return super(Elogviewer, self).eventFilter(obj, event)
+
+    def _onFirstPaint(self):
+        startupProfile.mark("first paint")
+        self._reportStartup()
+
+    def _reportStartup(self):
+        if (self._profilingStartup and "first paint" in startupProfile and
+                "scan" in startupProfile):
+            self._profilingStartup = False
+            startupProfile.report()
+
+    def isWatching(self):
+        return self.watchAction.isChecked()
+
+    def setWatching(self, watching):
+        self.watchAction.setChecked(watching)
+
+    def _onWatchToggled(self, watching):
+        if watching:
+            self._watchDirectories()
+        else:
+            self._watchTimer.stop()
+            if self.watcher.directories():
+                self.watcher.removePaths(self.watcher.directories())
+
+    def _watchDirectories(self):
+        # Also watch the category directories of the
+        # `category/package:date.log` elogs.
+        paths = set(os.path.normpath(path) for path in
+                    [self.config.elogpath] +
+                    glob(os.path.join(self.config.elogpath, "*", ""))
+                    if os.path.isdir(path))
+        paths.difference_update(self.watcher.directories())
+        if paths:
+            self.watcher.addPaths(sorted(paths))
+
+    def _onDirectoryChanged(self, path):
+        # Coalesce the events over `watchDelay` but refresh at least
+        # every `watchMaxDelay` during a write storm.
+        now = time.time()
+        if not self._watchTimer.isActive():
+            self._watchDeadline = now + self.watchMaxDelay
+        self._watchTimer.start(int(1000 * max(
+            0, min(self.watchDelay, self._watchDeadline - now))))
+
+    def _onWatchTimeout(self):
+        if self.isScanning():
+            self._watchDeadline = time.time() + self.watchMaxDelay
+            self._watchTimer.start(int(1000 * self.watchDelay))
+        else:
+            self.refresh()
+
+
+def main(config=None):
+    config = _parseArguments() if config is None else config
+    if _isCommandLine(config):
+        sys.exit(cli(config=config))
 
     app = QtWidgets.QApplication(sys.argv)
     app.setWindowIcon(QtGui.QIcon.fromTheme("applications-system"))
@@ -861,4 +3914,4 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    main()
+    main(_config)
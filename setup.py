@@ -20,6 +20,7 @@ setup(name="elogviewer",
           Development Status :: 5 - Production/Stable
           License :: OSI Approved :: GNU General Public License v2 (GPLv2)
           Programming Language :: Python :: 3
+          Environment :: Console
           Environment :: X11 Applications :: Qt
           """)
      )
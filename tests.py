@@ -1,10 +1,22 @@
 import sys
 import os
+import shutil
+import tempfile
+import subprocess
+import json
+import time
+import calendar
+import argparse
+import gzip
+import bz2
+import lzma
 from glob import glob
 import unittest
 from unittest import mock
 from collections import namedtuple
-from PyQt5 import QtWidgets, QtCore
+from contextlib import closing
+from io import BytesIO, StringIO
+from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtTest import QTest
 Qt = QtCore.Qt
 import elogviewer
@@ -42,6 +54,14 @@ class TestBase(unittest.TestCase):
 
     def setUp(self):
         self.reset_test_set()
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home)
+        environ = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(home, "cache"),
+            "XDG_DATA_HOME": os.path.join(home, "data"),
+            "XDG_CONFIG_HOME": os.path.join(home, "config")})
+        environ.start()
+        self.addCleanup(environ.stop)
 
     @property
     def elogs(self):
@@ -59,6 +79,21 @@ class TestBase(unittest.TestCase):
     def reset_test_set(self):
         os.system("git checkout -- %s" % config.elogpath)
 
+    def wait_for_scan(self, viewer):
+        for _ in range(500):
+            if not viewer.isScanning():
+                break
+            QTest.qWait(10)
+        self.assertFalse(viewer.isScanning())
+
+    def add_bad_name(self):
+        """Add a file listed as an elog whose name is not that of one."""
+        filename = os.path.join(config.elogpath, "notes:todo:draft.log")
+        with open(filename, "w") as elogfile:
+            elogfile.write("INFO: todo\n")
+        self.addCleanup(os.remove, filename)
+        return filename
+
     def assert_elog_files_exist(self):
         self.assertEqual(len(self.elogs), TEST_SET_SIZE)
 
@@ -82,6 +117,7 @@ class TestEnvironment(TestBase):
                 with open(html, "w") as html_file:
                     html_file.writelines(_html(elog))
         self.elogviewer = elogviewer.Elogviewer(config)
+        self.wait_for_scan(self.elogviewer)
 
     def tearDown(self):
         assert self.elogviewer.close()
@@ -112,6 +148,1012 @@ class TestEnvironment(TestBase):
         self.assertRegex(content, b"ERROR:")
 
 
+class TestFormats(TestBase):
+
+    compressors = {"gz": gzip.compress, "bz2": bz2.compress,
+                   "xz": lzma.compress}
+    if elogviewer.zstandard:
+        compressors["zst"] = elogviewer.zstandard.compress
+
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        self.elog = sorted(self.elogs)[0]
+        with open(self.elog, "rb") as elogfile:
+            self.content = elogfile.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, compress):
+        filename = os.path.join(self.path, "%s%s" % (
+            os.path.basename(self.elog), name))
+        with open(filename, "wb") as elogfile:
+            elogfile.write(compress(self.content))
+        return filename
+
+    def assert_readable(self, filename):
+        with _file(filename) as elogfile:
+            self.assertEqual(elogfile.read(), self.content)
+        self.assertEqual(list(elogviewer._text(filename)),
+                         list(elogviewer._text(self.elog)))
+        self.assertEqual(elogviewer.Elog.fromFilename(filename).eclass,
+                         elogviewer.Elog.fromFilename(self.elog).eclass)
+
+    def test_compressed(self):
+        for ext, compress in self.compressors.items():
+            with self.subTest(ext):
+                self.assert_readable(self.write("." + ext, compress))
+
+    def test_format_is_read_from_the_content(self):
+        for ext, compress in self.compressors.items():
+            with self.subTest(ext):
+                self.assert_readable(self.write("", compress))
+
+    def test_missing_decompressor(self):
+        filename = self.write(".xz", lzma.compress)
+        with mock.patch("elogviewer._decompressors", [
+                (magic, None) for magic, __ in elogviewer._decompressors]):
+            with _file(filename) as elogfile:
+                self.assertIn(b"Unsupported format", elogfile.read())
+
+
+class TestElogArchive(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        for elog in self.elogs:
+            shutil.copy(elog, self.path)
+        self.filenames = sorted(glob(os.path.join(self.path, "*.log")))
+        self.elogs_ = [elogviewer.Elog.fromFilename(filename)
+                       for filename in self.filenames]
+        self.texts = [list(elogviewer._text(filename))
+                      for filename in self.filenames]
+        self.archive = elogviewer.ElogArchive(
+            os.path.join(self.path, "archive.zip"))
+        self.moved = self.archive.add(self.filenames)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_repr(self):
+        self.assertEqual(eval(repr(self.archive)).filename,
+                         self.archive.filename)
+
+    def test_elogs_are_moved(self):
+        self.assertEqual([filename for filename, __ in self.moved],
+                         self.filenames)
+        self.assertFalse(glob(os.path.join(self.path, "*.log")))
+        self.assertEqual(
+            [(elog.filename, elog[1:]) for elog in self.archive.elogs()],
+            [(archived, elog[1:]) for (__, archived), elog
+             in zip(self.moved, self.elogs_)])
+
+    def test_unreadable_elogs_are_kept(self):
+        filenames = []
+        for n, content in enumerate((b"\x28\xb5\x2f\xfdzstd",
+                                     b"\x1f\x8bgzip", b"BZhbzip2")):
+            filenames.append(os.path.join(
+                self.path, "app-misc:bad-1.0:2015010%i-000000.log" % n))
+            with open(filenames[-1], "wb") as elogfile:
+                elogfile.write(content)
+        # As without the zstandard module.
+        decompressors = [(prefix, None if prefix == b"\x28\xb5\x2f\xfd"
+                          else decompressor)
+                         for prefix, decompressor in elogviewer._decompressors]
+        with mock.patch.object(elogviewer, "_decompressors", decompressors):
+            self.assertEqual(self.archive.add(filenames), [])
+        self.assertTrue(all(map(os.path.isfile, filenames)))
+        self.assertEqual(len(self.archive.elogs()), TEST_SET_SIZE)
+
+    def test_elogs_out_of_zip_dates(self):
+        filenames = []
+        for date in ("19700101-000000", "21080101-000000"):
+            filenames.append(os.path.join(
+                self.path, "app-misc:old-1.0:%s.log" % date))
+            shutil.copy(self.elogs[0], filenames[-1])
+        moved = self.archive.add(filenames)
+        self.assertEqual([filename for filename, __ in moved], filenames)
+        self.assertEqual(
+            sorted(elog.date for elog in self.archive.elogs()
+                   if elog.package == "old-1.0"),
+            [0, calendar.timegm((2108, 1, 1, 0, 0, 0))])
+
+    def test_archived_elogs_are_read(self):
+        for (__, archived), text in zip(self.moved, self.texts):
+            self.assertEqual(list(elogviewer._text(archived)), text)
+            elogviewer.htmlCache.html(archived)
+            self.assertIn(archived, elogviewer.htmlCache)
+
+    def test_scanner_lists_the_archive(self):
+        elogs = []
+        scanner = elogviewer.ElogScanner(
+            elogviewer.ElogIndex(":memory:"), self.path)
+        scanner.signals.elogsRead.connect(elogs.extend)
+        scanner.run()
+        self.assertEqual(sorted(elogs), sorted(self.archive.elogs()))
+
+    def test_remove(self):
+        archived = [archived for __, archived in self.moved]
+        self.archive.remove(archived[:2])
+        self.assertEqual([elog.filename for elog in self.archive.elogs()],
+                         archived[2:])
+
+    def test_delete(self):
+        archived = [archived for __, archived in self.moved]
+        deleted, errors = [], []
+        deleter = elogviewer.ElogDeleter(archived[:1])
+        deleter.signals.deleted.connect(deleted.extend)
+        deleter.signals.done.connect(errors.extend)
+        deleter.run()
+        self.assertEqual((deleted, errors), (archived[:1], []))
+        self.assertEqual(len(self.archive.elogs()), TEST_SET_SIZE - 1)
+
+    def test_command_line(self):
+        for filename, __ in self.moved:
+            shutil.copy(os.path.join(config.elogpath,
+                                     os.path.basename(filename)), filename)
+        stateStore = os.path.join(self.path, "state.sqlite")
+        with mock.patch("elogviewer._dataPath", return_value=stateStore):
+            with closing(elogviewer.ElogStateStore()) as states:
+                states.setFlags(self.filenames[0], True, True)
+            os.remove(self.archive.filename)
+            out = StringIO()
+            self.assertEqual(elogviewer.cli(
+                ["-p", self.path, "--archive", "0", "--list"], out), 0)
+            with closing(elogviewer.ElogStateStore()) as states:
+                self.assertEqual(states.readFlag, {self.moved[0][1]})
+                self.assertEqual(states.importantFlag, {self.moved[0][1]})
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "%i elogs archived to %s" % (
+            TEST_SET_SIZE, self.archive.filename))
+        self.assertEqual(sorted(line.split("\t")[-1] for line in lines[1:]),
+                         sorted(archived for __, archived in self.moved))
+
+
+class TestParseDate(unittest.TestCase):
+
+    def test_dates(self):
+        for text in ("20150131-214221", "19700101-000000", "20000229-235959",
+                     "20161231-235960"):
+            self.assertEqual(
+                elogviewer._parseDate(text),
+                calendar.timegm(time.strptime(text, "%Y%m%d-%H%M%S")))
+
+    def test_invalid_dates(self):
+        for text in ("20150230-000000", "20151301-000000", "20150131-240000",
+                     "20150131-216000", "20150131_214221", "2015013-214221",
+                     "20150131-2142210", "2015013١-214221", ""):
+            with self.subTest(text):
+                self.assertRaises(ValueError, elogviewer._parseDate, text)
+
+
+class TestHighestEClass(unittest.TestCase):
+
+    def highest(self, content, chunkSize=4):
+        return elogviewer._highestEClass(BytesIO(content), chunkSize)
+
+    def test_highest_eclass(self):
+        EClass = elogviewer.EClass
+        for content, eclass in (
+                (b"", EClass.einfo),
+                (b"INFO: setup\nLOG: postinst\n", EClass.elog),
+                (b"WARN: setup\nINFO: postinst\n", EClass.ewarn),
+                (b"INFO: setup\nERROR: compile\nWARN: postinst\n",
+                 EClass.eerror)):
+            self.assertIs(self.highest(content), eclass)
+
+    def test_header_across_chunks(self):
+        for offset in range(8):
+            self.assertIs(self.highest(offset * b"." + b"ERROR: setup"),
+                          elogviewer.EClass.eerror)
+
+    def test_stop_at_error(self):
+        elogfile = BytesIO(b"ERROR: setup\n" + 1024 * b"INFO: postinst\n")
+        elogviewer._highestEClass(elogfile, chunkSize=16)
+        self.assertEqual(elogfile.tell(), 16)
+
+    def test_scan_long_line(self):
+        content = b"INFO: " + 4096 * b"python_targets " + b"ERROR: end"
+        for chunkSize in (4, 7, 64):
+            with self.subTest(chunkSize=chunkSize):
+                self.assertEqual(
+                    elogviewer._scanElog(BytesIO(content), chunkSize),
+                    (elogviewer.EClass.eerror,
+                     {"info", "python_targets", "error", "end"}))
+
+    def test_scan_tail_is_bounded(self):
+        content = (1 << 16) * b"x"
+        with mock.patch("elogviewer._tokens",
+                        wraps=elogviewer._tokens) as tokens:
+            elogviewer._scanElog(BytesIO(content), chunkSize=64,
+                                 maxTokenLength=16)
+        self.assertLessEqual(
+            max(len(call[0][0]) for call in tokens.call_args_list), 64 + 16)
+
+
+class TestHtml(unittest.TestCase):
+
+    def test_hyperlinks(self):
+        with tempfile.NamedTemporaryFile(suffix=".log") as elogfile:
+            elogfile.write(
+                b"WARN: setup\n"
+                b"see a-b/http://example.com/x and a-b/debug #42\n"
+                b"\x1b[1mhttps://x.org/\x1b[0m bug   #7 dev-lang/python:2.7\n"
+                b"a-b/c d-e/f g-h/i\n")
+            elogfile.flush()
+            self.assertMultiLineEqual(_html(elogfile.name), os.linesep.join((
+                '<h2>Warn:  setup</h2><p style="color: #E56717">',
+                'see a-b/<a href="http://example.com/x">'
+                'http://example.com/x</a> and a-b/de'
+                '<a href="https://bugs.gentoo.org/42">bug #42</a> <br />',
+                '<a href="https://x.org/">https://x.org/</a> '
+                '<a href="https://bugs.gentoo.org/7">bug #7</a> '
+                '<a href="http://packages.gentoo.org/package/dev-lang/python">'
+                'dev-lang/python</a>:2.7 <br />',
+                '<a href="http://packages.gentoo.org/package/a-b/c">a-b/c</a>'
+                ' d-e/f '
+                '<a href="http://packages.gentoo.org/package/g-h/i">g-h/i</a>'
+                ' <br />',
+                '</p>',
+                '')))
+
+
+class TestHtmlCache(TestBase):
+
+    def tearDown(self):
+        self.reset_test_set()
+
+    def test_hit_and_miss(self):
+        cache = elogviewer.HtmlCache()
+        for elog in 2 * self.elogs:
+            self.assertEqual(cache.html(elog), _html(elog))
+        self.assertEqual((cache.hits, cache.misses),
+                         (TEST_SET_SIZE, TEST_SET_SIZE))
+
+    def test_evict_least_recently_used(self):
+        first, second, third = self.elogs[:3]
+        cache = elogviewer.HtmlCache()
+        cache.maxBytes = sum(sys.getsizeof(_html(elog))
+                             for elog in (first, second, third)) - 1
+        cache.html(first)
+        cache.html(second)
+        cache.html(first)
+        cache.html(third)
+        self.assertIn(first, cache)
+        self.assertNotIn(second, cache)
+        self.assertLessEqual(cache.stats()["bytes"], cache.maxBytes)
+
+    def test_modified_elog_is_rendered(self):
+        cache = elogviewer.HtmlCache()
+        cache.html(self.elogs[0])
+        with open(self.elogs[0], "ab") as elogfile:
+            elogfile.write(b"modified\n")
+        self.assertIn("modified", cache.html(self.elogs[0]))
+
+
+class TestElogIndex(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "index.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        self.reset_test_set()
+
+    def index_elogs(self, jobs=1):
+        with closing(elogviewer.ElogIndex(self.filename, jobs)) as index:
+            return sorted(index.elogs(self.elogs))
+
+    def test_elogs_match_files(self):
+        self.assertEqual(
+            self.index_elogs(),
+            sorted(elogviewer.Elog.fromFilename(elog) for elog in self.elogs))
+
+    @mock.patch.object(elogviewer.ElogIndex, "parallelThreshold", 1)
+    def test_parallel_elogs_match_files(self):
+        self.assertEqual(self.index_elogs(jobs=2), self.index_elogs())
+
+    @mock.patch.object(elogviewer.ElogIndex, "parallelThreshold", 1)
+    def test_exited_worker_is_an_error(self):
+        with mock.patch.object(sys, "executable", shutil.which("false")):
+            with self.assertRaises(OSError):
+                self.index_elogs(jobs=2)
+
+    def test_worker_does_not_import_qt(self):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", elogviewer.__file__,
+             "--read-elogs"], input=json.dumps(self.elogs) + "\n",
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(len(json.loads(result.stdout)["elogs"]),
+                         len(self.elogs))
+        self.assertNotIn("Qt", result.stderr)
+
+    def test_cached_elogs_are_not_read(self):
+        expected = self.index_elogs()
+        with mock.patch.object(elogviewer, "_readElog") as read:
+            self.assertEqual(self.index_elogs(), expected)
+        self.assertFalse(read.called)
+
+    def test_modified_elog_is_read(self):
+        self.index_elogs()
+        with open(self.elogs[0], "ab") as elogfile:
+            elogfile.write(b"ERROR: postinst\n")
+        with mock.patch.object(elogviewer, "_readElog",
+                               wraps=elogviewer._readElog) as read:
+            elogs = self.index_elogs()
+        read.assert_called_once_with(self.elogs[0])
+        self.assertIs(dict((elog.filename, elog.eclass) for elog in elogs)[
+            self.elogs[0]], elogviewer.EClass.eerror)
+
+    def test_closed_index_is_empty(self):
+        index = elogviewer.ElogIndex(self.filename, 1)
+        list(index.elogs(self.elogs))
+        index.close()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search("PYTHON_TARGETS"), set())
+        self.assertEqual(
+            sorted(index.elogs(self.elogs)),
+            sorted(elogviewer.Elog.fromFilename(elog) for elog in self.elogs))
+
+    def test_prune_keeps_other_directories(self):
+        other = os.path.join(self.tmpdir, os.path.basename(self.elogs[0]))
+        shutil.copy(self.elogs[0], other)
+        with closing(elogviewer.ElogIndex(self.filename, 1)) as index:
+            list(index.elogs(self.elogs + [other]))
+            index.prune(config.elogpath, self.elogs[1:])
+        with mock.patch.object(elogviewer, "_readElog",
+                               wraps=elogviewer._readElog) as read:
+            self.index_elogs()
+            with closing(elogviewer.ElogIndex(self.filename, 1)) as index:
+                list(index.elogs([other]))
+        read.assert_called_once_with(self.elogs[0])
+
+    def search(self, text):
+        with closing(elogviewer.ElogIndex(self.filename, 1)) as index:
+            list(index.elogs(self.elogs))
+            return index.search(text)
+
+    def test_search(self):
+        self.assertEqual(self.search("PYTHON_TARGETS"), set(
+            os.path.abspath(elog) for elog in self.elogs
+            if "python_targets" in _html(elog).lower()))
+        self.assertEqual(self.search("no-such-word"), set())
+
+    def test_search_modified_elog(self):
+        self.assertNotIn(os.path.abspath(self.elogs[0]),
+                         self.search("elogviewer_marker"))
+        with open(self.elogs[0], "ab") as elogfile:
+            elogfile.write(b"LOG: elogviewer_marker\n")
+        self.assertEqual(self.search("elogviewer_marker"),
+                         {os.path.abspath(self.elogs[0])})
+
+    def test_corrupt_index_is_rebuilt(self):
+        expected = self.index_elogs()
+        with open(self.filename, "wb") as indexfile:
+            indexfile.write(b"garbage" * 1024)
+        self.assertEqual(self.index_elogs(), expected)
+        self.assertEqual(self.index_elogs(), expected)
+
+
+class TestElogStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "state.sqlite")
+        self.elogpath = os.path.join(self.tmpdir, "elog")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.elogpath, name)
+
+    def test_flush_and_load(self):
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            store.setFlags(self.path("a.log"), True, False)
+            store.setFlags(self.path("b.log"), True, True)
+            store.flush()
+            self.assertFalse(store.isDirty())
+            store.setFlags(self.path("b.log"), False, False)
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            self.assertEqual(store.readFlag, {self.path("a.log")})
+            self.assertEqual(store.importantFlag, set())
+            self.assertEqual(len(store), 1)
+
+    def test_compact_drops_stale_paths(self):
+        other = os.path.join(self.tmpdir, "other", "c.log")
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            for filename in (self.path("a.log"), self.path("b.log"), other):
+                store.setFlags(filename, True, True)
+            store.compact(self.elogpath, [self.path("a.log")])
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            self.assertEqual(store.readFlag, {self.path("a.log"), other})
+
+    def test_migrate(self):
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            store.migrate({self.path("a.log")}, {self.path("b.log")})
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            self.assertEqual(store.readFlag, {self.path("a.log")})
+            self.assertEqual(store.importantFlag, {self.path("b.log")})
+
+    def test_corrupt_store_is_rebuilt(self):
+        with open(self.filename, "wb") as storefile:
+            storefile.write(b"garbage" * 1024)
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            store.setFlags(self.path("a.log"), True, False)
+        with closing(elogviewer.ElogStateStore(self.filename)) as store:
+            self.assertEqual(store.readFlag, {self.path("a.log")})
+
+
+class TestElogTable(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.elogs_ = sorted(elogviewer.Elog.fromFilename(elog)
+                             for elog in self.elogs)
+        self.table = elogviewer.ElogTable(
+            self.elogs_, readFlag={self.elogs_[0].filename},
+            importantFlag={self.elogs_[1].filename})
+
+    def test_elogs_roundtrip(self):
+        self.assertEqual(len(self.table), TEST_SET_SIZE)
+        self.assertEqual(
+            [self.table.elog(row) for row in range(TEST_SET_SIZE)],
+            self.elogs_)
+
+    def test_states(self):
+        table = self.table
+        self.assertEqual((table.readCount(), table.importantCount()), (1, 1))
+        table.setReadState(2, table.PartiallyChecked)
+        table.setImportantState(2, table.Checked)
+        self.assertEqual(table.readState(2), table.PartiallyChecked)
+        self.assertEqual(table.importantState(2), table.Checked)
+        self.assertEqual((table.readCount(), table.importantCount()), (2, 2))
+
+    def test_search_keys(self):
+        keys = self.table.searchKeys()
+        self.assertEqual(len(keys), TEST_SET_SIZE)
+        elog = self.elogs_[0]
+        for text in (elog.category, elog.package, elog.eclass.name):
+            self.assertIn(text.lower(), keys[0])
+        self.table.remove(0, 1)
+        self.assertEqual(self.table.searchKeys(), keys[1:])
+
+    def test_unknown_eclass(self):
+        elog = elogviewer.Elog.fromName(self.elogs_[0].filename)
+        self.assertEqual(elog, self.elogs_[0]._replace(eclass=None))
+        table = elogviewer.ElogTable([elog])
+        self.assertIsNone(table.eclass(0))
+        self.assertEqual(table.searchKeys()[0].split("\n")[2], "")
+        table.setEClass(0, self.elogs_[0].eclass)
+        self.assertEqual(table.elog(0), self.elogs_[0])
+        self.assertEqual(table.searchKeys(), self.table.searchKeys()[:1])
+
+    def test_sorted_rows(self):
+        for column, key in (
+                (Column.Category, lambda elog: elog.category),
+                (Column.Package, lambda elog: elog.package),
+                (Column.Eclass, lambda elog: elog.eclass),
+                (Column.Date, lambda elog: elog.date)):
+            with self.subTest(column.name):
+                rows = self.table.sortedRows(column, reverse=True)
+                self.assertEqual([self.elogs_[row] for row in rows],
+                                 sorted(self.elogs_, key=key, reverse=True))
+        self.assertEqual(self.table.sortedRows(Column.ReadState)[-1], 0)
+        self.assertEqual(self.table.sortedRows(Column.ImportantState)[-1], 1)
+
+    def test_reorder(self):
+        keys = self.table.searchKeys()
+        rows = [4, 2, 0, 1, 3]
+        self.table.reorder(rows)
+        self.assertEqual([self.table.elog(row) for row in range(5)],
+                         [self.elogs_[row] for row in rows])
+        self.assertEqual(self.table.readState(2), self.table.Checked)
+        self.assertEqual(self.table.importantState(3), self.table.Checked)
+        self.assertEqual(self.table.searchKeys(), [keys[row] for row in rows])
+        self.assertEqual((self.table.readCount(),
+                          self.table.importantCount()), (1, 1))
+
+    def test_remove(self):
+        self.table.remove(1, 2)
+        self.assertEqual(self.table.filenames(), [
+            elog.filename for elog in self.elogs_[:1] + self.elogs_[3:]])
+        self.assertEqual(self.table.importantCount(), 0)
+        self.assertEqual(self.table.readCount(), 1)
+
+    def test_counts_are_maintained(self):
+        table = self.table
+        for row in range(TEST_SET_SIZE):
+            table.setReadState(row, table.Checked)
+            table.setImportantState(row, table.Unchecked)
+        table.setReadState(0, table.Checked)
+        self.assertEqual(table.unreadCount(), 0)
+        self.assertEqual(table.importantCount(), 0)
+        table.setReadState(0, table.Unchecked)
+        table.setImportantState(0, table.Checked)
+        table.setImportantState(0, table.Checked)
+        self.assertEqual(table.unreadCount(), 1)
+        self.assertEqual(table.importantCount(), 1)
+
+
+class TestElogQuery(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.elogs_ = sorted(elogviewer.Elog.fromFilename(elog)
+                             for elog in self.elogs)
+        self.table = elogviewer.ElogTable(
+            self.elogs_, readFlag={self.elogs_[0].filename},
+            importantFlag={self.elogs_[1].filename})
+
+    def query(self, text):
+        return elogviewer.ElogQuery(text).filenames(self.table)
+
+    def expected(self, predicate):
+        return set(elog.filename for elog in self.elogs_ if predicate(elog))
+
+    def test_repr(self):
+        TestRepr.assert_well_formatted_repr(
+            self, elogviewer.ElogQuery("eclass>=warn"))
+
+    def test_is_query(self):
+        for text in ("eclass:warn", "-unread", "markupsafe Date<2015"):
+            self.assertTrue(elogviewer.ElogQuery.isQuery(text), text)
+        for text in ("markupsafe", "dev-python", "foo:bar", "readme"):
+            self.assertFalse(elogviewer.ElogQuery.isQuery(text), text)
+
+    def test_eclass(self):
+        EClass = elogviewer.EClass
+        self.assertEqual(self.query("eclass>=warn"), self.expected(
+            lambda elog: elog.eclass >= EClass.ewarn))
+        self.assertEqual(self.query("eclass:elog"), self.expected(
+            lambda elog: elog.eclass is EClass.elog))
+        self.assertEqual(self.query("-eclass<error"), self.expected(
+            lambda elog: elog.eclass is EClass.eerror))
+        self.assertEqual(self.query("eclass:qa"), self.expected(
+            lambda elog: elog.eclass is EClass.eqa))
+        self.assertEqual(self.query("eclass>=eqa"), self.expected(
+            lambda elog: True))
+
+    def test_names(self):
+        self.assertEqual(self.query("category:dev-python"), self.expected(
+            lambda elog: elog.category == "dev-python"))
+        self.assertEqual(self.query("category:*-c*"), self.expected(
+            lambda elog: elog.category == "www-client"))
+        self.assertEqual(self.query("package:MarkupSafe"), self.expected(
+            lambda elog: elog.package == "markupsafe-0.23"))
+        self.assertEqual(self.query("package:markupsafe-0.2"), set())
+
+    def test_dates(self):
+        self.assertEqual(self.query("date:2015-01..2015-02"), self.expected(
+            lambda elog: time.gmtime(elog.date).tm_year == 2015))
+        self.assertEqual(self.query("date:2015-02-01"), self.expected(
+            lambda elog: time.gmtime(elog.date)[:3] == (2015, 2, 1)))
+        self.assertEqual(self.query("date<2015"), self.expected(
+            lambda elog: time.gmtime(elog.date).tm_year < 2015))
+        self.assertEqual(self.query("date>2015-01 date:..2015-03"),
+                         self.expected(lambda elog: time.gmtime(
+                             elog.date)[:2] == (2015, 2)))
+
+    def test_states(self):
+        self.assertEqual(self.query("read"), {self.elogs_[0].filename})
+        self.assertEqual(self.query("important -unread"), set())
+        self.assertEqual(self.query("unread important"),
+                         {self.elogs_[1].filename})
+
+    def test_words(self):
+        self.assertEqual(self.query("eclass:warn markup"), self.expected(
+            lambda elog: elog.package.startswith("markupsafe")))
+
+    def test_indexes_follow_the_rows(self):
+        self.assertTrue(self.query("category:dev-python"))
+        self.table.remove(0, len(self.table))
+        self.assertEqual(self.query("category:dev-python"), set())
+        self.table.extend(self.elogs_)
+        self.assertEqual(self.query("category:dev-python"), self.expected(
+            lambda elog: elog.category == "dev-python"))
+
+    def test_invalid_queries(self):
+        for text in ("eclass:foo", "date:2015-13", "date:15",
+                     "category<dev", "date>2015..2016", "eclass:"):
+            with self.assertRaises(ValueError):
+                elogviewer.ElogQuery(text)
+
+
+class TestCommandLine(TestBase):
+
+    def cli(self, *args):
+        out = StringIO()
+        status = elogviewer.cli(("-p", config.elogpath) + args, out)
+        self.assertEqual(status, 0)
+        return out.getvalue().splitlines()
+
+    def test_qt_is_not_imported(self):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", elogviewer.__file__,
+             "-p", config.elogpath, "--list"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(len(result.stdout.splitlines()), TEST_SET_SIZE)
+        self.assertNotIn("Qt", result.stderr)
+
+    def test_arguments_are_parsed_once(self):
+        parsed = elogviewer._parseArguments(["-p", config.elogpath, "--list"])
+        out = StringIO()
+        with mock.patch.object(elogviewer, "_parseArguments") as parse:
+            self.assertEqual(elogviewer.cli(out=out, config=parsed), 0)
+        parse.assert_not_called()
+        self.assertEqual(len(out.getvalue().splitlines()), TEST_SET_SIZE)
+
+    def test_list(self):
+        lines = self.cli("--list")
+        self.assertEqual(sorted(line.split("\t")[-1] for line in lines),
+                         sorted(self.elogs))
+
+    def test_list_skips_bad_name(self):
+        elogs = self.elogs
+        self.add_bad_name()
+        lines = self.cli("--list")
+        self.assertEqual(sorted(line.split("\t")[-1] for line in lines),
+                         sorted(elogs))
+
+    def test_json_query(self):
+        elogs = [json.loads(line) for line in
+                 self.cli("--json", "--query", "eclass>=warn")]
+        self.assertEqual(
+            sorted(elog["filename"] for elog in elogs),
+            sorted(elog.filename for elog in map(
+                elogviewer.Elog.fromFilename, self.elogs)
+                if elog.eclass >= elogviewer.EClass.ewarn))
+        self.assertEqual(set(elogs[0]), {"filename", "category", "package",
+                                         "date", "eclass", "read",
+                                         "important"})
+
+    def test_show(self):
+        elog = self.elogs[0]
+        lines = self.cli("--show", elog)
+        self.assertTrue(lines)
+        self.assertFalse(any("\x1b" in line for line in lines))
+        self.assertEqual(self.cli("--show", elog, "--html"),
+                         _html(elog).splitlines())
+
+    def test_html_colors(self):
+        for eclass in (elogviewer.EClass.eerror, elogviewer.EClass.ewarn,
+                       elogviewer.EClass.einfo):
+            self.assertEqual(elogviewer._htmlColors[eclass],
+                             eclass.htmlColor())
+
+
+class TestElogpath(unittest.TestCase):
+
+    def setUp(self):
+        elogviewer._portageElogpath.cache_clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cacheFilename = os.path.join(self.tmpdir, "elogpath.json")
+
+    def tearDown(self):
+        elogviewer._portageElogpath.cache_clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_given_path(self):
+        with mock.patch.object(elogviewer, "_portageElogpath") as portage:
+            self.assertEqual(elogviewer._elogpath("data"), "data")
+        portage.assert_not_called()
+
+    def test_cached_path(self):
+        with open(self.cacheFilename, "w") as cacheFile:
+            json.dump({"root": os.sep, "stamp": elogviewer._portageStamp(),
+                       "elogpath": "/cached/elog"}, cacheFile)
+        with mock.patch.dict(sys.modules, portage=None):
+            self.assertEqual(
+                elogviewer._portageElogpath(self.cacheFilename),
+                "/cached/elog")
+
+    def test_stale_cache(self):
+        with open(self.cacheFilename, "w") as cacheFile:
+            json.dump({"root": os.sep, "stamp": None,
+                       "elogpath": "/cached/elog"}, cacheFile)
+        portage = mock.Mock()
+        portage.settings = {"PORT_LOGDIR": "/var/log/portage",
+                            "EPREFIX": "", "EROOT": self.tmpdir}
+        with mock.patch.dict(sys.modules, portage=portage):
+            self.assertEqual(
+                elogviewer._portageElogpath(self.cacheFilename),
+                "/var/log/portage/elog")
+        with open(self.cacheFilename) as cacheFile:
+            cache = json.load(cacheFile)
+        self.assertEqual(cache["elogpath"], "/var/log/portage/elog")
+        self.assertEqual(cache["root"], self.tmpdir)
+
+    @mock.patch.dict(os.environ, PORTAGE_CONFIGROOT="")
+    def test_stamp_of_root(self):
+        makeConf = os.path.join(self.tmpdir, "etc", "portage", "make.conf")
+        os.makedirs(os.path.dirname(makeConf))
+        with open(makeConf, "w") as makeConfFile:
+            makeConfFile.write('PORT_LOGDIR="/var/log/portage"\n')
+        stamp = elogviewer._portageStamp(self.tmpdir)
+        self.assertNotEqual(stamp, elogviewer._portageStamp(os.sep))
+        with open(makeConf, "a") as makeConfFile:
+            makeConfFile.write('PORTAGE_ELOG_SYSTEM="save"\n')
+        self.assertNotEqual(elogviewer._portageStamp(self.tmpdir), stamp)
+
+    def write(self, name, text):
+        filename = os.path.join(self.tmpdir, *name.split("/"))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "a") as configFile:
+            configFile.write(text)
+
+    @mock.patch.dict(os.environ, PORTAGE_CONFIGROOT="")
+    def test_stamp_of_make_conf_directory(self):
+        self.write("etc/portage/make.conf/00-base", 'FEATURES="sandbox"\n')
+        self.write("etc/portage/make.conf/10-elog", "")
+        stamp = elogviewer._portageStamp(self.tmpdir)
+        self.write("etc/portage/make.conf/10-elog",
+                   'PORT_LOGDIR="/var/log/portage"\n')
+        self.assertNotEqual(elogviewer._portageStamp(self.tmpdir), stamp)
+
+    @mock.patch.dict(os.environ, PORTAGE_CONFIGROOT="")
+    def test_stamp_of_profile(self):
+        self.write("profiles/base/make.defaults", 'FEATURES="sandbox"\n')
+        self.write("profiles/linux/parent", "# The base profile.\n../base\n")
+        self.write("profiles/linux/make.defaults", "")
+        os.makedirs(os.path.join(self.tmpdir, "etc", "portage"))
+        os.symlink(os.path.join(self.tmpdir, "profiles", "linux"),
+                   os.path.join(self.tmpdir, "etc", "portage",
+                                "make.profile"))
+        stamp = elogviewer._portageStamp(self.tmpdir)
+        self.write("profiles/base/make.defaults",
+                   'PORT_LOGDIR="/var/log/portage"\n')
+        self.assertNotEqual(elogviewer._portageStamp(self.tmpdir), stamp)
+
+    def test_without_portage(self):
+        with mock.patch.dict(sys.modules, portage=None):
+            self.assertEqual(
+                elogviewer._portageElogpath(self.cacheFilename), "")
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = elogviewer.Profiler()
+
+    def test_repr(self):
+        TestRepr.assert_well_formatted_repr(self, self.profiler)
+
+    def test_disabled(self):
+        profiled = self.profiler.profiled("f")(lambda x: 2 * x)
+        with self.profiler.span("span"):
+            self.assertEqual(profiled(2), 4)
+        self.assertEqual(list(self.profiler.timed("timed", [1])), [1])
+        self.assertEqual(self.profiler.stats(), {})
+
+    def test_enabled(self):
+        self.profiler.enabled = True
+        profiled = self.profiler.profiled("f")(lambda x: 2 * x)
+        for _ in range(3):
+            with self.profiler.span("span"):
+                self.assertEqual(profiled(2), 4)
+        self.assertEqual(list(self.profiler.timed("timed", [1, 2])), [1, 2])
+        stats = self.profiler.stats()
+        self.assertEqual(list(stats), ["f", "span", "timed"])
+        self.assertEqual(stats["f"]["count"], 3)
+        self.assertEqual(sum(stats["span"]["histogram"].values()), 3)
+        self.assertEqual(stats["timed"]["count"], 2)
+        report = self.profiler.report().splitlines()
+        self.assertEqual(len(report), 4)
+
+    def test_dump(self):
+        self.profiler.record("span", 0.003)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "profile.json")
+            self.profiler.dump(filename)
+            with open(filename) as dumpFile:
+                stats = json.load(dumpFile)
+        self.assertEqual(stats["span"]["count"], 1)
+        self.assertEqual(stats["span"]["histogram"], {"<4096us": 1})
+
+
+class TestElogModel(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = elogviewer.ElogModel()
+        self.elog = elogviewer.Elog.fromFilename(self.elogs[0])
+        self.model.appendElogs([self.elog])
+
+    def data(self, column, role=Qt.DisplayRole):
+        return self.model.data(self.model.index(0, column), role)
+
+    def test_data(self):
+        self.assertEqual(self.model.rowCount(), 1)
+        self.assertEqual(self.model.columnCount(), len(Column))
+        self.assertEqual(self.data(Column.Category), self.elog.category)
+        self.assertEqual(self.data(Column.Package), self.elog.package)
+        self.assertEqual(self.data(Column.Eclass), self.elog.eclass.name)
+        self.assertEqual(self.data(Column.Date), self.elog.localeTime)
+        self.assertEqual(self.data(Column.Eclass, elogviewer.Role.SortRole),
+                         self.elog.eclass.value)
+
+    def test_set_check_state(self):
+        index = self.model.index(0, Column.ReadState)
+        self.assertIs(self.data(Column.ReadState, Qt.CheckStateRole),
+                      Qt.Unchecked)
+        self.assertTrue(self.model.setData(index, Qt.Checked,
+                                           Qt.CheckStateRole))
+        self.assertIs(self.data(Column.ReadState, Qt.CheckStateRole),
+                      Qt.Checked)
+        self.assertIs(_itemFromIndex(index).readState(), Qt.Checked)
+        self.assertFalse(self.model.setData(
+            self.model.index(0, Column.Package), Qt.Checked,
+            Qt.CheckStateRole))
+
+
+class TestButtonDelegate(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.parent = QtWidgets.QWidget()
+        self.delegate = elogviewer.ButtonDelegate(elogviewer.Star(),
+                                                  self.parent)
+        self.size = QtCore.QSize(20, 20)
+
+    def tearDown(self):
+        self.parent.deleteLater()
+
+    def test_pixmaps_are_cached(self):
+        pixmap = self.delegate.pixmap(Qt.Checked, self.size)
+        self.assertEqual(pixmap.size(), self.size)
+        self.assertEqual(
+            self.delegate.pixmap(Qt.Checked, self.size).cacheKey(),
+            pixmap.cacheKey())
+        self.assertNotEqual(
+            self.delegate.pixmap(Qt.Unchecked, self.size).cacheKey(),
+            pixmap.cacheKey())
+        self.assertNotEqual(self.delegate.pixmap(
+            Qt.Checked, QtCore.QSize(20, 30)).cacheKey(), pixmap.cacheKey())
+
+    def test_style_and_palette_changes_invalidate(self):
+        button = self.delegate._btn
+        for change in (
+                lambda: button.setPalette(QtGui.QPalette(Qt.darkBlue)),
+                lambda: button.setStyle(
+                    QtWidgets.QStyleFactory.create("Fusion"))):
+            pixmap = self.delegate.pixmap(Qt.Checked, self.size)
+            change()
+            self.assertNotEqual(
+                self.delegate.pixmap(Qt.Checked, self.size).cacheKey(),
+                pixmap.cacheKey())
+
+    def test_click_toggles_the_clicked_cell(self):
+        model = elogviewer.ElogModel()
+        model.appendElogs(map(elogviewer.Elog.fromFilename, self.elogs[:2]))
+        model.setData(model.index(0, Column.ImportantState), Qt.Checked,
+                      Qt.CheckStateRole)
+        # The button was last rendered for the first row.
+        self.delegate.pixmap(Qt.Checked, self.size)
+        index = model.index(1, Column.ImportantState)
+        event = QtGui.QMouseEvent(
+            QtCore.QEvent.MouseButtonRelease, QtCore.QPointF(5, 5),
+            Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+        self.assertTrue(self.delegate.editorEvent(
+            event, model, QtWidgets.QStyleOptionViewItem(), index))
+        self.assertEqual(index.data(Qt.CheckStateRole), Qt.Checked)
+
+
+class TestSortElogModel(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = elogviewer.ElogModel()
+        self.elogs_ = [elogviewer.Elog.fromFilename(filename)
+                       for filename in self.elogs]
+        self.model.appendElogs(self.elogs_[:3])
+
+    def test_sort(self):
+        index = QtCore.QPersistentModelIndex(
+            self.model.index(0, Column.Package))
+        self.model.sort(Column.Package, Qt.DescendingOrder)
+        self.assertEqual(self.model.table.filenames(), [
+            elog.filename for elog in sorted(
+                self.elogs_[:3], key=lambda elog: elog.package,
+                reverse=True)])
+        self.assertEqual(index.data(), self.elogs_[0].package)
+
+    def test_appended_rows_are_sorted(self):
+        self.model.sort(Column.Date)
+        self.model.appendElogs(self.elogs_[3:])
+        self.assertEqual(self.model.table.filenames(), [
+            elog.filename for elog in sorted(
+                self.elogs_, key=lambda elog: elog.date)])
+
+    def test_changed_rows_are_sorted_again(self):
+        self.model.sort(Column.ReadState)
+        self.model.setData(self.model.index(0, Column.ReadState),
+                           Qt.Checked, Qt.CheckStateRole)
+        self.model.appendElogs(self.elogs_[3:])
+        keys = list(self.model.table.sortKeys(Column.ReadState))
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(keys[-1], Qt.Checked)
+
+    def test_batches_are_merged(self):
+        table = elogviewer.ElogTable(self.elogs_)
+        for column in Column:
+            for order in (Qt.AscendingOrder, Qt.DescendingOrder):
+                with self.subTest(column=column, order=order):
+                    self.model.clear()
+                    self.model.sort(column, order)
+                    for first in range(0, len(self.elogs_), 2):
+                        index = QtCore.QPersistentModelIndex(
+                            self.model.index(0, Column.Package))
+                        package = index.data()
+                        self.model.appendElogs(
+                            self.elogs_[first:first + 2])
+                        self.assertEqual(index.data(), package)
+                    self.assertEqual(self.model.table.filenames(), [
+                        table.filename(row) for row in table.sortedRows(
+                            column, order == Qt.DescendingOrder)])
+
+
+class TestLazyElogModel(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = elogviewer.ElogModel()
+        self.model.pageSize = 2
+        self.model.appendFilenames(self.elogs)
+        # Newest first.
+        self.filenames = sorted(
+            self.elogs, key=lambda filename: elogviewer.Elog.fromName(
+                filename).date, reverse=True)
+
+    def fetch_all(self):
+        while self.model.canFetchMore():
+            self.model.fetchMore()
+
+    def test_pages(self):
+        self.assertEqual(self.model.rowCount(), 0)
+        self.assertTrue(self.model.canFetchMore())
+        self.model.fetchMore()
+        self.assertEqual(self.model.table.filenames(), self.filenames[:2])
+        self.fetch_all()
+        self.assertEqual(self.model.table.filenames(), self.filenames)
+        self.assertEqual(self.model.pendingFilenames(), [])
+
+    def test_oldest_first(self):
+        self.model.setFetchOrder(newestFirst=False)
+        self.fetch_all()
+        self.assertEqual(self.model.table.filenames(), self.filenames[::-1])
+
+    def test_eclasses_are_requested(self):
+        requests = []
+        self.model.eclassesRequested.connect(requests.extend)
+        self.fetch_all()
+        self.assertEqual(
+            self.model.data(self.model.index(0, Column.Eclass)), "")
+        self.assertEqual(self.model.data(self.model.index(
+            0, Column.Eclass), elogviewer.Role.SortRole), -1)
+        self.model.data(self.model.index(0, Column.Eclass))
+        QTest.qWait(10)
+        self.assertEqual(requests, [(0, self.filenames[0])])
+        eclass = elogviewer.Elog.fromFilename(self.filenames[0]).eclass
+        self.model.setEClasses([(0, self.filenames[0], eclass),
+                                (1, self.filenames[0], eclass)])
+        self.assertEqual(self.model.table.eclass(0), eclass)
+        self.assertIsNone(self.model.table.eclass(1))
+
+    def test_remove_pending(self):
+        self.model.removePending({self.filenames[0]})
+        self.fetch_all()
+        self.assertEqual(self.model.table.filenames(), self.filenames[1:])
+
+
 class TestGui(TestBase):
 
     def setUp(self):
@@ -130,7 +1172,9 @@ class TestGui(TestBase):
         self.deleteButton = button("delete")
         self.aboutAction = button("about")
 
+        self.wait_for_scan(self.elogviewer)
         self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
         self.unset_important_flag()
         self.unset_read_flag()
         self.select_first()
@@ -208,12 +1252,43 @@ class TestGuiButtons(TestGui):
         self.assert_elog_files_deleted()
         self.assert_elog_count_consistent()
 
+    def test_delete_on_a_thread(self):
+        self.elogviewer.deleteThreshold = 1
+        self.select_all()
+
+        QTest.mouseClick(self.deleteButton, Qt.LeftButton)
+        for _ in range(500):
+            if not self.elogviewer.isDeleting():
+                break
+            QTest.qWait(10)
+
+        self.assertFalse(self.elogviewer.isDeleting())
+        self.assert_elog_files_deleted()
+        self.assert_elog_count_consistent()
+
+    def test_delete_errors_are_summarized(self):
+        self.select_all()
+
+        with mock.patch("elogviewer.os.remove",
+                        side_effect=PermissionError(13, "Permission denied")):
+            QTest.mouseClick(self.deleteButton, Qt.LeftButton)
+
+        messageBoxes = self.elogviewer.findChildren(QtWidgets.QMessageBox)
+        self.assertEqual(len(messageBoxes), 1)
+        self.assertIn("%i elogs" % TEST_SET_SIZE, messageBoxes[0].text())
+        self.assertEqual(
+            len(messageBoxes[0].detailedText().splitlines()), TEST_SET_SIZE)
+        messageBoxes[0].close()
+        self.assert_elog_files_exist()
+        self.assert_elog_count_consistent()
+
     def test_refresh_button(self):
         self.select_all()
         QTest.mouseClick(self.deleteButton, Qt.LeftButton)
         self.reset_test_set()
 
         QTest.mouseClick(self.refreshButton, Qt.LeftButton)
+        self.wait_for_scan(self.elogviewer)
 
         self.assert_elog_files_exist()
         self.assert_elog_count_consistent()
@@ -241,6 +1316,282 @@ class TestGuiButtons(TestGui):
         self.assert_important_count_equal(TEST_SET_SIZE)
 
 
+class TestScanner(TestGui):
+
+    def test_cancel_scan(self):
+        self.elogviewer.refresh()
+        self.assertTrue(self.elogviewer.isScanning())
+        QTest.mouseClick(self.elogviewer.cancelScanButton, Qt.LeftButton)
+        self.wait_for_scan(self.elogviewer)
+        self.assertLessEqual(self.elogviewer.elogCount(), TEST_SET_SIZE)
+
+    def test_scan_skips_bad_name(self):
+        self.add_bad_name()
+        self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
+        self.assert_elog_count_equal(TEST_SET_SIZE)
+
+    def test_refresh_while_scanning(self):
+        self.elogviewer.refresh()
+        self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
+        self.assert_elog_count_consistent()
+
+
+class TestLazyRows(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        with mock.patch("elogviewer._highestEClass") as highestEClass:
+            self.elogviewer = elogviewer.Elogviewer(argparse.Namespace(
+                elogpath=config.elogpath, lazy=True))
+            self.wait_for_scan(self.elogviewer)
+        self.assertFalse(highestEClass.called)
+        self.model = self.elogviewer.model
+
+    def tearDown(self):
+        assert self.elogviewer.close()
+        del self.elogviewer
+
+    def test_sort_by_date(self):
+        self.elogviewer.tableView.sortByColumn(Column.Date, Qt.AscendingOrder)
+        proxyModel = self.elogviewer.proxyModel
+        dates = [proxyModel.index(row, Column.Date).data(
+            elogviewer.Role.SortRole) for row in range(proxyModel.rowCount())]
+        self.assertEqual(len(dates), TEST_SET_SIZE)
+        self.assertEqual(dates, sorted(dates))
+
+    def test_eclasses_are_read(self):
+        table = self.model.table
+        for row in range(len(table)):
+            self.model.data(self.model.index(row, Column.Eclass))
+        for _ in range(500):
+            if None not in map(table.eclass, range(len(table))):
+                break
+            QTest.qWait(10)
+        self.assertEqual(
+            [table.elog(row) for row in range(len(table))],
+            [elogviewer.Elog.fromFilename(filename)
+             for filename in table.filenames()])
+
+    def test_fetch_skips_bad_name(self):
+        filename = self.add_bad_name()
+        self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
+        while self.model.canFetchMore():
+            self.model.fetchMore()
+        self.assertEqual(len(self.model.table), TEST_SET_SIZE)
+        self.assertNotIn(filename, self.model.table.filenames())
+
+    def test_close_with_pending_eclass_requests(self):
+        for row in range(len(self.model.table)):
+            self.model.data(self.model.index(row, Column.Eclass))
+        assert self.elogviewer.close()
+        # The request timer would have fired by now.
+        QTest.qWait(50)
+        QtCore.QThreadPool.globalInstance().waitForDone()
+        self.assertFalse(self.elogviewer._eclassLoaders)
+
+    def test_refresh_keeps_rows(self):
+        filenames = self.model.table.filenames()
+        self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
+        self.assertEqual(self.model.table.filenames(), filenames)
+
+
+class TestIncrementalRefresh(TestGui):
+
+    def row_items(self):
+        table = self.elogviewer.model.table
+        return dict((table.filename(row), table.elog(row))
+                    for row in range(len(table)))
+
+    def current_filename(self):
+        return _itemFromIndex(
+            self.elogviewer.tableView.currentIndex()).filename()
+
+    def test_refresh_keeps_rows(self):
+        items = self.row_items()
+        self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
+        self.assertEqual(self.row_items(), items)
+
+    def test_refresh_removes_deleted_elog(self):
+        items = self.row_items()
+        current = self.current_filename()
+        deleted = next(filename for filename in items if filename != current)
+        os.remove(deleted)
+        self.elogviewer.refresh()
+        self.wait_for_scan(self.elogviewer)
+        del items[deleted]
+        self.assertEqual(self.row_items(), items)
+        self.assertEqual(self.current_filename(), current)
+
+    def test_refresh_adds_new_elog(self):
+        new = os.path.join(config.elogpath,
+                           "app-misc:elogviewer-2.6:20150301-120000.log")
+        shutil.copy(self.elogs[0], new)
+        try:
+            self.elogviewer.refresh()
+            self.wait_for_scan(self.elogviewer)
+            self.assertIn(new, self.row_items())
+            self.assert_elog_count_equal(TEST_SET_SIZE + 1)
+        finally:
+            os.remove(new)
+
+
+class TestPrefetch(TestGui):
+
+    def filename(self, row):
+        return _itemFromIndex(
+            self.elogviewer.proxyModel.index(row, 0)).filename()
+
+    def test_prefetch_neighbours(self):
+        elogviewer.htmlCache.clear()
+        self.elogviewer.prefetchDepth = 2
+        self.elogviewer.tableView.selectRow(2)
+        self.elogviewer.prefetchPool.waitForDone()
+        for row in (0, 1, 3, 4):
+            self.assertIn(self.filename(row), elogviewer.htmlCache)
+
+    def test_prefetch_disabled(self):
+        elogviewer.htmlCache.clear()
+        self.elogviewer.prefetchDepth = 0
+        self.elogviewer.tableView.selectRow(2)
+        self.elogviewer.prefetchPool.waitForDone()
+        self.assertNotIn(self.filename(3), elogviewer.htmlCache)
+
+
+class TestSearch(TestGui):
+
+    def wait_for_search(self):
+        for _ in range(500):
+            if not self.elogviewer.isSearching():
+                break
+            QTest.qWait(10)
+        self.assertFalse(self.elogviewer.isSearching())
+
+    def search(self, text):
+        self.elogviewer.searchLineEdit.setText(text)
+        self.elogviewer.search(text)
+        self.wait_for_search()
+
+    def test_column_search(self):
+        self.search("markupsafe")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+
+    def test_search_ignores_case(self):
+        self.search("MarkupSafe")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+
+    def test_regexp_search(self):
+        self.search("^dev-python\\smarkup")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+
+    def test_anchored_search(self):
+        self.search("^markupsafe")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+        self.search("^eerror$")
+        self.assertEqual(self.elogviewer.rowCount(), sum(
+            elogviewer.Elog.fromFilename(elog).eclass is
+            elogviewer.EClass.eerror for elog in self.elogs))
+
+    def test_typing_is_debounced(self):
+        with mock.patch.object(self.elogviewer, "search",
+                               wraps=self.elogviewer.search) as search:
+            for key in "markupsafe":
+                QTest.keyClick(self.elogviewer.searchLineEdit, key)
+            self.assertEqual(self.elogviewer.rowCount(), TEST_SET_SIZE)
+            self.wait_for_search()
+        search.assert_called_once_with("markupsafe")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+
+    def test_invalid_regexp_keeps_the_rows(self):
+        self.search("markupsafe")
+        self.search("markup(")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+        self.assertTrue(self.elogviewer.statusBar().currentMessage())
+
+    @mock.patch.object(elogviewer, "regex", None)
+    def test_nested_repetition_is_refused(self):
+        self.search("markupsafe")
+        self.search("(m+)+arkupsafe")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+        self.assertIn("regex", self.elogviewer.statusBar().currentMessage())
+
+    def test_query(self):
+        self.search("eclass>=warn -category:dev-*")
+        self.assertEqual(self.elogviewer.rowCount(), 2)
+        self.search("eclass:nothing")
+        self.assertEqual(self.elogviewer.rowCount(), 2)
+        self.assertIn("Invalid query",
+                      self.elogviewer.statusBar().currentMessage())
+
+    def test_time_limit_keeps_the_rows(self):
+        self.search("markupsafe")
+        with mock.patch.object(elogviewer.ElogFilter, "timeLimit", -1):
+            self.search("dev-python")
+        self.assertEqual(self.elogviewer.rowCount(), 1)
+        self.assertIn("seconds", self.elogviewer.statusBar().currentMessage())
+
+    def test_content_search(self):
+        self.elogviewer.contentSearchAction.setChecked(True)
+        self.search("python_targets")
+        expected = [elog for elog in self.elogs
+                    if "python_targets" in _html(elog).lower()]
+        self.assertTrue(expected)
+        self.assertEqual(self.elogviewer.rowCount(), len(expected))
+        self.search("")
+        self.assertEqual(self.elogviewer.rowCount(), TEST_SET_SIZE)
+
+
+class TestWatch(TestGui):
+
+    def setUp(self):
+        super().setUp()
+        self.elogviewer.setWatching(True)
+
+    def tearDown(self):
+        self.elogviewer.setWatching(False)
+        super().tearDown()
+
+    def test_watch_elog_directory(self):
+        self.assertIn(config.elogpath, self.elogviewer.watcher.directories())
+
+    def test_new_elog_is_shown(self):
+        new = os.path.join(config.elogpath,
+                           "app-misc:elogviewer-2.6:20150301-120000.log")
+        shutil.copy(self.elogs[0], new)
+        try:
+            for _ in range(500):
+                if self.elogviewer.elogCount() > TEST_SET_SIZE:
+                    break
+                QTest.qWait(10)
+            self.assert_elog_count_equal(TEST_SET_SIZE + 1)
+        finally:
+            os.remove(new)
+
+    def test_events_are_coalesced(self):
+        with mock.patch.object(self.elogviewer, "refresh") as refresh:
+            for _ in range(10):
+                self.elogviewer._onDirectoryChanged(config.elogpath)
+            QTest.qWait(int(1000 * self.elogviewer.watchDelay) + 200)
+        refresh.assert_called_once_with()
+
+
+class TestStatePersistence(TestGui):
+
+    def test_states_survive_restart(self):
+        self.select_all()
+        QTest.mouseClick(self.markReadButton, Qt.LeftButton)
+        QTest.mouseClick(self.toggleImportantButton, Qt.LeftButton)
+        assert self.elogviewer.close()
+        self.elogviewer = elogviewer.Elogviewer(config)
+        self.wait_for_scan(self.elogviewer)
+        self.assert_read_count_equal(TEST_SET_SIZE)
+        self.assert_important_count_equal(TEST_SET_SIZE)
+
+
 class TestReadCounter(TestGui):
 
     def test_decrease_count_on_leaving_row(self):
@@ -250,6 +1601,64 @@ class TestReadCounter(TestGui):
 
         self.assert_read_count_equal(TEST_SET_SIZE - 2)
 
+    def test_counters_update_labels(self):
+        self.select_all()
+        QTest.mouseClick(self.markReadButton, Qt.LeftButton)
+        self.assertEqual(self.elogviewer.unreadLabel.text(), "0 unread")
+        QTest.mouseClick(self.markUnreadButton, Qt.LeftButton)
+        self.assertEqual(self.elogviewer.unreadLabel.text(),
+                         "%i unread" % TEST_SET_SIZE)
+
+
+class TestProfiling(TestGui):
+
+    def setUp(self):
+        self.profiler = elogviewer.profiler
+        patcher = mock.patch.object(self.profiler, "enabled", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.profiler.clear)
+        self.profiler.clear()
+        super().setUp()
+
+    def test_hot_paths_are_timed(self):
+        self.elogviewer.tableView.sortByColumn(Column.Package,
+                                               Qt.AscendingOrder)
+        self.elogviewer.search("markupsafe")
+        for _ in range(500):
+            if not self.elogviewer.isSearching():
+                break
+            QTest.qWait(10)
+        self.elogviewer.saveSettings()
+        stats = self.profiler.stats()
+        for name in ("scan", "sort", "filter", "saveSettings"):
+            self.assertIn(name, stats)
+
+    def test_profile_panel(self):
+        QTest.qWait(1100)
+        self.assertIn("scan", self.elogviewer.profileText.toPlainText())
+
+
+class TestStartupProfile(TestBase):
+
+    def test_first_paint_is_reported(self):
+        profile = elogviewer.StartupProfile()
+        viewer = elogviewer.Elogviewer(argparse.Namespace(
+            elogpath=config.elogpath, startup_profile=True))
+        try:
+            with mock.patch.object(elogviewer, "startupProfile", profile), \
+                    mock.patch.object(profile, "report") as report:
+                viewer.show()
+                for _ in range(500):
+                    if report.called:
+                        break
+                    QTest.qWait(10)
+            report.assert_called_once_with()
+            times = profile.times()
+            self.assertLessEqual(times["first rows"], times["first paint"])
+        finally:
+            assert viewer.close()
+
 
 if __name__ == "__main__":
     unittest.main()